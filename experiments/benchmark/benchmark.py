@@ -0,0 +1,850 @@
+import numpy as np
+import xarray as xr
+import os
+import sys
+import json
+import fnmatch
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import timeit
+import warnings
+from scipy.stats import ks_2samp
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from src.agents import BayesianGaussianMixtureModelWithContext, precision_drift, compute_prior_factors, SCREENING_BLOCK_SIZE, TRANSMISSIONS, \
+    component_separation, STATISTICS_MIN_SEPARATION, STATISTICS_MAX_SHIFT
+from src.agents.jit import NUMBA_AVAILABLE
+from src.agents.backends import get_backend, available_backends
+from src.agents.sampling import SAMPLERS, DESIGNS
+from src.utils.excluded import ExcludedSink
+from src.utils.fingerprint import FINGERPRINT_FILE, register_run, find_runs, index_runs
+from src.utils.history import HISTORY_FORMATS, HISTORY_VARIABLES, HistoryRecorder, save_history, open_history
+
+REPO_DIR = Path(__file__).resolve().parent.parent.parent
+RESULT_DIR = os.path.dirname(__file__) + "/../../data/benchmark/"
+
+# (N, K, D) grid used by the kernel level benchmarks
+SIZES = [(500, 4, 2), (5000, 4, 2), (5000, 8, 2), (2000, 4, 8)]
+QUICK_SIZES = [(500, 4, 2)]
+
+FILTER_ARGS = {
+    "none": {},
+    "high_entropy": {"threshold": 0.5},
+    "low_max_prob": {"threshold": 0.9},
+    "missunderstand": {},
+}
+# filters combining several criteria, see src.agents.filters.parse_filter
+COMPOSITE_FILTER_ARGS = {
+    "missunderstand&low_max_prob": {"threshold": 0.9},
+    "missunderstand|high_entropy": {"threshold": 0.5},
+}
+
+BENCHMARKS = {}
+
+# the modules whose startup import_time measures, by entry point: (directory added to sys.path, module)
+ENTRY_POINTS = {
+    "package": (REPO_DIR, "src.agents"),
+    "run": (REPO_DIR / "experiments", "test_ilm"),
+    "search": (REPO_DIR / "experiments", "serch_result"),
+}
+# dependencies the entry points load on first use only, see src.utils.lazy
+HEAVY_MODULES = ("xarray", "pandas", "scipy.special", "scipy.stats", "numba", "matplotlib")
+
+
+def benchmark(group):
+    """Register a function yielding ``(name, params, stmt)`` cases under ``group``."""
+    def decorator(func):
+        BENCHMARKS[group] = func
+        return func
+    return decorator
+
+
+def make_agent(K, D, seed=0, **kwargs):
+    '''
+    Create a context agent with the default prior of test_ilm.ExperimentConfig, generalised to any K and D.
+    '''
+    m0 = np.zeros((K, D))
+    m0[:, 0] = 5 * np.cos(2 * np.pi * np.arange(K) / K)
+    m0[:, 1] = 5 * np.sin(2 * np.pi * np.arange(K) / K)
+    return BayesianGaussianMixtureModelWithContext(
+        K, D,
+        alpha0=100.0, beta0=np.full(K, 0.1), nu0=D + 2.0,
+        m0=m0, W0=np.eye(D) * 0.02,
+        c_alpha=np.full(K, 1 / K),
+        **kwargs
+    )
+
+
+def make_data(N, K, D, seed=0):
+    '''
+    Draw a well separated synthetic data set in the format consumed by the context agent.
+    '''
+    rng = np.random.RandomState(seed)
+    means = rng.uniform(-10, 10, size=(K, D))
+    C = rng.dirichlet(np.ones(K), size=N)
+    z = np.array([rng.multinomial(1, c) for c in C])
+    X = means[z.argmax(axis=1)] + rng.standard_normal((N, D))
+    return xr.Dataset(
+        {
+            "X": (["n", "d"], X),
+            "C": (["n", "k"], C),
+            "Z": (["n", "k"], z),
+        },
+        coords={"n": np.arange(N), "d": np.arange(D), "k": np.arange(K)}
+    )
+
+
+def make_fitted_agent(N, K, D, seed=0, **kwargs):
+    np.random.seed(seed)
+    agent = make_agent(K, D, **kwargs)
+    agent.fit(make_data(N, K, D, seed), max_iter=1000, tol=1e-4)
+    return agent
+
+
+@benchmark("e_like_step")
+def bench_e_like_step(sizes):
+    for N, K, D in sizes:
+        agent = make_fitted_agent(N, K, D)
+        X = agent.X
+        C = agent.C
+        yield f"e_like_step[N={N},K={K},D={D}]", {"N": N, "K": K, "D": D}, lambda agent=agent, X=X, C=C: agent._e_like_step(X, C)
+
+
+@benchmark("m_like_step")
+def bench_m_like_step(sizes):
+    for N, K, D in sizes:
+        agent = make_fitted_agent(N, K, D)
+        X = agent.X
+        r = agent._e_like_step(X, agent.C)
+        yield f"m_like_step[N={N},K={K},D={D}]", {"N": N, "K": K, "D": D}, lambda agent=agent, X=X, r=r: agent._m_like_step(X, r)
+
+
+@benchmark("fit")
+def bench_fit(sizes):
+    for N, K, D in sizes:
+        data = make_data(N, K, D)
+
+        def stmt(data=data, K=K, D=D):
+            agent = make_agent(K, D)
+            agent.fit(data, max_iter=1000, tol=1e-4)
+        yield f"fit[N={N},K={K},D={D}]", {"N": N, "K": K, "D": D}, stmt
+
+
+@benchmark("predict_proba")
+def bench_predict_proba(sizes):
+    for N, K, D in sizes:
+        agent = make_fitted_agent(N, K, D)
+        data = make_data(N, K, D, seed=1)
+        yield f"predict_proba[N={N},K={K},D={D}]", {"N": N, "K": K, "D": D}, lambda agent=agent, data=data: agent.predict_proba(data)
+
+
+@benchmark("generate")
+def bench_generate(sizes):
+    N, K, D = sizes[0]
+    for filter_name, filter_args in {**FILTER_ARGS, **COMPOSITE_FILTER_ARGS}.items():
+        agent = make_fitted_agent(N, K, D, generate_filter=filter_name, generate_filter_args=filter_args)
+        yield (
+            f"generate[filter={filter_name},N={N},K={K},D={D}]",
+            {"N": N, "K": K, "D": D, "filter": filter_name},
+            lambda agent=agent, N=N: agent.generate(N, return_excluded_data=True),
+        )
+    # small repeated draws from unchanged parameters, as in the filtered loop of fit_from_agent
+    for sampler in SAMPLERS:
+        agent = make_fitted_agent(N, K, D, sampler=sampler)
+        yield (
+            f"generate[sampler={sampler},N=50,K={K},D={D}]",
+            {"N": 50, "K": K, "D": D, "sampler": sampler},
+            lambda agent=agent: agent.generate(50),
+        )
+
+
+@benchmark("fit_from_agent")
+def bench_fit_from_agent(sizes):
+    # the per-sample loop refits on every accepted sample, so keep N small
+    N, K, D = 100, sizes[0][1], sizes[0][2]
+    parent = make_fitted_agent(500, K, D)
+    cases = {
+        "track_learning": {"track_learning": True},
+        "missunderstand": {"fit_filter": "missunderstand", "fit_filter_args": {}},
+    }
+    if NUMBA_AVAILABLE:
+        cases.update({f"{case_name},jit": dict(kwargs, jit=True) for case_name, kwargs in cases.items()})
+    # the fit filter called on every candidate instead of on blocks of candidates
+    cases["missunderstand,screening_block=1"] = {"fit_filter": "missunderstand", "fit_filter_args": {}, "screening_block": 1}
+    for case_name, kwargs in cases.items():
+        def stmt(kwargs=kwargs):
+            kwargs = dict(kwargs)
+            screening_block = kwargs.pop("screening_block", SCREENING_BLOCK_SIZE)
+            child = make_agent(K, D, **kwargs)
+            child.fit_from_agent(parent, N=N, screening_block=screening_block)
+        yield f"fit_from_agent[{case_name},N={N},K={K},D={D}]", {"N": N, "K": K, "D": D, "mode": case_name}, stmt
+
+
+@benchmark("transmission")
+def bench_transmission(sizes):
+    # one unfiltered generation: N samples drawn and fitted, or only their sufficient statistics
+    K, D = sizes[0][1], sizes[0][2]
+    parent = make_fitted_agent(500, K, D)
+    for N in [500, 5000]:
+        for transmission in TRANSMISSIONS:
+            def stmt(N=N, transmission=transmission):
+                child = make_agent(K, D)
+                child.fit_from_agent(parent, N=N, transmission=transmission)
+            yield f"transmission[{transmission},N={N},K={K},D={D}]", {"N": N, "K": K, "D": D, "mode": transmission}, stmt
+
+
+@benchmark("excluded")
+def bench_excluded(sizes):
+    # storing N rejected samples one row at a time, as in a rejection-heavy generation
+    N, K, D = sizes[0]
+    data = make_data(N, K, D)
+
+    def concat_rows():
+        rows = [data.sel(n=n) for n in range(N)]
+        return xr.concat(rows, dim="n")
+
+    def sink_rows(max_rows=None):
+        sink = ExcludedSink(1, K, D, max_rows=max_rows, rng=0)
+        X, C, Z = data.X.values, data.C.values, data.Z.values
+        for n in range(N):
+            sink.append(0, X[n:n + 1], C[n:n + 1], Z[n:n + 1])
+        return sink.to_xarray()
+
+    yield f"excluded[xr.concat,N={N},K={K},D={D}]", {"N": N, "K": K, "D": D, "mode": "xr.concat"}, concat_rows
+    yield f"excluded[sink,N={N},K={K},D={D}]", {"N": N, "K": K, "D": D, "mode": "sink"}, sink_rows
+    yield (
+        f"excluded[sink,max_rows={N // 10},N={N},K={K},D={D}]",
+        {"N": N, "K": K, "D": D, "mode": "reservoir"},
+        lambda: sink_rows(max_rows=N // 10),
+    )
+
+
+@benchmark("chain")
+def bench_chain(sizes):
+    sys.path.append(str(REPO_DIR / "experiments"))
+    from test_ilm import ExperimentConfig, ExperimentManager
+
+    n_generations = 50
+    for generate_filter_name in ["none", "missunderstand"]:
+        config = ExperimentConfig.create_default_config()
+        config.N = 200
+        config.iter = n_generations
+        config.generate_filter_name = generate_filter_name
+
+        def stmt(config=config):
+            with tempfile.TemporaryDirectory() as save_dir:
+                experiment = ExperimentManager(config, save_dir)
+                experiment.run_experiment()
+        yield (
+            f"chain[generate_filter={generate_filter_name},iter={n_generations},N={config.N}]",
+            {"N": config.N, "K": config.K, "D": config.D, "iter": n_generations, "filter": generate_filter_name},
+            stmt,
+        )
+
+
+def check_jit(args):
+    '''
+    Check that the per-sample loop of fit_from_agent gives the same result with jit=True as with the NumPy path,
+    for every fit filter: the same learned samples and excluded data, parameters equal up to args.rtol.
+    '''
+    if not NUMBA_AVAILABLE:
+        print("numba is not installed, the NumPy path is always used")
+        return
+    K, D = 4, 2
+    parent = make_fitted_agent(500, K, D, generate_filter="missunderstand")
+    n_failures = 0
+    for filter_name, filter_args in FILTER_ARGS.items():
+        children = []
+        for jit in [False, True]:
+            # the same candidates for both children
+            parent.rng = np.random.default_rng(args.seed)
+            child = make_agent(K, D, fit_filter=filter_name, fit_filter_args=filter_args, track_learning=True, jit=jit)
+            child.fit_from_agent(parent, N=args.N)
+            children.append(child)
+        numpy_child, jit_child = children
+        drift = precision_drift(numpy_child, jit_child)
+        max_rel = max(value["max_rel"] for value in drift.values())
+        same_samples = np.array_equal(numpy_child.X, jit_child.X) and numpy_child.excluded_data.identical(jit_child.excluded_data)
+        ok = same_samples and max_rel <= args.rtol
+        n_failures += not ok
+        print(f"{filter_name:<16} samples {'same' if same_samples else 'DIFFERENT'}  max relative difference {max_rel:.2e}  {'ok' if ok else 'FAILED'}")
+    if n_failures > 0:
+        sys.exit(1)
+
+
+def check_fingerprint_index(args):
+    '''
+    Check the index of find_runs on a data directory with runs saved before fingerprints existed next to newly saved ones:
+    a run with only a config.json, then a new run saved with register_run (which creates the index), then another old run
+    copied in. The first find_runs must index both old runs and mark the index complete. A run copied in after that
+    must not be scanned by find_runs, only found after index_runs.
+    '''
+    config = {"K": 4, "D": 2, "N": 500, "c_alpha": [0.25, 0.25, 0.25, 0.25]}
+    with tempfile.TemporaryDirectory() as data_dir:
+        def save_old_run(folder_name):
+            os.makedirs(os.path.join(data_dir, folder_name))
+            with open(os.path.join(data_dir, folder_name, "config.json"), "w") as f:
+                json.dump(config, f)
+
+        save_old_run("old_before_index")
+        os.makedirs(os.path.join(data_dir, "new"))
+        register_run(data_dir, "new", config)
+        save_old_run("old_after_index")
+        found_first = find_runs(data_dir, config)
+        indexed = all(os.path.exists(os.path.join(data_dir, name, FINGERPRINT_FILE)) for name in found_first)
+        save_old_run("old_copied")
+        found_before_reindex = find_runs(data_dir, config)
+        scanned = os.path.exists(os.path.join(data_dir, "old_copied", FINGERPRINT_FILE))
+        index_runs(data_dir)
+        found_after_reindex = find_runs(data_dir, config)
+    cases = [
+        ("first find_runs", found_first, ["new", "old_after_index", "old_before_index"], indexed),
+        ("find_runs after copy", found_before_reindex, ["new", "old_after_index", "old_before_index"], not scanned),
+        ("find_runs after index_runs", found_after_reindex, ["new", "old_after_index", "old_before_index", "old_copied"], True),
+    ]
+    n_failures = 0
+    for name, found, expected, condition in cases:
+        ok = found == expected and condition
+        n_failures += not ok
+        print(f"{name:<28} {found}, expected {expected}  {'ok' if ok else 'FAILED'}")
+    if n_failures > 0:
+        sys.exit(1)
+
+
+def check_history(args):
+    '''
+    Check that open_history reads back what save_history wrote, in every history format, for the selections the
+    plotting scripts make. The lazy decoding of the "delta" format goes through xarray's backend indexing
+    (see src.utils.history.XorDeltaArray), so this fails loudly if a release of xarray changes it.
+    '''
+    rng = np.random.default_rng(args.seed)
+    n_iter, N, K, D = 3, 100, 4, 2
+    recorder = HistoryRecorder(n_iter, N, K, D, every=3)
+    for name in HISTORY_VARIABLES:
+        recorder[name][...] = rng.normal(size=recorder[name].shape)
+    selections = {
+        "[\"m\"][i]": lambda ds: ds["m"][1],
+        "isel(iter=i, n=slice)": lambda ds: ds.isel(iter=2, n=slice(5, 20))["W"],
+        "isel(n=-1)": lambda ds: ds.isel(n=-1)["alpha"],
+        "isel(n=list)": lambda ds: ds.isel(n=[0, 9, 17, 33])["nu"],
+        "sel(n=index)": lambda ds: ds.sel(n=sample_index[12])["beta"],
+        "whole variable": lambda ds: ds["m"],
+    }
+    n_failures = 0
+    with tempfile.TemporaryDirectory() as directory, warnings.catch_warnings():
+        # W has the dims (..., d, d) of history.nc
+        warnings.filterwarnings("ignore", message="Duplicate dimension names")
+        expected = recorder.to_xarray()
+        sample_index = expected["n"].values
+        for history_format in HISTORY_FORMATS:
+            path = os.path.join(directory, f"history_{history_format}.nc")
+            save_history(expected, path, history_format=history_format, keyframe_interval=8)
+            dataset = open_history(path)
+            for name, select in selections.items():
+                try:
+                    ok = np.array_equal(select(dataset).values, select(expected).values)
+                except Exception as error:
+                    ok = False
+                    name = f"{name} ({type(error).__name__}: {error})"
+                n_failures += not ok
+                print(f"{history_format:<11} {name:<24} {'ok' if ok else 'FAILED'}")
+            dataset.close()
+    if n_failures > 0:
+        print(f"open_history does not work with xarray {xr.__version__}, see src.utils.history.XorDeltaArray")
+        sys.exit(1)
+
+
+def make_separated_parent(K, D, radius):
+    '''
+    A context agent whose components have the identity covariance and means on a circle of the given radius.
+    '''
+    parent = make_agent(K, D)
+    parent.alpha, parent.beta, parent.nu = np.full(K, 200.0), np.full(K, 200.0), np.full(K, 200.0)
+    parent.m = np.zeros((K, D))
+    parent.m[:, 0] = radius * np.cos(2 * np.pi * np.arange(K) / K)
+    parent.m[:, 1] = radius * np.sin(2 * np.pi * np.arange(K) / K)
+    parent.W = np.tile(np.eye(D) / 200.0, (K, 1, 1))
+    return parent
+
+
+def ks_report(name, a, b, alpha):
+    '''
+    Two-sample KS test of every column of a against the same column of b, Bonferroni corrected; prints one line and returns whether it passed.
+    '''
+    p_values = np.array([ks_2samp(a[:, j], b[:, j]).pvalue for j in range(a.shape[1])])
+    ok = p_values.min() * len(p_values) > alpha
+    shift = np.max(np.abs(a.mean(axis=0) - b.mean(axis=0)) / np.maximum(a.std(axis=0), np.finfo(np.float64).tiny))
+    print(f"{name:<28} min p {p_values.min():.2e} ({len(p_values)} tests)  max mean shift {shift:.2f} sd  {'ok' if ok else 'DIFFERENT'}")
+    return ok
+
+
+def shift_report(name, a, b, max_shift):
+    '''
+    Largest shift of the mean of a column of b from the one of a, in standard deviations of a; prints one line and
+    returns whether it is at most max_shift.
+    '''
+    shift = np.max(np.abs(a.mean(axis=0) - b.mean(axis=0)) / np.maximum(a.std(axis=0), np.finfo(np.float64).tiny))
+    ok = shift <= max_shift
+    print(f"{name:<28} max mean shift {shift:.2f} sd (bound {max_shift:g})  {'ok' if ok else 'BIASED'}")
+    return ok
+
+
+def check_transmission(args):
+    '''
+    Check the "statistics" transmission of fit_from_agent against drawing the samples, over args.repeat repetitions,
+    for every setting "K,D,radius,N" of args.settings (the parent's component means on a circle of the given radius,
+    in standard deviations of the components).
+
+    First the means and scatter matrices of PredictiveSampler.draw_statistics against the ones of N drawn samples,
+    which must agree for any parent (two-sample KS test of every element at the level args.alpha, Bonferroni corrected).
+
+    The parameters learned from the statistics are an approximation (see _fit_statistics), biased for overlapping
+    components. For a parent whose component_separation is at least STATISTICS_MIN_SEPARATION, the mean of every
+    parameter of the child (alpha, m and the covariances) must be within STATISTICS_MAX_SHIFT standard deviations of
+    the one learned from the samples. Below it, fit_from_agent must refuse the statistics and learn from samples;
+    the bias of the statistics there is printed for reference.
+    '''
+    ok = True
+    for setting in args.settings:
+        K, D, radius, N = (type_(value) for type_, value in zip((int, int, float, int), setting.split(",")))
+        parent = make_separated_parent(K, D, radius)
+        separation = component_separation(parent)
+        separated = separation >= STATISTICS_MIN_SEPARATION
+        print(f"K={K} D={D} radius={radius:g} N={N}  separation {separation:.2f} sd  "
+              f"{'statistics used' if separated else 'statistics refused'}")
+        parent.sampler.update(parent)
+        statistics = {"samples": [], "statistics": []}
+        for repetition in range(args.repeat):
+            rng = np.random.default_rng([args.seed, 0, repetition])
+            X = parent.sampler.draw(parent, 0, N, rng)
+            mean = X.mean(axis=0)
+            statistics["samples"].append(np.concatenate([mean, ((X - mean).T @ (X - mean)).ravel()]))
+            mean, scatter = parent.sampler.draw_statistics(parent, 0, N, rng)
+            statistics["statistics"].append(np.concatenate([mean, scatter.ravel()]))
+        ok &= ks_report("mean and scatter", np.array(statistics["samples"]), np.array(statistics["statistics"]), args.alpha)
+
+        params = {transmission: {"alpha": [], "m": [], "covariance": []} for transmission in TRANSMISSIONS}
+        refused = True
+        for repetition in range(args.repeat):
+            for seed_offset, transmission in enumerate(TRANSMISSIONS):
+                parent.rng = np.random.default_rng([args.seed, 1 + seed_offset, repetition])
+                child = make_agent(K, D)
+                if transmission == "statistics" and not separated:
+                    with warnings.catch_warnings(record=True):
+                        warnings.simplefilter("always")
+                        child.fit_from_agent(parent, N=N, max_iter=1000, transmission=transmission)
+                    refused &= child.X is not None
+                    # the statistics fit fit_from_agent refused, to print its bias
+                    child = make_agent(K, D)
+                    child._fit_statistics(parent, N)
+                else:
+                    child.fit_from_agent(parent, N=N, max_iter=1000, transmission=transmission)
+                params[transmission]["alpha"].append(child.alpha)
+                params[transmission]["m"].append(child.m.ravel())
+                params[transmission]["covariance"].append(np.linalg.inv(child.nu.reshape(-1, 1, 1) * child.W).ravel())
+        for name in ["alpha", "m", "covariance"]:
+            samples, statistics = (np.array(params[transmission][name]) for transmission in TRANSMISSIONS)
+            if separated:
+                ok &= shift_report(f"child {name}", samples, statistics, STATISTICS_MAX_SHIFT)
+            else:
+                shift_report(f"child {name} (not used)", samples, statistics, STATISTICS_MAX_SHIFT)
+        if not separated:
+            print(f"{'fit_from_agent':<28} {'learned from samples' if refused else 'USED THE STATISTICS'}  {'ok' if refused else 'FAILED'}")
+            ok &= refused
+    if not ok:
+        sys.exit(1)
+
+
+def import_time(args):
+    '''
+    Startup time of the entry points: the import of each module of ENTRY_POINTS in a fresh interpreter (median of
+    args.repeat runs, interpreter startup excluded), and the HEAVY_MODULES it loaded.
+
+    Fails if an entry point loads one of HEAVY_MODULES at import or takes longer than args.max_time seconds.
+    '''
+    code = (
+        "import sys, time; sys.path[:0] = [{directory!r}, {repo!r}]; start = time.perf_counter(); import {module}; "
+        "elapsed = time.perf_counter() - start; print(elapsed); print(' '.join(sys.modules))"
+    )
+    n_failures = 0
+    for name, (directory, module) in ENTRY_POINTS.items():
+        times = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", code.format(directory=str(directory), repo=str(REPO_DIR), module=module)],
+                capture_output=True, text=True, check=True, cwd=directory,
+            ).stdout.splitlines()
+            times.append(float(output[0]))
+        loaded = set(output[1].split())
+        heavy = [heavy_module for heavy_module in HEAVY_MODULES if heavy_module in loaded]
+        elapsed = statistics.median(times)
+        ok = not heavy and elapsed <= args.max_time
+        n_failures += not ok
+        print(f"{name:<8} import {module:<14} {format_time(elapsed):>8}  heavy modules: {', '.join(heavy) if heavy else 'none'}  "
+              f"{'ok' if ok else 'FAILED'}")
+    if n_failures > 0:
+        sys.exit(1)
+
+
+def sample_variance(args):
+    '''
+    Variance of the parameters a child estimates from N samples of the same parent, for every sample design of generate,
+    and the number of samples each design needs to reach the variance of plain Monte Carlo with args.N_target samples.
+
+    The variance is the total variance of the child's means m over args.repeat repetitions with different seeds.
+    The samples needed are interpolated log-log between the two sample counts of the grid around the first crossing.
+    '''
+    if args.N_target not in args.N:
+        raise ValueError("--N_target must be one of --N")
+    K, D = 4, 2
+    variance = {}
+    for design in DESIGNS:
+        parent = make_fitted_agent(500, K, D, sample_design=design)
+        variance[design] = []
+        for N in args.N:
+            m = []
+            for repetition in range(args.repeat):
+                parent.rng = np.random.default_rng([args.seed, N, repetition])
+                child = make_agent(K, D)
+                child.fit(parent.generate(N), max_iter=1000, tol=1e-4)
+                m.append(child.m)
+            variance[design].append(np.var(m, axis=0).sum())
+
+    target = variance["mc"][args.N.index(args.N_target)]
+    print(f"total variance of m over {args.repeat} repetitions, target: mc with N={args.N_target} ({target:.3e})")
+    print(f"{'design':<12}" + "".join(f"{f'N={N}':>12}" for N in args.N) + f"{'N to target':>14}{'ratio':>8}")
+    for design in DESIGNS:
+        N_needed = samples_to_target(args.N, variance[design], target)
+        summary = f"{N_needed:>14.0f}{N_needed / args.N_target:>8.2f}" if N_needed is not None else f"{'not reached':>14}"
+        print(f"{design:<12}" + "".join(f"{value:>12.3e}" for value in variance[design]) + summary)
+
+
+def check_sample_designs(args):
+    '''
+    Check that generate draws args.N samples with every sample design and every kind of rng an agent can be created with:
+    none (the global numpy random state, reseeded with np.random.seed), a RandomState and a Generator.
+
+    The designs other than "mc" seed a Generator for the scipy.stats.qmc engines from a RandomState (see
+    src.agents.sampling.uniforms), so the samples of an agent without rng must repeat after np.random.seed.
+    '''
+    K, D = 4, 2
+    rngs = {
+        "none": lambda: None,
+        "RandomState": lambda: np.random.RandomState(args.seed),
+        "Generator": lambda: np.random.default_rng(args.seed),
+    }
+    n_failures = 0
+    for design in DESIGNS:
+        for rng_name, make_rng in rngs.items():
+            X = []
+            try:
+                for _ in range(2):
+                    agent = make_fitted_agent(500, K, D, seed=args.seed, sample_design=design, rng=make_rng())
+                    X.append(agent.generate(args.N).X.values)
+                ok = X[0].shape == (args.N, D) and np.all(np.isfinite(X[0])) and np.array_equal(X[0], X[1])
+                message = "reproducible" if ok else "WRONG SAMPLES"
+            except Exception as error:
+                ok = False
+                message = f"{type(error).__name__}: {error}"
+            n_failures += not ok
+            print(f"{design:<12} rng {rng_name:<12} {message}  {'ok' if ok else 'FAILED'}")
+    if n_failures > 0:
+        sys.exit(1)
+
+
+def samples_to_target(N, variance, target):
+    '''
+    The sample count at which variance first falls to target, interpolated log-log on the grid N, None if it never does.
+    '''
+    if variance[0] <= target:
+        return N[0]
+    log_N, log_variance = np.log(N), np.log(variance)
+    for i in range(len(N) - 1):
+        if log_variance[i + 1] <= np.log(target):
+            weight = (log_variance[i] - np.log(target)) / (log_variance[i] - log_variance[i + 1])
+            return np.exp(log_N[i] + weight * (log_N[i + 1] - log_N[i]))
+    return None
+
+
+@benchmark("backend")
+def bench_backend(sizes):
+    for backend in available_backends():
+        for N, K, D in sizes:
+            agent = make_fitted_agent(N, K, D, backend=backend)
+            X, C = agent.X, agent.C
+            r = agent._e_like_step(X, C)
+            cases = {
+                "e_like_step": lambda agent=agent, X=X, C=C: agent._e_like_step(X, C),
+                "m_like_step": lambda agent=agent, X=X, r=r: agent._m_like_step(X, r),
+                "lower_bound": lambda agent=agent, r=r: agent._calc_lower_bound(r),
+            }
+            for kernel, stmt in cases.items():
+                # compile before timing (numba, jax)
+                stmt()
+                yield (
+                    f"backend[{backend},{kernel},N={N},K={K},D={D}]",
+                    {"N": N, "K": K, "D": D, "backend": backend, "kernel": kernel},
+                    stmt,
+                )
+
+
+def random_kernel_inputs(rng, N, K, D):
+    '''
+    Random inputs of the backend kernels: data, responsibilities, a valid set of parameters and a prior.
+    '''
+    def random_precision(size):
+        A = rng.standard_normal((size, D, D))
+        return A @ A.transpose(0, 2, 1) / D + 0.1 * np.eye(D)
+
+    alpha0, beta0, nu0 = rng.uniform(0.5, 100, K), rng.uniform(0.01, 10, K), D + rng.uniform(0.5, 10, K)
+    W0 = random_precision(1)[0]
+    return {
+        "X": rng.normal(scale=5, size=(N, D)),
+        "C": rng.dirichlet(np.ones(K), size=N),
+        "r": rng.dirichlet(np.ones(K), size=N),
+        "alpha": rng.uniform(0.5, 500, K),
+        "beta": rng.uniform(0.01, 500, K),
+        "nu": D + rng.uniform(0.5, 500, K),
+        "m": rng.normal(scale=5, size=(K, D)),
+        "W": random_precision(K),
+        "alpha0": alpha0, "beta0": beta0, "nu0": nu0,
+        "m0": rng.normal(scale=5, size=(K, D)),
+        "prior_factors": compute_prior_factors(alpha0, beta0, nu0, W0),
+    }
+
+
+def backend_kernel_outputs(backend, inputs):
+    '''
+    The outputs of every kernel of a backend on the inputs of random_kernel_inputs.
+    '''
+    D = inputs["X"].shape[1]
+    dof = inputs["nu"][0] + 1 - D
+    L = dof * inputs["beta"][0] / (1 + inputs["beta"][0]) * inputs["W"][0]
+    L_all = ((inputs["nu"] + 1 - D) * inputs["beta"] / (1 + inputs["beta"]))[:, None, None] * inputs["W"]
+    return {
+        "logB": backend.logB(inputs["W"], inputs["nu"]),
+        "multi_student_t": backend.multi_student_t(inputs["X"], inputs["m"][0], L, dof),
+        "log_multi_student_t": backend.log_multi_student_t(inputs["X"], inputs["m"], L_all, inputs["nu"] + 1 - D),
+        "e_like_step": backend.e_like_step(inputs["X"], inputs["C"], inputs["beta"], inputs["nu"], inputs["m"], inputs["W"]),
+        "m_like_step": backend.m_like_step(inputs["X"], inputs["r"], inputs["alpha0"], inputs["beta0"], inputs["nu0"],
+                                           inputs["m0"], inputs["prior_factors"]["W0_inv"]),
+        "lower_bound": backend.lower_bound(inputs["r"], inputs["alpha"], inputs["beta"], inputs["nu"], inputs["W"],
+                                           inputs["prior_factors"]),
+    }
+
+
+def conformance(args):
+    '''
+    Check every installed backend against the NumPy reference on random parameter sets.
+
+    The error of a kernel is the largest absolute difference of its outputs relative to the largest absolute reference value.
+    '''
+    reference = get_backend("numpy")
+    backends = [name for name in available_backends() if name != "numpy"]
+    print(f"backends: {', '.join(backends) if backends else 'none besides numpy'}")
+    rng = np.random.default_rng(args.seed)
+    max_error = {}
+    for case in range(args.n_cases):
+        N, K, D = int(rng.integers(1, 300)), int(rng.integers(1, 9)), int(rng.integers(1, 6))
+        inputs = random_kernel_inputs(rng, N, K, D)
+        expected = backend_kernel_outputs(reference, inputs)
+        for name in backends:
+            actual = backend_kernel_outputs(get_backend(name), inputs)
+            for kernel, value in expected.items():
+                # m_like_step returns the tuple (alpha, beta, nu, m, W)
+                pairs = zip(value, actual[kernel]) if isinstance(value, tuple) else [(value, actual[kernel])]
+                for a, b in pairs:
+                    a, b = np.asarray(a), np.asarray(b)
+                    error = np.abs(a - b).max() / max(np.abs(a).max(), np.finfo(np.float64).tiny) if np.all(np.isfinite(b)) else np.inf
+                    max_error[name, kernel] = max(max_error.get((name, kernel), 0.0), error)
+    n_failures = 0
+    for (name, kernel), error in max_error.items():
+        ok = error <= args.rtol
+        n_failures += not ok
+        print(f"{name:<8} {kernel:<20} max relative error {error:.2e}  {'ok' if ok else 'FAILED'}")
+    if n_failures > 0:
+        sys.exit(1)
+
+
+def time_case(stmt, repeat, min_time):
+    '''
+    Time ``stmt`` and return the per-call durations of ``repeat`` rounds.
+
+    The number of calls per round is calibrated so that one round takes at least ``min_time`` seconds.
+    '''
+    timer = timeit.Timer(stmt)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    times = [elapsed / number] + [t / number for t in timer.repeat(repeat=repeat - 1, number=number)]
+    return times, number
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    sizes = QUICK_SIZES if args.quick else SIZES
+    revision = git_revision()
+    results = []
+    for group, func in BENCHMARKS.items():
+        if args.group and group not in args.group:
+            continue
+        for name, params, stmt in func(sizes):
+            if args.filter and not fnmatch.fnmatch(name, args.filter):
+                continue
+            np.random.seed(0)
+            times, number = time_case(stmt, args.repeat, args.min_time)
+            results.append({
+                "name": name,
+                "group": group,
+                "params": params,
+                "number": number,
+                "times": times,
+                "min": min(times),
+                "median": statistics.median(times),
+                "mean": statistics.mean(times),
+                "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+            })
+            print(f"{name:<70} {format_time(results[-1]['median'])}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        output = os.path.join(RESULT_DIR, f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{revision}.json")
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "revision": revision,
+                "timestamp": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "processor": platform.processor(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(output)
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    base_results = {result["name"]: result for result in base["results"]}
+    new_results = {result["name"]: result for result in new["results"]}
+
+    print(f"base: {base['meta']['revision']}  new: {new['meta']['revision']}")
+    print(f"{'benchmark':<70} {'base':>10} {'new':>10} {'ratio':>7}")
+    n_regressions = 0
+    for name, new_result in new_results.items():
+        if name not in base_results:
+            print(f"{name:<70} {'-':>10} {format_time(new_result[args.stat]):>10}")
+            continue
+        ratio = new_result[args.stat] / base_results[name][args.stat]
+        if ratio > 1 + args.threshold:
+            status = "REGRESSION"
+            n_regressions += 1
+        elif ratio < 1 - args.threshold:
+            status = "improved"
+        else:
+            status = ""
+        print(f"{name:<70} {format_time(base_results[name][args.stat]):>10} {format_time(new_result[args.stat]):>10} {ratio:>7.2f} {status}")
+    if args.fail and n_regressions > 0:
+        sys.exit(1)
+
+
+def format_time(seconds):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:.3g}{unit}"
+    return f"{seconds / 1e-9:.3g}ns"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the agents and ILM chains.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and write a json result file")
+    run_parser.add_argument("--group", nargs="*", choices=list(BENCHMARKS.keys()), help="benchmark groups to run")
+    run_parser.add_argument("--filter", type=str, default=None, help="glob pattern on benchmark names")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--min_time", type=float, default=0.2, help="minimum seconds per timing round")
+    run_parser.add_argument("--quick", action="store_true", help="only the smallest problem size")
+    run_parser.add_argument("--output", type=str, default=None)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two json result files")
+    compare_parser.add_argument("base", type=str)
+    compare_parser.add_argument("new", type=str)
+    compare_parser.add_argument("--stat", type=str, default="median", choices=["min", "median", "mean"])
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    compare_parser.add_argument("--fail", action="store_true", help="exit with status 1 on any regression")
+    compare_parser.set_defaults(func=compare)
+
+    check_jit_parser = subparsers.add_parser("check_jit", help="check the numba per-sample loop against the NumPy path")
+    check_jit_parser.add_argument("--N", type=int, default=200, help="samples learned by each child")
+    check_jit_parser.add_argument("--seed", type=int, default=0)
+    check_jit_parser.add_argument("--rtol", type=float, default=1e-8)
+    check_jit_parser.set_defaults(func=check_jit)
+
+    conformance_parser = subparsers.add_parser("conformance", help="check every installed backend against the NumPy one")
+    conformance_parser.add_argument("--n_cases", type=int, default=50, help="random parameter sets")
+    conformance_parser.add_argument("--seed", type=int, default=0)
+    conformance_parser.add_argument("--rtol", type=float, default=1e-9)
+    conformance_parser.set_defaults(func=conformance)
+
+    check_fingerprint_index_parser = subparsers.add_parser("check_fingerprint_index",
+                                                           help="check that find_runs indexes old runs once, next to new ones")
+    check_fingerprint_index_parser.set_defaults(func=check_fingerprint_index)
+
+    check_history_parser = subparsers.add_parser("check_history", help="check that open_history reads back every history format")
+    check_history_parser.add_argument("--seed", type=int, default=0)
+    check_history_parser.set_defaults(func=check_history)
+
+    check_transmission_parser = subparsers.add_parser("check_transmission",
+                                                      help="check the sufficient statistic transmission against drawing the samples")
+    check_transmission_parser.add_argument("--settings", type=str, nargs="+",
+                                           default=["4,2,5,200", "3,2,5,50", "4,3,6,200", "8,2,10,400", "8,2,9.2,200", "4,2,3,200", "4,2,2,200"],
+                                           help="K,D,radius,N of each parent: the distance of its component means from the origin "
+                                                "in standard deviations and the samples per generation")
+    check_transmission_parser.add_argument("--repeat", type=int, default=300, help="repetitions per transmission")
+    check_transmission_parser.add_argument("--alpha", type=float, default=0.01, help="level of the KS tests")
+    check_transmission_parser.add_argument("--seed", type=int, default=0)
+    check_transmission_parser.set_defaults(func=check_transmission)
+
+    import_time_parser = subparsers.add_parser("import_time", help="check the startup time of the run and search entry points")
+    import_time_parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point")
+    import_time_parser.add_argument("--max_time", type=float, default=0.5, help="largest accepted import time in seconds")
+    import_time_parser.set_defaults(func=import_time)
+
+    check_sample_designs_parser = subparsers.add_parser("check_sample_designs",
+                                                        help="check generate with every sample design and kind of rng")
+    check_sample_designs_parser.add_argument("--N", type=int, default=100, help="samples generated")
+    check_sample_designs_parser.add_argument("--seed", type=int, default=0)
+    check_sample_designs_parser.set_defaults(func=check_sample_designs)
+
+    sample_variance_parser = subparsers.add_parser("sample_variance",
+                                                   help="samples per generation each sample design needs for a target variance")
+    sample_variance_parser.add_argument("--N", type=int, nargs="+", default=[50, 100, 200, 400, 800], help="grid of sample counts")
+    sample_variance_parser.add_argument("--N_target", type=int, default=400, help="samples of plain Monte Carlo defining the target")
+    sample_variance_parser.add_argument("--repeat", type=int, default=100, help="repetitions per design and sample count")
+    sample_variance_parser.add_argument("--seed", type=int, default=0)
+    sample_variance_parser.set_defaults(func=sample_variance)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,12 +1,6 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from scipy.stats import multivariate_normal
 import numpy as np
 import os
 import json
-import xarray as xr
 import sys
 import argparse
 from pathlib import Path
@@ -19,6 +13,19 @@ import colorsys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from src.utils import metrics
 from procece_data import procece_data
+from src.utils.lazy import LazyModule
+
+
+# matplotlib・xarray は最初に使うときに読み込む（描画しない処理では起動時間に含めない）
+def _use_agg():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+plt = LazyModule("matplotlib.pyplot", setup=_use_agg)
+animation = LazyModule("matplotlib.animation", setup=_use_agg)
+stats = LazyModule("scipy.stats")
+xr = LazyModule("xarray")
 
 
 parser = argparse.ArgumentParser(description='Process some data.')
@@ -209,9 +216,9 @@ for folder_name in folder_names:
                 axs.set_ylim(y_lim)
                 x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
                 xy = np.column_stack([x.flat, y.flat])
-                z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
+                z = stats.multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
 
-                rv = multivariate_normal(mean, covar)
+                rv = stats.multivariate_normal(mean, covar)
                 level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
                 contour = axs.contour(x, y, z, alpha=0.5, levels=[level])
                 artists.append(contour)
@@ -244,9 +251,9 @@ for folder_name in folder_names:
                 axs.set_ylim(y_lim)
                 x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
                 xy = np.column_stack([x.flat, y.flat])
-                z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
+                z = stats.multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
 
-                rv = multivariate_normal(mean, covar)
+                rv = stats.multivariate_normal(mean, covar)
                 level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
                 contour = axs.contour(x, y, z, alpha=0.5, levels=[level], colors=[cluster_colors[k]])
                 artists.append(contour)
@@ -278,9 +285,9 @@ for folder_name in folder_names:
                 axs.set_ylim(y_lim)
                 x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
                 xy = np.column_stack([x.flat, y.flat])
-                z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
+                z = stats.multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
 
-                rv = multivariate_normal(mean, covar)
+                rv = stats.multivariate_normal(mean, covar)
                 level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
                 contour = axs.contour(x, y, z, alpha=0.5, levels=[level], colors=[cluster_colors[k]])
                 artists.append(contour)
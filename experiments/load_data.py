@@ -1,12 +1,6 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from scipy.stats import multivariate_normal
 import numpy as np
 import os
 import json
-import xarray as xr
 import sys
 import argparse
 from pathlib import Path
@@ -1,14 +1,12 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from scipy.stats import multivariate_normal
 import numpy as np
 import os
 import json
-import xarray as xr
 import sys
 import argparse
+import hashlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cached_property
 from pathlib import Path
 import colorsys
 
@@ -18,22 +16,23 @@ import colorsys
 
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
 from src.utils import metrics
+from src.utils.geometry import ellipse_vertices
+from src.utils.frames import save_animation
+from src.utils.preview import load_preview
 from experiments.procece_data import procece_data
+from src.utils.lazy import LazyModule
 
 
-parser = argparse.ArgumentParser(description='Process some data.')
+# matplotlib・xarray は最初に使うときに読み込む（描画しない処理では起動時間に含めない）
+def _use_agg():
+    import matplotlib
+    matplotlib.use('Agg')
 
-parser.add_argument('folder_name',nargs="?" , type=str, default="all", help='input file path')
-parser.add_argument('--remake_all', action='store_true')
-parser.add_argument('--latest', action='store_true')
 
-folder_name = parser.parse_args().folder_name
-remake_all = parser.parse_args().remake_all
-latest = parser.parse_args().latest
-
-if latest and remake_all:
-    print("latest and remake_all are exclusive")
-    exit()
+plt = LazyModule("matplotlib.pyplot", setup=_use_agg)
+patches = LazyModule("matplotlib.patches")
+xr = LazyModule("xarray")
+history = LazyModule("src.utils.history")
 
 
 #load data
@@ -106,404 +105,492 @@ def generate_gradation(n, base_color):
     return colors
 
 
-matched_data = []  
-if folder_name == 'all':
-    folder_names = os.listdir(DATA_DIR)
-    folder_names = sorted(os.listdir(DATA_DIR), reverse=True)
-    if latest:
-        folder_names = sorted(folder_names, reverse=True)[:1]
-        remake_all = True
-else:
-    folder_names = [folder_name]
-    remake_all = True
-for folder_name in folder_names:
-    if os.path.exists(DATA_DIR+folder_name+"/config.json"):
-        if not os.path.exists(DATA_DIR+folder_name+"/metrics.nc"):
-            print(f"procece {folder_name}")
-            procece_data(folder_name)
-        if os.path.exists(DATA_DIR+folder_name+"/animation.gif") and not remake_all:
-            print(f"skip {folder_name}")
-            continue
-        print(f"load {folder_name}")
-        with open(DATA_DIR+folder_name+"/config.json") as f:
-            temp_config = json.load(f)
-        X = np.load(DATA_DIR+folder_name+"/data.npy")
-        Z = np.load(DATA_DIR+folder_name+"/Z.npy")
-        C = np.load(DATA_DIR+folder_name+"/context.npy")
-        K = temp_config["K"]
-        
-        if os.path.exists(DATA_DIR+folder_name+"/excluded_data.nc"):
-            try:
-                excluded_data = xr.open_dataset(DATA_DIR+folder_name+"/excluded_data.nc")
-            except:
-                excluded_data = None
-
-        params = np.load(DATA_DIR+folder_name+"/params.npy", allow_pickle=True).item()
-        retry_counts = np.load(DATA_DIR+folder_name+"/retry_counts.npy")
-        metrics_data = xr.open_dataset(os.path.join(DATA_DIR, folder_name, "metrics.nc"))
-        matched_data.append({
-            "X": X,
-            "Z": Z,
-            "C": C,
-            "params": params,
-            "retry_counts": retry_counts,
-            "folder_name": folder_name,
-            "metrics_data": metrics_data
-        })
+class FolderData:
+    """
+    1つの実験フォルダのデータ
+
+    各ファイルは最初に使われたときに一度だけ読み込まれ、そのフォルダの全ての図で共有される。
+    """
+    def __init__(self, folder_name, full_resolution=False):
+        self.folder_name = folder_name
+        self.path = os.path.join(DATA_DIR, folder_name)
+        self.full_resolution = full_resolution
+
+    @cached_property
+    def config(self):
+        with open(os.path.join(self.path, "config.json")) as f:
+            return json.load(f)
+
+    @cached_property
+    def X(self):
+        return np.load(os.path.join(self.path, "data.npy"))
+
+    @cached_property
+    def Z(self):
+        return np.load(os.path.join(self.path, "Z.npy"))
+
+    @cached_property
+    def C(self):
+        return np.load(os.path.join(self.path, "context.npy"))
+
+    @cached_property
+    def params(self):
+        return np.load(os.path.join(self.path, "params.npy"), allow_pickle=True).item()
+
+    @cached_property
+    def points(self):
+        """
+        散布図に描く点：既定では層化抽出したプレビュー (preview.npz)、full_resolution の場合は全ての点
+
+        index (iter, M) 元のサンプル番号、X (iter, M, D)、z (iter, M) Z の argmax
+        """
+        if not self.full_resolution:
+            return load_preview(self.path)
+        return {
+            "index": np.broadcast_to(np.arange(self.X.shape[1]), self.X.shape[:2]),
+            "X": self.X,
+            "z": np.argmax(self.Z, axis=-1) if os.path.exists(os.path.join(self.path, "Z.npy")) else np.zeros(self.X.shape[:2], dtype=int),
+        }
+
+    @cached_property
+    def excluded_data(self):
+        try:
+            return xr.open_dataset(os.path.join(self.path, "excluded_data.nc")).load()
+        except:
+            return None
+
+    @cached_property
+    def metrics_data(self):
+        return xr.open_dataset(os.path.join(self.path, "metrics.nc")).load()
+
+    @property
+    def K(self):
+        return self.config["K"]
+
+    @property
+    def iter(self):
+        return self.params["m"].shape[0]
+
+    @cached_property
+    def lim(self):
         # Determine x_lim and y_lim based on X values
-        lim = np.max(np.abs(params["m"]))
+        lim = np.max(np.abs(self.params["m"]))
         lim = np.ceil(lim / 10) * 10
-        x_lim = (-lim, lim)
-        y_lim = (-lim, lim)
-
-            
-
-        iter = params["m"].shape[0]
-        cluster_colors = generate_colors(K)
-        # cluster_colors = plt.cm.tab20b(np.linspace(0, 1, K))
-        # cluster_colors = []
-        # for i in range(K):
-        #     if i % 2 == 0:
-        #         # cluster_colors.append('blue')
-        #         cluster_colors.append(plt.cm.tab20c(i//2))
-        #     else:
-        #         # cluster_colors.append('orange')
-        #         cluster_colors.append(plt.cm.tab20c(4+i//2))
-        cluster_colors = generate_double_gradation(K)
-        # cluster_colors = generate_gradation(K, "red")
-
-        if os.path.exists(DATA_DIR+folder_name+"/history.nc"):
-            history_m = xr.open_dataset(DATA_DIR+folder_name+"/history.nc", drop_variables=list(params.keys() - {"m"}))
-            history_m_diff = np.array([history_m['m'][i] - history_m['m'][i-1][-1] for i in range(1, len(history_m['m']))])
-            history_m_diff = np.linalg.norm(history_m_diff, axis=-1)
-
-            history_m_diff = np.mean(history_m_diff, axis=0)
-            fig, axs = plt.subplots()
-            for k in range(K):
-                axs.plot(history_m_diff[:,k], label=f"Cluster {k+1}")
-            axs.set_xlabel("sumple number")
-            axs.set_ylabel("Difference")
-            axs.legend()
-            plt.savefig(os.path.join(DATA_DIR, folder_name, "history_m_diff.png"))
-
-            # plot animation of learning process of last generation
-            fig, axs = plt.subplots()
-            last_generation_history = xr.open_dataset(DATA_DIR+folder_name+"/history.nc").sel(iter=1)
-            print(last_generation_history)
-            plt.gca().set_aspect('equal')
-            def update(i):
-                axs.clear()
-                artists = []
-
-                # Plot data points up to current time i
-                fake_z = np.argmax(Z[-1], axis=1)
-                for z in range(K):
-                    X_with_z = X[-1][fake_z == z][:i]
-                    scatter = axs.scatter(X_with_z[:, 0], X_with_z[:, 1], c=[cluster_colors[z]], s=2, alpha=0.2)
-                    artists.append(scatter)
-
-                # Plot current distribution
-                for k in range(K):
-                    mean = last_generation_history["m"][i][k]
-                    matrix = (last_generation_history["beta"][i][k].values * 
-                                last_generation_history["W"][i][k, :, :].values)
-                    covar = np.linalg.inv(matrix)
-                    # axs.set_xlim(-30, 30)
-                    # axs.set_ylim(-30, 30)
-                    axs.set_xlim(x_lim)
-                    axs.set_ylim(y_lim)
-                    x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
-                    xy = np.column_stack([x.flat, y.flat])
-                    z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
-
-                    rv = multivariate_normal(mean, covar)
-                    level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
-                    # levels = level * np.linspace(0, 5, 10)
-                    levels = [level]
-                    contour = axs.contour(x, y, z, levels=levels, colors=[cluster_colors[k]])
-                    artists.append(contour)
-                    contourf = axs.contourf(x, y, z, levels=[level,1], colors=[cluster_colors[k]], alpha=0.2)
-                    artists.append(contourf)
-                
-                # Plot prior means and arrows to current means
-                for k in range(K):
-                    prior_mean = temp_config["m0"][k]
-                    marker = axs.scatter(prior_mean[0], prior_mean[1], marker='x', color=cluster_colors[k])
-                    artists.append(marker)
-                    learned_mean = last_generation_history["m"][i][k]
-                    arrow = axs.arrow(prior_mean[0], prior_mean[1], 
-                                    learned_mean[0] - prior_mean[0], 
-                                    learned_mean[1] - prior_mean[1], 
-                                    head_width=0.8, head_length=0.8, 
-                                    fc=cluster_colors[k], ec=cluster_colors[k])
-                    artists.append(arrow)
-
-                return artists
-            # Create animation
-            anim = animation.FuncAnimation(fig, update, frames=len(last_generation_history['m']), interval=50, blit=True)
-            
-            # Save animation
-            anim.save(os.path.join(DATA_DIR, folder_name, "learning_animation.gif"), writer='pillow')
-            plt.close(fig)
-            print('last_gen',len(last_generation_history))
-
-        # Create a list of alternating blue and orange colors
-        
-        # plot mean step difference
-        fig, axs = plt.subplots()
-        # Calculate mean step difference for each cluster
-        mean_step_diff = np.mean(np.linalg.norm(np.diff(params["m"][len(params['m'])//10:], axis=0), axis=-1), axis=0)
-        # Create bar plot of mean step differences
-        axs.bar(range(1, K+1), mean_step_diff)
-        axs.set_xticks(range(1, K+1))
-        axs.set_xticklabels([f"Cluster {k+1}" for k in range(K)])
-        axs.set_ylabel("Mean Step Difference")
-        axs.set_title("Mean Step Differences by Cluster")
-        plt.tight_layout() 
-        plt.savefig(os.path.join(DATA_DIR, folder_name, "mean_step_diff.png"))
-        plt.close(fig)
-        
-        # plot std of mean
-        fig, axs = plt.subplots()
-        # Calculate variance of mean for each cluster
-        std_m =  np.sqrt(np.var(params["m"][len(params['m'])*5//10:], axis=0).mean(axis=1)) 
-        # Create bar plot of variance of mean
-        axs.bar(range(1, K+1), std_m)
-        axs.set_xticks(range(1, K+1))
-        axs.set_xticklabels([f"Cluster {k+1}" for k in range(K)])
-        axs.set_ylabel("Standard Deviation of Mean")
-        axs.set_title("Standard Deviation of Mean by Cluster")
-        plt.tight_layout()
-        plt.savefig(os.path.join(DATA_DIR, folder_name, "std_m.png"))
-
-
-
-        # plot metrics
-        ## plot expected_mahalanobis mean
-        fig, axs = plt.subplots()
-        expected_mahalanobis_mean = metrics_data['expected_mahalanobis'].mean(dim='simulation')
-        im = axs.imshow(expected_mahalanobis_mean, cmap='viridis', origin='lower')
-        axs.set_xticks(range(expected_mahalanobis_mean.shape[1]))
-        axs.set_yticks(range(expected_mahalanobis_mean.shape[0]))
-        axs.set_xticklabels(range(1, expected_mahalanobis_mean.shape[1]+1))
-        axs.set_yticklabels(range(1, expected_mahalanobis_mean.shape[0]+1))
-        axs.set_xlabel('Component')
-        axs.set_ylabel('Component')
-        axs.invert_yaxis()
-        cbar = fig.colorbar(im)
-        cbar.set_label('Expected Mahalanobis Distance')
-        plt.savefig(os.path.join(DATA_DIR, folder_name,"expected_mahalanobis_mean.png"))
-
-        ## plot expected_overlap mean
-        fig, axs = plt.subplots()
-        expected_overlap_mean = metrics_data['expected_overlap'].mean(dim='simulation')
-        im = axs.imshow(expected_overlap_mean, cmap='viridis', origin='lower')
-        axs.set_xticks(range(expected_overlap_mean.shape[1]))
-        axs.set_yticks(range(expected_overlap_mean.shape[0]))
-        axs.set_xticklabels(range(1, expected_overlap_mean.shape[1]+1))
-        axs.set_yticklabels(range(1, expected_overlap_mean.shape[0]+1))
-        axs.set_xlabel('Component')
-        axs.set_ylabel('Component')
-        axs.invert_yaxis()
-        cbar = fig.colorbar(im)
-        cbar.set_label('Expected Overlap')
-        plt.savefig(os.path.join(DATA_DIR, folder_name,"expected_overlap_mean.png"))
-
-
-
-        fig, axs = plt.subplots()
-        # Create a colormap
-        colors = plt.cm.viridis(np.linspace(0, 1, iter))
-        # Extend cluster_colors to support up to 32 clusters
-        # Extend cluster_colors to support up to 32 clusters
-
-
-        # Plot the trajectory of params["m"] in 2D space with color gradient
-        for k in range(K):
-            for i in range(1, iter):
-                axs.plot(params["m"][i-1:i+1, k, 0], params["m"][i-1:i+1, k, 1], color=colors[i], alpha=0.5)
-            axs.scatter(params["m"][-1, k, 0], params["m"][-1, k, 1], marker='o', s=10, label=f"Cluster {k+1}", c=[cluster_colors[k]])
-
-        axs.set_xlim(x_lim)
-        axs.set_ylim(y_lim)
-        axs.set_xlabel("X")
-        axs.set_ylabel("Y")
-        axs.legend()
-        plt.savefig(os.path.join(DATA_DIR, folder_name,"trajectory.png"))
-        plt.close(fig)
-
-        fig, axs = plt.subplots()
-        for k in range(K):
-            axs.plot(params["m"][:, k, 0], params["m"][:, k, 1], label=f"Cluster {k+1}", c=cluster_colors[k])
-        axs.set_xlim(x_lim)
-        axs.set_ylim(y_lim)
-        plt.savefig(os.path.join(DATA_DIR, folder_name,"trajectory2.png"))
-        # plt.show()
-
-
-        # # Plot the distances
-        fig, axs = plt.subplots()
-        distances = np.sqrt(np.sum((params["m"] - np.mean(params["m"], axis=1, keepdims=True))**2, axis=2))
-        for k in range(K):
-            axs.plot(params["alpha"][:, k] / np.sum(params["alpha"], axis=1), label=f"Cluster {k+1}")
-        axs.set_xlabel("Iteration")
-        axs.set_ylabel("Distance from Center")
-        axs.legend()
-        plt.savefig(os.path.join(DATA_DIR, folder_name,"mixtures_ratio.png"))
-        # plt.show()
-
-
-        # Plot the trajectory of params["m"] in 2D space with color gradient
-        fig, axs = plt.subplots()
-        plt.gca().set_aspect('equal')
-        def update(i):
-            axs.clear()
-            artists = []
-
-            scatter = axs.scatter(X[i][:, 0], X[i][:, 1], s=2, alpha=0.5)
-            artists.append(scatter)
-            if excluded_data is not None:
-                if 'iter' in excluded_data.dims:
-                    excluded = excluded_data['X'][i]
-                    scatter = axs.scatter(excluded[:, 0], excluded[:, 1], s=2, alpha=0.5, c='red')
-                    artists.append(scatter)
-
-            for k in range(K):
-                mean = params["m"][i, k]
-                matrix = params["beta"][i, k] * params["W"][i, k, :, :]
-                covar = np.linalg.inv(matrix)
-                axs.set_xlim(x_lim)
-                axs.set_ylim(y_lim)
-                x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
-                xy = np.column_stack([x.flat, y.flat])
-                z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
-
-                rv = multivariate_normal(mean, covar)
-                level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
-                contour = axs.contour(x, y, z, alpha=0.5, levels=[level])
-                artists.append(contour)
-
-            # axs.set_title(f"iteration {i}")
-
-            # plt.tight_layout()
-
-            return artists
-
-        ani = animation.FuncAnimation(fig, update, frames=iter, interval=500, blit=True)
-        ani.save(DATA_DIR+folder_name+"/animation.gif", writer="pillow")
-        # plt.show()
-        fig, axs = plt.subplots()
-        plt.gca().set_aspect('equal')
-        def update(i):
-            axs.clear()
-            artists = []
-
-            fake_z = np.argmax(Z[i], axis=1)
-            for z in range(K):
-                X_with_z = X[i][fake_z == z]
-                scatter = axs.scatter(X_with_z[:, 0], X_with_z[:, 1], c=[cluster_colors[z]], s=2, alpha=0.2)
-            artists.append(scatter)
-
-            for k in range(K):
-                mean = params["m"][i, k]
-                matrix = params["beta"][i, k] * params["W"][i, k, :, :]
-                covar = np.linalg.inv(matrix)
-                # axs.set_xlim(x_lim)
-                # axs.set_ylim(y_lim)
-                axs.set_xlim(-30, 30)
-                axs.set_ylim(-30, 30)
-                x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
-                xy = np.column_stack([x.flat, y.flat])
-                z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
-
-                rv = multivariate_normal(mean, covar)
-                level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
-                
-                contour = axs.contour(x, y, z, levels=[level], colors=[cluster_colors[k]])
-                artists.append(contour)
-                contourf = axs.contourf(x, y, z, levels=[level,1], colors=[cluster_colors[k]], alpha=0.2)
-                artists.append(contourf)
-            
-            # 事前分布中心から学習後の中心までの矢印を描画
-            for k in range(K):
-                prior_mean = temp_config["m0"][k]
-                marker = axs.scatter(prior_mean[0], prior_mean[1], marker='x', color=cluster_colors[k])
-                artists.append(marker)
-                learned_mean = params["m"][i, k]
-                arrow = axs.arrow(prior_mean[0], prior_mean[1], 
-                                  learned_mean[0] - prior_mean[0], 
-                                  learned_mean[1] - prior_mean[1], 
-                                  head_width=0.8, head_length=0.8, 
-                                  fc=cluster_colors[k], ec=cluster_colors[k])
-                artists.append(arrow)
-
-
-            # axs.legend([f'Cluster {i+1}' for i in range(K)], loc='upper right')
-            # axs.set_title(f"iteration {i}")
-
-            # plt.tight_layout()
-
-            return artists
-
-        ani = animation.FuncAnimation(fig, update, frames=iter, interval=500, blit=True)
-        ani.save(DATA_DIR+folder_name+"/animation_colored_with_Z_arrow.gif", writer="pillow")
-
-        fig, axs = plt.subplots()
-        plt.gca().set_aspect('equal')
-        def update(i):
-            axs.clear()
-            artists = []
-
-            fake_z = np.argmax(Z[i], axis=1)
-            for z in range(K):
-                X_with_z = X[i][fake_z == z]
-                scatter = axs.scatter(X_with_z[:, 0], X_with_z[:, 1], c=[cluster_colors[z]], s=2, alpha=0.5)
-            artists.append(scatter)
-
-            for k in range(K):
-                mean = params["m"][i, k]
-                matrix = params["beta"][i, k] * params["W"][i, k, :, :]
-                covar = np.linalg.inv(matrix)
-                # axs.set_xlim(x_lim)
-                # axs.set_ylim(y_lim)
-                axs.set_xlim(-30, 30)
-                axs.set_ylim(-30, 30)
-                x, y = np.meshgrid(np.linspace(*x_lim, 100), np.linspace(*y_lim, 100))
-                xy = np.column_stack([x.flat, y.flat])
-                z = multivariate_normal.pdf(xy, mean=mean, cov=covar).reshape(x.shape)
-
-                rv = multivariate_normal(mean, covar)
-                level = rv.pdf(mean) * np.exp(-0.5 * (np.sqrt(2)) ** 2)
-                
-                contour = axs.contour(x, y, z, levels=[level], colors=[cluster_colors[k]])
-                artists.append(contour)
-                contourf = axs.contourf(x, y, z, levels=[level,1], colors=[cluster_colors[k]], alpha=0.15)
-                artists.append(contourf)
-            
-            # # 事前分布中心から学習後の中心までの矢印を描画
-            # for k in range(K):
-            #     prior_mean = temp_config["m0"][k]
-            #     marker = axs.scatter(prior_mean[0], prior_mean[1], marker='x', color=cluster_colors[k])
-            #     artists.append(marker)
-            #     learned_mean = params["m"][i, k]
-            #     arrow = axs.arrow(prior_mean[0], prior_mean[1], 
-            #                       learned_mean[0] - prior_mean[0], 
-            #                       learned_mean[1] - prior_mean[1], 
-            #                       head_width=0.8, head_length=0.8, 
-            #                       fc=cluster_colors[k], ec=cluster_colors[k])
-            #     artists.append(arrow)
-
-
-            # axs.legend([f'Cluster {i+1}' for i in range(K)], loc='upper right')
-            # axs.set_title(f"iteration {i}")
-
-            # plt.tight_layout()
-
-            return artists
-
-        ani = animation.FuncAnimation(fig, update, frames=iter, interval=500, blit=True)
-        ani.save(DATA_DIR+folder_name+"/animation_colored_with_Z.gif", writer="pillow")
+        return (-lim, lim)
 
+    @cached_property
+    def ellipses(self):
+        # 全世代・全クラスタの Mahalanobis 半径 √2 の楕円 (iter, K, n_points, 2)
+        return ellipse_vertices(self.params["m"], self.params["beta"][..., None, None] * self.params["W"])
 
-        
-        plt.cla()
\ No newline at end of file
+    @cached_property
+    def cluster_colors(self):
+        return generate_double_gradation(self.K)
+
+
+FIGURES = {}
+
+
+def figure(file_name, inputs, optional_inputs=()):
+    """
+    図を描画する関数を登録する
+
+    inputs は図が読み込むファイルで、無い場合はその図を描かない。optional_inputs は無くてもよいファイル。
+    キャッシュキーはこれらのファイルの内容とこのスクリプトのソースから作る。
+    """
+    def decorator(func):
+        FIGURES[file_name] = {
+            "func": func,
+            "inputs": ("config.json",) + tuple(inputs),
+            "optional_inputs": tuple(optional_inputs),
+        }
+        return func
+    return decorator
+
+
+@figure("history_m_diff.png", ["history.nc"])
+def plot_history_m_diff(data, path):
+    # 必要な世代・サンプルだけを読み出して復号する
+    history_m = history.open_history(os.path.join(data.path, "history.nc"))[["m"]]
+    history_m_diff = np.array([history_m['m'][i] - history_m['m'][i-1][-1] for i in range(1, len(history_m['m']))])
+    history_m_diff = np.linalg.norm(history_m_diff, axis=-1)
+
+    history_m_diff = np.mean(history_m_diff, axis=0)
+    fig, axs = plt.subplots()
+    for k in range(data.K):
+        axs.plot(history_m_diff[:,k], label=f"Cluster {k+1}")
+    axs.set_xlabel("sumple number")
+    axs.set_ylabel("Difference")
+    axs.legend()
+    plt.savefig(path)
+
+
+def add_ellipse_artists(axs, cluster_colors, edge_alpha=1.0, fill_alpha=None):
+    """
+    クラスタごとの楕円（輪郭と塗り）を一度だけ作る。頂点は各フレームで set_xy により更新する
+    """
+    artists = []
+    for color in cluster_colors:
+        artists.append(axs.add_patch(patches.Polygon(np.zeros((1, 2)), fill=False, edgecolor=color, alpha=edge_alpha)))
+        if fill_alpha is not None:
+            artists.append(axs.add_patch(patches.Polygon(np.zeros((1, 2)), facecolor=color, edgecolor='none', alpha=fill_alpha)))
+    return artists
+
+
+def set_ellipses(ellipse_artists, ellipses):
+    n_artists_per_ellipse = len(ellipse_artists) // len(ellipses)
+    for k, vertices in enumerate(ellipses):
+        for artist in ellipse_artists[k * n_artists_per_ellipse:(k + 1) * n_artists_per_ellipse]:
+            artist.set_xy(vertices)
+
+
+def add_prior_arrows(axs, prior_m, cluster_colors):
+    """
+    事前分布の中心の印（静的）と、そこから学習後の中心への矢印（各フレームで set_data により更新）
+    """
+    arrows = []
+    for k, color in enumerate(cluster_colors):
+        axs.scatter(prior_m[k][0], prior_m[k][1], marker='x', color=color)
+        arrows.append(axs.arrow(prior_m[k][0], prior_m[k][1], 0, 0,
+                                head_width=0.8, head_length=0.8, fc=color, ec=color))
+    return arrows
+
+
+def set_prior_arrows(arrows, prior_m, m):
+    for k, arrow in enumerate(arrows):
+        arrow.set_data(x=prior_m[k][0], y=prior_m[k][1], dx=m[k][0] - prior_m[k][0], dy=m[k][1] - prior_m[k][1])
+
+
+@figure("learning_animation.gif", ["history.nc", "data.npy", "Z.npy", "params.npy"])
+def plot_learning_animation(data, path):
+    # plot animation of learning process of last generation
+    K, points, cluster_colors = data.K, data.points, data.cluster_colors
+    x_lim = y_lim = data.lim
+    last_generation_history = history.open_history(os.path.join(data.path, "history.nc")).sel(iter=1).load()
+    history_m = last_generation_history["m"].values
+    ellipses = ellipse_vertices(history_m, last_generation_history["beta"].values[..., None, None] * last_generation_history["W"].values)
+    prior_m = data.config["m0"]
+
+    fig, axs = plt.subplots()
+    axs.set_aspect('equal')
+    axs.set_xlim(x_lim)
+    axs.set_ylim(y_lim)
+    # Plot data points up to current time i
+    fake_z = points["z"][-1]
+    X_by_z = [points["X"][-1][fake_z == z] for z in range(K)]
+    # 各フレームまでに学習した各クラスタの点の数（フレーム i は n 座標の番号のサンプルを学習した直後。
+    # history を間引いて保存した場合もフレームとサンプル番号が対応する）
+    sample_index = last_generation_history["n"].values
+    n_seen = np.stack([np.searchsorted(points["index"][-1][fake_z == z], sample_index, side="right") for z in range(K)])
+    scatters = [axs.scatter([], [], color=cluster_colors[z], s=2, alpha=0.2) for z in range(K)]
+    ellipse_artists = add_ellipse_artists(axs, cluster_colors, fill_alpha=0.2)
+    arrows = add_prior_arrows(axs, prior_m, cluster_colors)
+
+    def update(i):
+        for z in range(K):
+            scatters[z].set_offsets(X_by_z[z][:n_seen[z, i]])
+        # Plot current distribution
+        set_ellipses(ellipse_artists, ellipses[i])
+        # Plot prior means and arrows to current means
+        set_prior_arrows(arrows, prior_m, history_m[i])
+
+    save_animation(fig, scatters + ellipse_artists + arrows, update, len(history_m), path, duration=50)
+
+
+@figure("mean_step_diff.png", ["params.npy"])
+def plot_mean_step_diff(data, path):
+    params, K = data.params, data.K
+    fig, axs = plt.subplots()
+    # Calculate mean step difference for each cluster
+    mean_step_diff = np.mean(np.linalg.norm(np.diff(params["m"][len(params['m'])//10:], axis=0), axis=-1), axis=0)
+    # Create bar plot of mean step differences
+    axs.bar(range(1, K+1), mean_step_diff)
+    axs.set_xticks(range(1, K+1))
+    axs.set_xticklabels([f"Cluster {k+1}" for k in range(K)])
+    axs.set_ylabel("Mean Step Difference")
+    axs.set_title("Mean Step Differences by Cluster")
+    plt.tight_layout() 
+    plt.savefig(path)
+
+
+@figure("std_m.png", ["params.npy"])
+def plot_std_m(data, path):
+    params, K = data.params, data.K
+    fig, axs = plt.subplots()
+    # Calculate variance of mean for each cluster
+    std_m =  np.sqrt(np.var(params["m"][len(params['m'])*5//10:], axis=0).mean(axis=1)) 
+    # Create bar plot of variance of mean
+    axs.bar(range(1, K+1), std_m)
+    axs.set_xticks(range(1, K+1))
+    axs.set_xticklabels([f"Cluster {k+1}" for k in range(K)])
+    axs.set_ylabel("Standard Deviation of Mean")
+    axs.set_title("Standard Deviation of Mean by Cluster")
+    plt.tight_layout()
+    plt.savefig(path)
+
+
+def plot_component_matrix(matrix, label, path):
+    fig, axs = plt.subplots()
+    im = axs.imshow(matrix, cmap='viridis', origin='lower')
+    axs.set_xticks(range(matrix.shape[1]))
+    axs.set_yticks(range(matrix.shape[0]))
+    axs.set_xticklabels(range(1, matrix.shape[1]+1))
+    axs.set_yticklabels(range(1, matrix.shape[0]+1))
+    axs.set_xlabel('Component')
+    axs.set_ylabel('Component')
+    axs.invert_yaxis()
+    cbar = fig.colorbar(im)
+    cbar.set_label(label)
+    plt.savefig(path)
+
+
+@figure("expected_mahalanobis_mean.png", ["metrics.nc"])
+def plot_expected_mahalanobis_mean(data, path):
+    plot_component_matrix(data.metrics_data['expected_mahalanobis'].mean(dim='simulation'), 'Expected Mahalanobis Distance', path)
+
+
+@figure("expected_overlap_mean.png", ["metrics.nc"])
+def plot_expected_overlap_mean(data, path):
+    plot_component_matrix(data.metrics_data['expected_overlap'].mean(dim='simulation'), 'Expected Overlap', path)
+
+
+@figure("trajectory.png", ["params.npy"])
+def plot_trajectory(data, path):
+    params, K, iter, cluster_colors = data.params, data.K, data.iter, data.cluster_colors
+    x_lim = y_lim = data.lim
+    fig, axs = plt.subplots()
+    # Create a colormap
+    colors = plt.cm.viridis(np.linspace(0, 1, iter))
+
+    # Plot the trajectory of params["m"] in 2D space with color gradient
+    for k in range(K):
+        for i in range(1, iter):
+            axs.plot(params["m"][i-1:i+1, k, 0], params["m"][i-1:i+1, k, 1], color=colors[i], alpha=0.5)
+        axs.scatter(params["m"][-1, k, 0], params["m"][-1, k, 1], marker='o', s=10, label=f"Cluster {k+1}", c=[cluster_colors[k]])
+
+    axs.set_xlim(x_lim)
+    axs.set_ylim(y_lim)
+    axs.set_xlabel("X")
+    axs.set_ylabel("Y")
+    axs.legend()
+    plt.savefig(path)
+
+
+@figure("trajectory2.png", ["params.npy"])
+def plot_trajectory2(data, path):
+    params, K, cluster_colors = data.params, data.K, data.cluster_colors
+    x_lim = y_lim = data.lim
+    fig, axs = plt.subplots()
+    for k in range(K):
+        axs.plot(params["m"][:, k, 0], params["m"][:, k, 1], label=f"Cluster {k+1}", c=cluster_colors[k])
+    axs.set_xlim(x_lim)
+    axs.set_ylim(y_lim)
+    plt.savefig(path)
+
+
+@figure("mixtures_ratio.png", ["params.npy"])
+def plot_mixtures_ratio(data, path):
+    params, K = data.params, data.K
+    fig, axs = plt.subplots()
+    for k in range(K):
+        axs.plot(params["alpha"][:, k] / np.sum(params["alpha"], axis=1), label=f"Cluster {k+1}")
+    axs.set_xlabel("Iteration")
+    axs.set_ylabel("Distance from Center")
+    axs.legend()
+    plt.savefig(path)
+
+
+@figure("animation.gif", ["data.npy", "params.npy"], optional_inputs=["excluded_data.nc"])
+def plot_animation(data, path):
+    X, excluded_data = data.points["X"], data.excluded_data
+    ellipses, cluster_colors = data.ellipses, data.cluster_colors
+    x_lim = y_lim = data.lim
+    # Plot the trajectory of params["m"] in 2D space with color gradient
+    fig, axs = plt.subplots()
+    axs.set_aspect('equal')
+    axs.set_xlim(x_lim)
+    axs.set_ylim(y_lim)
+    scatter = axs.scatter([], [], s=2, alpha=0.5)
+    artists = [scatter]
+    show_excluded = excluded_data is not None and 'iter' in excluded_data.dims
+    if show_excluded:
+        excluded_X = excluded_data['X'].values
+        excluded_scatter = axs.scatter([], [], s=2, alpha=0.5, c='red')
+        artists.append(excluded_scatter)
+    ellipse_artists = add_ellipse_artists(axs, cluster_colors, edge_alpha=0.5)
+    artists += ellipse_artists
+
+    def update(i):
+        scatter.set_offsets(X[i])
+        if show_excluded:
+            excluded_scatter.set_offsets(excluded_X[i])
+        set_ellipses(ellipse_artists, ellipses[i])
+
+    save_animation(fig, artists, update, data.iter, path, duration=500)
+
+
+def plot_animation_colored_with_Z(data, path, arrow, alpha):
+    params, K, points, cluster_colors = data.params, data.K, data.points, data.cluster_colors
+    ellipses = data.ellipses
+    prior_m = data.config["m0"]
+    fig, axs = plt.subplots()
+    axs.set_aspect('equal')
+    axs.set_xlim(-30, 30)
+    axs.set_ylim(-30, 30)
+    scatters = [axs.scatter([], [], color=cluster_colors[z], s=2, alpha=alpha["scatter"]) for z in range(K)]
+    ellipse_artists = add_ellipse_artists(axs, cluster_colors, fill_alpha=alpha["fill"])
+    artists = scatters + ellipse_artists
+    if arrow:
+        # 事前分布中心から学習後の中心までの矢印を描画
+        arrows = add_prior_arrows(axs, prior_m, cluster_colors)
+        artists += arrows
+
+    def update(i):
+        fake_z = points["z"][i]
+        for z in range(K):
+            scatters[z].set_offsets(points["X"][i][fake_z == z])
+        set_ellipses(ellipse_artists, ellipses[i])
+        if arrow:
+            set_prior_arrows(arrows, prior_m, params["m"][i])
+
+    save_animation(fig, artists, update, data.iter, path, duration=500)
+
+
+@figure("animation_colored_with_Z_arrow.gif", ["data.npy", "Z.npy", "params.npy"])
+def plot_animation_colored_with_Z_arrow(data, path):
+    plot_animation_colored_with_Z(data, path, arrow=True, alpha={"scatter": 0.2, "fill": 0.2})
+
+
+@figure("animation_colored_with_Z.gif", ["data.npy", "Z.npy", "params.npy"])
+def plot_animation_colored_with_Z_no_arrow(data, path):
+    plot_animation_colored_with_Z(data, path, arrow=False, alpha={"scatter": 0.5, "fill": 0.15})
+
+
+CACHE_FILE = "figure_cache.json"
+# 描画が通るこのファイル以外のモジュール（パッケージは全ての .py）
+PLOT_SOURCE_MODULES = [
+    "src.utils.geometry",
+    "src.utils.frames",
+    "src.utils.preview",
+    "src.utils.history",
+    "src.utils.metrics",
+    "experiments.procece_data",
+]
+
+
+def source_digest(module_names):
+    """
+    このファイルと module_names のモジュールのソースのハッシュ（モジュールは import しない）
+    """
+    paths = [Path(__file__)]
+    for module_name in module_names:
+        spec = importlib.util.find_spec(module_name)
+        origin = Path(spec.origin)
+        paths += sorted(origin.parent.rglob("*.py")) if spec.submodule_search_locations else [origin]
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+# 描画関数や共通の描画処理を変更したら全ての図を描き直す
+PLOT_SOURCE_DIGEST = source_digest(PLOT_SOURCE_MODULES)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def figure_key(figure_name, folder_path, digests, full_resolution=False):
+    """
+    図のキャッシュキー：入力ファイルの内容、描画関数と PLOT_SOURCE_MODULES のソース、点の解像度のハッシュ
+    """
+    entry = FIGURES[figure_name]
+    key = hashlib.sha256()
+    key.update(figure_name.encode())
+    if "data.npy" in entry["inputs"]:
+        key.update(b"full" if full_resolution else b"preview")
+    key.update(PLOT_SOURCE_DIGEST.encode())
+    for input_name in entry["inputs"] + entry["optional_inputs"]:
+        input_path = os.path.join(folder_path, input_name)
+        if input_name not in digests:
+            digests[input_name] = file_digest(input_path) if os.path.exists(input_path) else None
+        key.update(f"{input_name}:{digests[input_name]}".encode())
+    return key.hexdigest()
+
+
+def render_folder(folder_name, remake_all=False, full_resolution=False):
+    """
+    1つのフォルダの図のうち、入力が変わったものだけを描画する
+
+    散布図は既定ではプレビュー (src.utils.preview) の点を描き、full_resolution の場合は全ての点を描く
+
+    Returns:
+    list: 描画した図のファイル名
+    """
+    folder_path = os.path.join(DATA_DIR, folder_name)
+    if not os.path.exists(os.path.join(folder_path, "metrics.nc")):
+        print(f"procece {folder_name}")
+        procece_data(folder_name)
+
+    cache_path = os.path.join(folder_path, CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path) and not remake_all:
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    data = FolderData(folder_name, full_resolution)
+    digests = {}
+    rendered = []
+    for figure_name, entry in FIGURES.items():
+        if not all(os.path.exists(os.path.join(folder_path, input_name)) for input_name in entry["inputs"]):
+            continue
+        key = figure_key(figure_name, folder_path, digests, full_resolution)
+        if cache.get(figure_name) == key and os.path.exists(os.path.join(folder_path, figure_name)):
+            continue
+        entry["func"](data, os.path.join(folder_path, figure_name))
+        plt.close("all")
+        cache[figure_name] = key
+        rendered.append(figure_name)
+        # 途中で止まっても描画済みの図は次回スキップできるように毎回保存する
+        with open(cache_path, "w") as f:
+            json.dump(cache, f, indent=2)
+    return rendered
+
+
+def main(folder_name="all", remake_all=False, latest=False, n_workers=None, full_resolution=False):
+    if folder_name == 'all':
+        folder_names = sorted(os.listdir(DATA_DIR), reverse=True)
+        if latest:
+            folder_names = folder_names[:1]
+    else:
+        folder_names = [folder_name]
+    folder_names = [name for name in folder_names if os.path.exists(os.path.join(DATA_DIR, name, "config.json"))]
+
+    if n_workers == 1:
+        for name in folder_names:
+            print(f"{name}: {render_folder(name, remake_all, full_resolution)}")
+        return
+    # フォルダごとにプロセスを分けて並列に描画する
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(render_folder, name, remake_all, full_resolution): name for name in folder_names}
+        for future in as_completed(futures):
+            print(f"{futures[future]}: {future.result()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Process some data.')
+
+    parser.add_argument('folder_name',nargs="?" , type=str, default="all", help='input file path')
+    parser.add_argument('--remake_all', action='store_true', help='ignore the figure cache and redraw everything')
+    parser.add_argument('--latest', action='store_true')
+    parser.add_argument('--n_workers', type=int, default=None, help='number of processes rendering folders (default: cpu count)')
+    parser.add_argument('--full_resolution', action='store_true', help='scatter every point instead of the stored preview subsample')
+    args = parser.parse_args()
+
+    main(args.folder_name, remake_all=args.remake_all, latest=args.latest, n_workers=args.n_workers,
+         full_resolution=args.full_resolution)
@@ -1,8 +1,7 @@
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from scipy.stats import multivariate_normal
+from matplotlib.patches import Polygon
 import numpy as np
 import os
 import json
@@ -17,17 +16,29 @@ import colorsys
 
 
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
-from src.utils import metrics
+from src.utils import metrics, aggregate
+from src.utils.geometry import ellipse_vertices
+from src.utils.fingerprint import config_fingerprint, find_runs, index_runs
 from experiments.procece_data import procece_data
 DATA_DIR = os.path.dirname(__file__) +"/../../data/"
 OUTPUT_DIR = os.path.dirname(__file__) +"/../../figure/"
 
+def parse_generations(text):
+    """'-1' や '500:' のような世代の指定を int か slice に変換する"""
+    if ":" not in text:
+        return int(text)
+    return slice(*[int(value) if value else None for value in text.split(":")])
+
+
 parser = argparse.ArgumentParser(description='Process some data.')
 
 parser.add_argument('folder_name',nargs="?" , type=str, default="None", help='input file path')
+parser.add_argument('--generations', type=str, default="-1", help="generations to aggregate, e.g. -1 or 500: (python slice)")
+parser.add_argument('--reindex', action='store_true', help="index the run folders copied into the data directory by hand")
 regerence_folder_name = parser.parse_args().folder_name
-
-folder_names = os.listdir(DATA_DIR)
+generations = parse_generations(parser.parse_args().generations)
+if parser.parse_args().reindex:
+    index_runs(DATA_DIR)
 
 if regerence_folder_name is not None:
     if os.path.exists(DATA_DIR+regerence_folder_name+"/config.json"):
@@ -35,26 +46,10 @@ if regerence_folder_name is not None:
     elif os.path.exists(OUTPUT_DIR+regerence_folder_name+"/config.json"):
         config = json.load(open(OUTPUT_DIR+regerence_folder_name+"/config.json"))
 
-existing_folder_names = os.listdir(OUTPUT_DIR)
-create_new_folder = True
-for folder_name in existing_folder_names:
-    if not os.path.exists(OUTPUT_DIR+folder_name+"/config.json"):
-        continue
-    temp_config = json.load(open(OUTPUT_DIR+folder_name+"/config.json"))
-    if temp_config != config:
-        continue
-    OUTPUT_DIR = OUTPUT_DIR+folder_name+"/"
-    create_new_folder = False
-    break
-if create_new_folder:
-    count = 0
-    while True:
-        if str(count) not in existing_folder_names:
-            os.makedirs(OUTPUT_DIR+str(count))
-            OUTPUT_DIR = OUTPUT_DIR+str(count)+"/"
-            break
-        count += 1
-
+# 出力フォルダは設定の fingerprint で決める
+OUTPUT_DIR = OUTPUT_DIR+config_fingerprint(config)+"/"
+if not os.path.exists(OUTPUT_DIR+"config.json"):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     # Save config file
     with open(OUTPUT_DIR+"config.json", "w") as f:
         json.dump(config, f)
@@ -89,33 +84,25 @@ def generate_double_gradation(n):
     return colors
 
 
-params_list = []
-data_list = []
+folder_paths = [DATA_DIR+folder_name for folder_name in find_runs(DATA_DIR, config)]
+print('data_num',len(folder_paths))
+# 全ての実行の指定した世代の m を memmap から一つの配列 (R, K, D) に読み込む。
+# 世代の範囲を指定した場合は各世代を一つの標本として扱う
+m_array = aggregate.stack_runs(folder_paths, "m", generations)
+if not isinstance(generations, int):
+    m_array = aggregate.pool_generations(m_array)
+mean_m, var_m, cov_m = aggregate.cross_run_moments(m_array)
+K = m_array.shape[1]
+# 距離のヒストグラムは元の図と同じく、偶数番目・奇数番目の順に並べた列の先頭の二列を比べる
+# (K >= 3 ではクラスタ 0 と 2)
+column_order = np.r_[0:K:2, 1:K:2]
+cluster_groups = [[0], [1]]
 
-for folder_name in folder_names:
-    if not os.path.exists(DATA_DIR+folder_name+"/config.json"):
-        continue
-    temp_config = json.load(open(DATA_DIR+folder_name+"/config.json"))
-    if temp_config != config:
-        continue
-    params_list.append(np.load(DATA_DIR+folder_name+"/params.npy", allow_pickle=True).item())
-    X = np.load(DATA_DIR+folder_name+"/data.npy")
-    Z = np.load(DATA_DIR+folder_name+"/Z.npy")
-    C = np.load(DATA_DIR+folder_name+"/context.npy")
-    data_list.append({
-        "X":X,
-        "Z":Z,
-        "C":C
-    })
-print('data_num',len(params_list))
 #plot variance of m
 fig, axs = plt.subplots(1)
-m_list = [params["m"][-1] for params in params_list]
-m_array = np.array(m_list)
-std_m =  np.sqrt(np.var(m_array, axis=0).mean(axis=1)) 
+std_m =  np.sqrt(var_m.mean(axis=1)) 
 
 # Plot the variance of m
-K = m_array.shape[1]
 cluster_colors = []
 for i in range(K):
     if i % 2 == 0:
@@ -158,9 +145,6 @@ plt.close(fig)
 
 # plot final generation mean
 fig, axs = plt.subplots()
-m_list = [params["m"][-1] for params in params_list]
-m_array = np.array(m_list)
-K = m_array.shape[1]    
 cluster_colors = generate_double_gradation(K)
 axs.set_xlim(-30, 30)
 axs.set_ylim(-30, 30)
@@ -175,7 +159,6 @@ plt.close(fig)
 
 # plot mean of final generation mean 
 fig, axs = plt.subplots()
-mean_m = np.mean(m_array, axis=0)
 axs.set_xlim(-30, 30)
 axs.set_ylim(-30, 30)
 plt.gca().set_aspect('equal')
@@ -217,23 +200,16 @@ plt.close(fig)
 
 # histogram of distance between m0 and m
 fig, axs = plt.subplots()
-m_list = [params["m"][-1] for params in params_list]
-m_array = np.array(m_list)
-K = m_array.shape[1]
-cluster_colors = generate_double_gradation(K)
-distance = np.linalg.norm(m_array - np.array(config["m0"]), axis=2)
-distance = np.concatenate([distance[:,::2], distance[:,1::2]], axis=1)
+distance = aggregate.distance_from(m_array, config["m0"])[:, column_order]
 
-# Calculate histograms manually for both clusters
+# 二つのヒストグラムを共通のビンでまとめて計算
 bins = 20
-range_min = np.min(distance)
-range_max = np.max(distance)
-bin_edges = np.linspace(range_min, range_max, bins + 1)
-bin_width = (range_max - range_min) / bins
+hists, bin_edges = aggregate.grouped_histogram(distance, cluster_groups, bins=bins)
+bin_width = bin_edges[1] - bin_edges[0]
 bar_width = bin_width * 0.35  # Make bars narrower to fit side by side
 labels = ['Sound Symbolic Words', 'Non-Sound Symbolic Words']
 for i in range(2):
-    hist, _ = np.histogram(distance[:, i], bins=bin_edges)
+    hist = hists[i]
     bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
     
     # Offset the bars for each cluster
@@ -252,24 +228,17 @@ plt.close(fig)
 
 # Plot histogram of distance between (0,0) and m for all clusters
 fig, axs = plt.subplots()
-distance = np.linalg.norm(m_array - np.array(config["m0"]), axis=2)
-for i in range(len(m_array)):
-    # Calculate distance from origin for each mean
-    origin_dist = np.linalg.norm(m_array[i], axis=1)
-    # Invert distance values for means inside radius 10 circle
-    inside_circle = origin_dist <= 10
-    distance[i, inside_circle] = -distance[i, inside_circle]
-distance = np.concatenate([distance[:,::2], distance[:,1::2]], axis=1)
+distance = aggregate.distance_from(m_array, config["m0"])
+# Invert distance values for means inside radius 10 circle
+distance = np.where(aggregate.distance_from(m_array, 0) <= 10, -distance, distance)[:, column_order]
 distance = distance - np.linalg.norm(np.array(config["m0"]), axis=1)
 bins = 20
-range_min = np.min(distance)
-range_max = np.max(distance)
-bin_edges = np.linspace(range_min, range_max, bins + 1)
-bin_width = (range_max - range_min) / bins
+hists, bin_edges = aggregate.grouped_histogram(distance, cluster_groups, bins=bins)
+bin_width = bin_edges[1] - bin_edges[0]
 bar_width = bin_width * 0.35  # Make bars narrower to fit side by side
 labels = ['Sound Symbolic Words', 'Non-Sound Symbolic Words']
 for i in range(2):
-    hist, _ = np.histogram(distance[:, i], bins=bin_edges)
+    hist = hists[i]
     bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
     
     # Offset the bars for each cluster
@@ -290,8 +259,6 @@ fig, axs = plt.subplots()
 axs.set_xlim(-30, 30)
 axs.set_ylim(-30, 30)
 plt.gca().set_aspect('equal')
-mean_m = np.mean(m_array, axis=0)
-cov_m = np.array([np.cov(m_array[i, :, 0], m_array[i, :, 1]) for i in range(K)])
 for i in range(K):
     axs.scatter(config["m0"][i][0], config["m0"][i][1], color=cluster_colors[i], marker='x',  alpha=1, label=f'Initial {i+1}')
     axs.scatter(m_array[:, i, 0], m_array[:, i, 1], color=cluster_colors[i],s=5, alpha=0.2, label=f'Cluster {i+1}')
@@ -300,16 +267,10 @@ for i in range(K):
     #              [config["m0"][i][1], m_array[j,i,1]], 
     #              color=cluster_colors[i], alpha=0.6, linewidth=0.2)
 # Draw circles for 1 standard deviation
+ellipses = ellipse_vertices(mean_m, np.linalg.inv(cov_m), radius=np.sqrt(2/10))
 for i in range(K):
-    x, y = np.meshgrid(np.linspace(-30, 30, 100), np.linspace(-30, 30, 100))
-    xy = np.column_stack([x.flat, y.flat])
-    z = multivariate_normal.pdf(xy, mean=mean_m[i], cov=cov_m[i]).reshape(x.shape)
-
-    rv = multivariate_normal(mean_m[i], cov_m[i])
-    level = rv.pdf(mean_m[i]) * np.exp(-0.5 * (np.sqrt(2/10)) ** 2)
-    levels = [level]
-    contour = axs.contour(x, y, z, levels=levels, colors=[cluster_colors[i]])
-    contourf = axs.contourf(x, y, z, levels=[level,1], colors=[cluster_colors[i]], alpha=0.2)
+    axs.add_patch(Polygon(ellipses[i], fill=False, edgecolor=cluster_colors[i]))
+    axs.add_patch(Polygon(ellipses[i], facecolor=cluster_colors[i], edgecolor='none', alpha=0.2))
 for i in range(K):
     axs.arrow(config["m0"][i][0], config["m0"][i][1],
               mean_m[i,0] - config["m0"][i][0],
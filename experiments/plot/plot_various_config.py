@@ -1,12 +1,9 @@
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from scipy.stats import multivariate_normal
 import numpy as np
 import os
 import json
-import xarray as xr
 import sys
 import argparse
 from pathlib import Path
@@ -18,16 +15,20 @@ import colorsys
 
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
 from src.utils import metrics
+from src.utils.history import open_history
+from src.utils.fingerprint import config_fingerprint, find_runs, index_runs
 from experiments.procece_data import procece_data
 DATA_DIR = os.path.dirname(__file__) +"/../../data/"
 OUTPUT_DIR = os.path.dirname(__file__) +"/../../figure/"
+CONVERGENCE_THRESHOLDS = [1/2]
 
 parser = argparse.ArgumentParser(description='Process some data.')
 
 parser.add_argument('folder_name',nargs="?" , type=str, default="None", help='input file path')
+parser.add_argument('--reindex', action='store_true', help="index the run folders copied into the data directory by hand")
 regerence_folder_name = parser.parse_args().folder_name
-
-folder_names = os.listdir(DATA_DIR)
+if parser.parse_args().reindex:
+    index_runs(DATA_DIR)
 
 if regerence_folder_name is not "None":
     config = json.load(open(DATA_DIR+regerence_folder_name+"/config.json"))
@@ -38,35 +39,9 @@ values_list = [
     [i for _ in range(4)] for i in base_values
     ]
 
-existing_folder_names = os.listdir(OUTPUT_DIR)
-create_new_folder = True
-
-def compute_convergence_time(history_m, true_m, threshold=0.01):
-
-    history_m = history_m['m'].values
-    for i in range(len(history_m)):
-        if np.linalg.norm(history_m[i] - true_m) < threshold:
-            return i
-    print("Error: Convergence time is not found.")
-    return len(history_m)
-
-for folder_name in existing_folder_names:
-    if not os.path.exists(OUTPUT_DIR+folder_name+"/config.json"):
-        continue
-    temp_config = json.load(open(OUTPUT_DIR+folder_name+"/config.json"))
-    if temp_config != config:
-        continue
-    OUTPUT_DIR = OUTPUT_DIR+folder_name+"/"
-    create_new_folder
-    break
-if create_new_folder:
-    count = 0
-    while True:
-        if str(count) not in existing_folder_names:
-            os.makedirs(OUTPUT_DIR+str(count))
-            OUTPUT_DIR = OUTPUT_DIR+str(count)+"/"
-            break
-        count += 1
+# 出力フォルダは基準の設定の fingerprint で決める
+OUTPUT_DIR = OUTPUT_DIR+config_fingerprint(config)+"/"
+os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 params_list = []
 data_list = []
@@ -74,18 +49,13 @@ data_list = []
 for value in values_list:
     config[values_key] = value
     exist = False
-    for folder_name in folder_names:
-        if not os.path.exists(DATA_DIR+folder_name+"/config.json"):
-            continue
-        temp_config = json.load(open(DATA_DIR+folder_name+"/config.json"))
-        if temp_config != config:
-            continue
+    for folder_name in find_runs(DATA_DIR, config)[:1]:
         params_list.append(np.load(DATA_DIR+folder_name+"/params.npy", allow_pickle=True).item())
         X = np.load(DATA_DIR+folder_name+"/data.npy")
         Z = np.load(DATA_DIR+folder_name+"/Z.npy")
         params = np.load(DATA_DIR+folder_name+"/params.npy", allow_pickle=True).item()
         C = np.load(DATA_DIR+folder_name+"/context.npy")
-        history_m = xr.open_dataset(DATA_DIR+folder_name+"/history.nc", drop_variables=list(params.keys() - {"m"}))
+        history_m = open_history(DATA_DIR+folder_name+"/history.nc")[["m"]]
         data_list.append({
             "X":X,
             "Z":Z,
@@ -107,8 +77,15 @@ if len(params_list) != len(values_list):
 convergence_time_list = []
 for data in data_list:
     history_m = data["history_m"]
-    convergence_times = [compute_convergence_time(history_m.isel(iter=i), data['params']['m'][i-1],1/2) for i in range(1,history_m.dims['iter']-1)]
-    convergence_time = np.mean(convergence_times)
+    # 世代 i の目標値は親（世代 i-1）の学習後の m。全世代・全閾値を一度に計算する
+    n_iter = history_m.sizes['iter']
+    convergence_times = metrics.convergence_times(
+        history_m['m'].isel(iter=slice(1, n_iter - 1)), data['params']['m'][:n_iter - 2], CONVERGENCE_THRESHOLDS)
+    convergence_times = convergence_times.sel(threshold=1/2)
+    not_converged = int((convergence_times > history_m['n'].values[-1]).sum())
+    if not_converged:
+        print(f"Error: Convergence time is not found in {not_converged} generations.")
+    convergence_time = float(convergence_times.mean())
     print(convergence_time)
     convergence_time_list.append(convergence_time)
 fig, axs = plt.subplots(1)
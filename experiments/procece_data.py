@@ -4,13 +4,16 @@ import argparse
 from pathlib import Path
 import os
 import numpy as np
-import xarray as xr
 from datetime import datetime
 
 
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from src.utils import metrics
+from src.utils.lazy import LazyModule
+
+# xarray は最初に使うときに読み込む
+xr = LazyModule("xarray")
 
 BASE_DATA_DIR = os.path.dirname(__file__) +"/../data/"
 
@@ -26,9 +29,7 @@ def procece_data(folder_name):
     for folder_name in folder_names:
         try:
             DATA_DIR = os.path.join(BASE_DATA_DIR, folder_name)
-            X = np.load(DATA_DIR+"/data.npy")
             params = np.load(DATA_DIR+"/params.npy", allow_pickle=True).item()
-            retry_counts = np.load(DATA_DIR+"/retry_counts.npy")
 
             with open(os.path.join(DATA_DIR, "config.json"), "r") as f:
                 config = json.load(f)
@@ -1,7 +1,6 @@
 import numpy as np
 import os
 import json
-import xarray as xr
 import sys
 import argparse
 from pathlib import Path
@@ -12,7 +11,6 @@ from pathlib import Path
 
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from src.utils import metrics
 
 
 
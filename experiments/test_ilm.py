@@ -1,18 +1,33 @@
 import numpy as np
-import xarray as xr
 import sys
 from datetime import datetime
 import os
 import json
 from pathlib import Path
 from typing import Optional, Dict, Any, List
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import tqdm
 import hashlib
 import argparse
+import warnings
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from src.agents import BayesianGaussianMixtureModel, BayesianGaussianMixtureModelWithContext
+from src.agents import BayesianGaussianMixtureModel, BayesianGaussianMixtureModelWithContext, precision_drift, CANDIDATE_COUNT_FIELDS
+from src.utils.excluded import ExcludedSink
+from src.utils.preview import save_preview
+from src.utils.aggregate import save_param_files
+from src.utils.fingerprint import register_run
+from src.utils.lazy import LazyModule
+
+# xarray は最初に使うときに読み込む（起動時間を短くするため）
+xr = LazyModule("xarray")
 
 @dataclass
 class ExperimentConfig:
@@ -31,6 +46,20 @@ class ExperimentConfig:
     generate_filter_name: str
     fit_filter_args: Dict[str, Any]
     generate_filter_args: Dict[str, Any]
+    # データ・負担率・サンプルの精度（"float64" または "float32"）。パラメータと和・下界は常に float64
+    dtype: str = "float64"
+    # 生成するサンプル X の分布（src.agents.sampling.SAMPLERS: "gaussian", "gaussian_cholesky", "student_t"）
+    sampler: str = "gaussian"
+    # 生成に使う一様乱数の設計（src.agents.sampling.DESIGNS: "mc", "stratified", "sobol", "halton"）
+    sample_design: str = "mc"
+    # 子への伝達方法（"samples": N 個のサンプルを生成して学習, "statistics": 十分統計量だけを直接生成して学習）。
+    # "statistics" は近似で、フィルタなし・track_learning なし、かつ親のクラスタが STATISTICS_MIN_SEPARATION（標準偏差 7 個分）
+    # 以上離れている世代でのみ使われる（それ以外の世代は警告を出してサンプルから学習する）。data.npy などのサンプルは保存されない
+    transmission: str = "samples"
+    # 集団の大きさ。2 以上の場合、各世代で population_size 体の子がそれぞれ topology（"ring" または "lattice"）上の
+    # 隣の親たちから N 個のサンプルを受け取って学習する（src.agents.population を参照）。パラメータは population.nc に保存される
+    population_size: int = 1
+    topology: str = "ring"
 
     @classmethod
     def create_default_config(cls) -> 'ExperimentConfig':
@@ -119,16 +148,38 @@ class ExperimentConfig:
             generate_filter_name=config["generate_filter_name"],
             fit_filter_args=config["fit_filter_args"],
             generate_filter_args=config["generate_filter_args"],
+            dtype=config.get("dtype", "float64"),
+            sampler=config.get("sampler", "gaussian"),
+            sample_design=config.get("sample_design", "mc"),
+            transmission=config.get("transmission", "samples"),
+            population_size=config.get("population_size", 1),
+            topology=config.get("topology", "ring"),
         )
             
         return ret_config
 
 class ExperimentManager:
-    def __init__(self, config: ExperimentConfig, save_dir: str, track_learning: bool = False):
+    def __init__(self, config: ExperimentConfig, save_dir: str, track_learning: bool = False, seed: Optional[Any] = None,
+                 folder_name: Optional[str] = None, prior_factors: Optional[Dict[str, Any]] = None,
+                 history_every: int = 1, history_log_points: Optional[int] = None, history_to_disk: bool = False,
+                 history_format: str = "delta", history_keep_bits: Optional[int] = None, jit: bool = False,
+                 backend: str = "numpy", excluded_max_rows: Optional[int] = None, excluded_to_disk: bool = False):
         self.config = config
         self.save_dir = save_dir
-        self.setup_data_directory()
+        self.setup_data_directory(folder_name)
         self.track_learning = track_learning
+        # history.nc の保存形式（src.utils.history.save_history を参照）
+        self.history_format = history_format
+        self.history_keep_bits = history_keep_bits
+        # numba がある場合、子エージェントのサンプルごとの学習ループをコンパイル済みカーネルで実行する
+        self.jit = jit
+        # E/M ステップなどの計算に使う配列ライブラリ（src.agents.backends を参照）
+        self.backend = backend
+        self.seed_sequence = self.setup_seed_sequence(seed)
+        # 事前分布の逆行列などは全エージェント・全チェーンで共有する（読み取り専用）
+        self.prior_factors = prior_factors
+        if self.prior_factors is None:
+            self.prior_factors = self.create_agent().prior_factors
         
         # Initialize storage for results
         self.params = {
@@ -141,29 +192,67 @@ class ExperimentManager:
         self.X = []
         self.C = []
         self.Z = []
-        self.excluded_data = []
-        self.retry_counts = []
+        # 集団で実行した場合の各世代・各エージェントのパラメータ（run_population を参照）
+        self.population = None
+        # 除外されたサンプルは行のまま追記する（excluded_max_rows でリザーバーサンプリング、excluded_to_disk でディスクに分割保存）
+        self.excluded = ExcludedSink(
+            config.iter, config.K, config.D,
+            max_rows=excluded_max_rows,
+            directory=os.path.join(self.save_path, "excluded_chunks") if excluded_to_disk else None,
+            rng=self.spawn_rng(config.iter + 1),
+        )
+        # 各世代で各サンプルの学習までに fit filter が棄却した候補の数と、
+        # 世代ごとの候補数の合計（CANDIDATE_COUNT_FIELDS の順: 生成・判定・採用）
+        self.retry_counts = np.zeros((config.iter, config.N), dtype=np.int32)
+        self.candidate_counts = np.zeros((config.iter, len(CANDIDATE_COUNT_FIELDS)), dtype=np.int64)
         if self.track_learning:
-            self.history = xr.Dataset({
-                "alpha": (["iter", "n", "k"], np.zeros((config.iter, config.N,  config.K))),
-                "beta": (["iter", "n", "k"], np.zeros((config.iter, config.N,  config.K))),
-                "nu": (["iter", "n", "k"], np.zeros((config.iter, config.N,  config.K))),
-                "m": (["iter", "n", "k", "d"], np.zeros((config.iter, config.N,  config.K, config.D))),
-                "W": (["iter", "n", "k", "d", "d"], np.zeros((config.iter, config.N,  config.K, config.D, config.D)))
-            },
-            coords={"iter": np.arange(config.iter), "n": np.arange(config.N), "K": np.arange(config.K), "d": np.arange(config.D)})
+            # 各サンプル学習後のパラメータを事前確保した配列（またはディスク上の memmap）に直接書き込む
+            from src.utils.history import HistoryRecorder
+            self.history = HistoryRecorder(
+                config.iter, config.N, config.K, config.D,
+                every=history_every, n_log=history_log_points,
+                directory=os.path.join(self.save_path, "history_blocks") if history_to_disk else None,
+            )
 
 
 
-    def setup_data_directory(self):
+    def setup_data_directory(self, folder_name: Optional[str] = None):
         """実験データ保存用のディレクトリを設定"""
-        folder_name = datetime.now().strftime("%Y%m%d%H%M%S")
+        if folder_name is None:
+            folder_name = datetime.now().strftime("%Y%m%d%H%M%S")
         self.save_path = os.path.join(self.save_dir, folder_name)
         os.makedirs(self.save_path, exist_ok=True)
 
-    def generate_initial_data(self) -> tuple:
+    def setup_seed_sequence(self, seed: Optional[Any] = None) -> np.random.SeedSequence:
+        """乱数のシード系列を設定
+
+        seed は int か np.random.SeedSequence。None の場合は保存フォルダ名から決める。
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            return seed
+        if seed is None:
+            folder_name = self.save_path.split("/")[-1]
+            folder_name_hash = hashlib.md5(folder_name.encode()).hexdigest()
+            seed = int(folder_name_hash, 16) % (2**32)
+        return np.random.SeedSequence(seed)
+
+    def spawn_rng(self, generation: int) -> np.random.Generator:
+        """世代ごとの乱数生成器
+
+        SeedSequence.spawn と同じ子シードを世代番号から直接作るので、
+        呼び出し順や他のチェーンに依存せず同じ乱数列になる。
+        """
+        seed_sequence = np.random.SeedSequence(
+            self.seed_sequence.entropy,
+            spawn_key=self.seed_sequence.spawn_key + (generation,),
+            pool_size=self.seed_sequence.pool_size,
+        )
+        return np.random.default_rng(seed_sequence)
+
+    def generate_initial_data(self, rng: Optional[np.random.Generator] = None) -> tuple:
         """初期データの生成"""
-        # np.random.seed(0)
+        if rng is None:
+            rng = self.spawn_rng(0)
         true_K = 4
         true_means = np.array([[4, 5], [3.4, -6], [-8, 5], [-3, -7]])
         true_covars = np.array([np.eye(2) * 0.1 for _ in range(true_K)])
@@ -173,11 +262,11 @@ class ExperimentManager:
 
 
         X_0 = np.zeros((N, D))
-        C_0 = np.random.dirichlet(true_alpha, size=N)
-        z_0 = np.array([np.random.multinomial(1, c) for c in C_0])
+        C_0 = rng.dirichlet(true_alpha, size=N)
+        z_0 = np.array([rng.multinomial(1, c) for c in C_0])
         
         for k in range(true_K):
-            X_0[z_0[:, k] == 1] = np.random.multivariate_normal(
+            X_0[z_0[:, k] == 1] = rng.multivariate_normal(
                 true_means[k],
                 true_covars[k],
                 size=np.sum(z_0[:, k] == 1)
@@ -198,7 +287,7 @@ class ExperimentManager:
             
         return initial_data
 
-    def create_agent(self, is_parent: bool = False) -> Any:
+    def create_agent(self, is_parent: bool = False, rng: Optional[np.random.Generator] = None) -> Any:
         """エージェントの作成"""
         if self.config.agent == "BayesianGaussianMixtureModelWithContext":
             return BayesianGaussianMixtureModelWithContext(
@@ -210,7 +299,14 @@ class ExperimentManager:
                 fit_filter_args=self.config.fit_filter_args,
                 generate_filter="none" if is_parent else self.config.generate_filter_name,
                 generate_filter_args=self.config.generate_filter_args,
-                track_learning=self.track_learning
+                track_learning=self.track_learning,
+                rng=rng,
+                prior_factors=self.prior_factors,
+                dtype=self.config.dtype,
+                jit=self.jit,
+                backend=self.backend,
+                sampler=self.config.sampler,
+                sample_design=self.config.sample_design
             )
         else:
             return BayesianGaussianMixtureModel(
@@ -218,7 +314,14 @@ class ExperimentManager:
                 self.config.alpha0, self.config.beta0,
                 self.config.nu0, self.config.m0, self.config.W0,
                 self.config.c_alpha,
-                track_learning=self.track_learning
+                track_learning=self.track_learning,
+                rng=rng,
+                prior_factors=self.prior_factors,
+                dtype=self.config.dtype,
+                jit=self.jit,
+                backend=self.backend,
+                sampler=self.config.sampler,
+                sample_design=self.config.sample_design
             )
 
     def fit_parent_agent(self, X_0: np.ndarray, C_0: np.ndarray, z_0: np.ndarray) -> Any:
@@ -239,27 +342,64 @@ class ExperimentManager:
         parent_agent.fit(data, max_iter=1000, tol=1e-6, random_state=0, disp_message=True)
         return parent_agent
 
-    def run_experiment(self):
-        """実験の実行"""
-        folder_name = self.save_path.split("/")[-1]
-        folder_name_hash = hashlib.md5(folder_name.encode()).hexdigest()
-        random_seed = int(folder_name_hash, 16) % (2**32)
-        np.random.seed(random_seed)
+    def population_weights(self) -> np.ndarray:
+        """config.topology の重み行列（weights[p, q] は子 p のサンプルが親 q から来る確率）
+
+        "ring" は両隣と自分、"lattice" は上下左右と自分（周期境界）から学習する。
+        lattice の行数は population_size の約数のうち平方根以下で最大のもの。
+        """
+        from src.agents import ring_topology, lattice_topology
+        P = self.config.population_size
+        if self.config.topology == "ring":
+            return ring_topology(P)
+        if self.config.topology == "lattice":
+            n_rows = max(n for n in range(1, int(np.sqrt(P)) + 1) if P % n == 0)
+            return lattice_topology(n_rows, P // n_rows)
+        raise ValueError(f"Unknown topology: {self.config.topology}")
+
+    def run_population(self):
+        """集団での実験の実行
+
+        全エージェントの事前分布と generate filter は create_agent と同じ。集団は各世代の学習をまとめて行うので、
+        fit filter・track_learning・サンプルの保存・十分統計量での伝達には対応しない（src.agents.population を参照）。
+        """
+        from src.agents import BayesianGaussianMixtureModelPopulation
+        if self.config.agent != "BayesianGaussianMixtureModelWithContext":
+            raise ValueError("The population only supports BayesianGaussianMixtureModelWithContext.")
+        if self.config.transmission != "samples":
+            raise ValueError("The population only supports the transmission by samples.")
+        population = BayesianGaussianMixtureModelPopulation(
+            self.create_agent(), self.population_weights(), rng=self.spawn_rng(0))
+        self.population = population.run(self.config.iter, self.config.N)
 
-        parent_agent = self.create_agent()
+    def run_experiment(self, progress: bool = True):
+        """実験の実行"""
+        if self.config.population_size > 1:
+            self.run_population()
+            return
+        # 世代 0 が最初の親、世代 i+1 が i 番目の子の乱数生成器を使う
+        parent_agent = self.create_agent(rng=self.spawn_rng(0))
         # data = self.generate_initial_data()
         # parent_agent.fit(data, max_iter=1000, tol=1e-6)
 
-        for i in tqdm.tqdm(range(self.config.iter)):
-            child_agent = self.create_agent()
-            retry_count = []
-            child_agent.fit_from_agent(parent_agent, N=self.config.N)
-            
-            self.retry_counts.append(retry_count)
-            self.X.append(child_agent.X)
+        for i in tqdm.tqdm(range(self.config.iter), disable=not progress):
+            child_agent = self.create_agent(rng=self.spawn_rng(i + 1))
+            fit_kwargs = {}
+            if self.track_learning:
+                fit_kwargs["history"] = self.history.generation(i)
             if self.config.agent == "BayesianGaussianMixtureModelWithContext":
-                self.C.append(child_agent.C)
-            self.Z.append(child_agent.Z)
+                fit_kwargs["excluded"] = self.excluded.generation(i)
+                fit_kwargs["transmission"] = self.config.transmission
+            child_agent.fit_from_agent(parent_agent, N=self.config.N, **fit_kwargs)
+            if child_agent.retry_count is not None:
+                self.retry_counts[i] = child_agent.retry_count
+                self.candidate_counts[i] = child_agent.candidate_counts
+            # 十分統計量で学習した子はサンプルを持たない
+            if child_agent.X is not None:
+                self.X.append(child_agent.X)
+                if self.config.agent == "BayesianGaussianMixtureModelWithContext":
+                    self.C.append(child_agent.C)
+                self.Z.append(child_agent.Z)
             
             # パラメータの保存
             self.params["alpha"][i] = child_agent.alpha
@@ -267,41 +407,138 @@ class ExperimentManager:
             self.params["nu"][i] = child_agent.nu
             self.params["m"][i] = child_agent.m
             self.params["W"][i] = child_agent.W
-            self.excluded_data.append(child_agent.excluded_data)
-            if self.track_learning:
-                self.history['alpha'][i] = child_agent.history['alpha']
-                self.history['beta'][i] = child_agent.history['beta']
-                self.history['nu'][i] = child_agent.history['nu']
-                self.history['m'][i] = child_agent.history['m']
-                self.history['W'][i] = child_agent.history['W']
 
             
             parent_agent = child_agent
 
     def save_results(self):
         """結果の保存"""
-        np.save(os.path.join(self.save_path, "data.npy"), self.X)
-        if self.config.agent == "BayesianGaussianMixtureModelWithContext":
-            np.save(os.path.join(self.save_path, "context.npy"), self.C)
-            np.save(os.path.join(self.save_path, "Z.npy"), self.Z)
+        if self.population is not None:
+            # 集団のパラメータは (iter, p, ...) の配列なので、1 本のチェーン用のファイルの代わりに population.nc に保存する
+            self.population.to_netcdf(os.path.join(self.save_path, "population.nc"))
+            self.excluded.close()
+            self.save_config()
+            return
+        if len(self.X) > 0:
+            np.save(os.path.join(self.save_path, "data.npy"), self.X)
+            if self.config.agent == "BayesianGaussianMixtureModelWithContext":
+                np.save(os.path.join(self.save_path, "context.npy"), self.C)
+                np.save(os.path.join(self.save_path, "Z.npy"), self.Z)
+            # 図の描画用に各世代の層化抽出サブサンプルを保存しておく
+            save_preview(self.save_path, self.X, self.Z if self.config.agent == "BayesianGaussianMixtureModelWithContext" else None)
         np.save(os.path.join(self.save_path, "retry_counts.npy"), self.retry_counts)
+        np.save(os.path.join(self.save_path, "candidate_counts.npy"), self.candidate_counts)
         np.save(os.path.join(self.save_path, "params.npy"), self.params)
+        # 複数の実行をまとめて集計するとき memmap で読めるように変数ごとにも保存する
+        save_param_files(self.save_path, self.params)
         # save excluded data
-        print(self.excluded_data)
-        excluded_data_combined = xr.concat(self.excluded_data, dim='iter')
-        print(excluded_data_combined)
-        excluded_data_combined.to_netcdf(os.path.join(self.save_path, "excluded_data.nc"))
-        
+        self.excluded.save(os.path.join(self.save_path, "excluded_data.nc"))
+        self.excluded.close()
+        if self.track_learning:
+            self.history.save(os.path.join(self.save_path, "history.nc"),
+                              history_format=self.history_format, keep_bits=self.history_keep_bits)
+            self.history.close()
+        self.save_config()
+
+    def save_config(self):
+        """設定とシードを保存して、実行を索引に登録する"""
         # Convert config to JSON-serializable format
         config_dict = {k: v.tolist() if isinstance(v, np.ndarray) else v 
                       for k, v in self.config.__dict__.items()}
         
         with open(os.path.join(self.save_path, "config.json"), "w") as f:
             json.dump(config_dict, f)
-        if self.track_learning:
-            self.history.to_netcdf(os.path.join(self.save_path, "history.nc"))
+        with open(os.path.join(self.save_path, "seed.json"), "w") as f:
+            json.dump({
+                "entropy": self.seed_sequence.entropy,
+                "spawn_key": list(self.seed_sequence.spawn_key),
+            }, f)
+        # 全てのファイルを書き終えてから設定の fingerprint で索引に登録する
+        register_run(self.save_dir, os.path.basename(self.save_path), config_dict)
+
+    @classmethod
+    def run_chains(cls, config: ExperimentConfig, save_dir: str, n_chains: int = 1, seed: Optional[Any] = None,
+                   n_workers: int = 1, blas_threads: Optional[int] = 1, track_learning: bool = False,
+                   save: bool = True, **kwargs) -> List['ExperimentManager']:
+        """独立な複数チェーンをスレッドプールで実行
+
+        各チェーンは seed から spawn した SeedSequence を持つので、n_workers によらず同じ結果になる。
+        設定と事前分布の因子は全チェーンで共有し、プロセスを分ける場合のような
+        モジュールやデータの複製を避ける。NumPy の BLAS/LAPACK 呼び出しは GIL を解放するので、
+        スレッド間の競合を避けるため BLAS のスレッド数を blas_threads に制限する
+        （threadpoolctl がある場合のみ。制限はプロセス全体に掛かる）。
+        """
+        root_seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        experiments = []
+        for chain, chain_seed_sequence in enumerate(root_seed_sequence.spawn(n_chains)):
+            experiments.append(cls(
+                config, save_dir,
+                track_learning=track_learning,
+                seed=chain_seed_sequence,
+                folder_name=f"{timestamp}_{chain:03d}" if n_chains > 1 else timestamp,
+                prior_factors=experiments[0].prior_factors if experiments else None,
+                **kwargs
+            ))
 
-def main(folder_name: str):
+        def run_chain(experiment):
+            experiment.run_experiment(progress=n_workers == 1 and n_chains == 1)
+            if save:
+                experiment.save_results()
+            return experiment
+
+        if blas_threads is None:
+            limits = nullcontext()
+        elif threadpool_limits is None:
+            if n_workers > 1:
+                warnings.warn("threadpoolctl is not installed, BLAS threads are not limited")
+            limits = nullcontext()
+        else:
+            limits = threadpool_limits(limits=blas_threads, user_api="blas")
+        with limits:
+            if n_workers == 1:
+                for experiment in tqdm.tqdm(experiments, disable=n_chains == 1):
+                    run_chain(experiment)
+            else:
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    futures = [executor.submit(run_chain, experiment) for experiment in experiments]
+                    for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                        future.result()
+        return experiments
+
+    @classmethod
+    def validate_precision(cls, config: ExperimentConfig, seed: Optional[Any] = None, **kwargs) -> List[Dict[str, Any]]:
+        """config.dtype での実行が float64 での実行からどれだけずれるかを世代ごとに調べる
+
+        同じ SeedSequence から両方のチェーンを実行し（結果は保存しない）、
+        各世代のパラメータの最大絶対誤差・最大相対誤差（precision_drift）を表示して返す。
+        フィルタの判定が一度でも分かれるとそれ以降の乱数列がずれるので、ずれは世代とともに増えうる。
+        """
+        if config.population_size > 1:
+            raise ValueError("validate_precision only supports a single agent per generation.")
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        experiments = []
+        with tempfile.TemporaryDirectory() as save_dir:
+            for dtype in ["float64", config.dtype]:
+                experiment = cls(replace(config, dtype=dtype), save_dir, seed=seed_sequence, folder_name=dtype, **kwargs)
+                experiment.run_experiment()
+                experiments.append(experiment)
+        reference, other = experiments
+        drifts = []
+        print(f"{'iter':>6} " + " ".join(f"{name:>10}" for name in reference.params) + "  (max relative drift)")
+        for i in range(config.iter):
+            drift = precision_drift(
+                {name: value[i] for name, value in reference.params.items()},
+                {name: value[i] for name, value in other.params.items()},
+            )
+            drifts.append(drift)
+            print(f"{i:>6} " + " ".join(f"{drift[name]['max_rel']:>10.2e}" for name in reference.params))
+        return drifts
+
+def main(folder_name: str, n_chains: int = 1, n_workers: int = 1, seed: Optional[int] = None, blas_threads: int = 1,
+         track_learning: bool = False, dtype: Optional[str] = None, validate_precision: bool = False,
+         sampler: Optional[str] = None, sample_design: Optional[str] = None, transmission: Optional[str] = None,
+         population_size: Optional[int] = None, topology: Optional[str] = None, **kwargs):
     DATA_DIR = os.path.dirname(__file__) + "/../data/"
     
     # 設定の作成
@@ -309,16 +546,79 @@ def main(folder_name: str):
         config = ExperimentConfig.load_config(os.path.join(DATA_DIR, folder_name, "config.json"))
     else:
         config = ExperimentConfig.create_default_config()
+    if dtype is not None:
+        config.dtype = dtype
+    if sampler is not None:
+        config.sampler = sampler
+    if sample_design is not None:
+        config.sample_design = sample_design
+    if transmission is not None:
+        config.transmission = transmission
+    if population_size is not None:
+        config.population_size = population_size
+    if topology is not None:
+        config.topology = topology
+    if validate_precision:
+        ExperimentManager.validate_precision(config, seed=seed, **kwargs)
+        return
     
     # 実験の実行
     # experiment = ExperimentManager(config, DATA_DIR,track_learning=True)
-    experiment = ExperimentManager(config, DATA_DIR)
-    experiment.run_experiment()
-    experiment.save_results()
-    print(experiment.save_path)
+    if n_chains == 1 and n_workers == 1:
+        experiment = ExperimentManager(config, DATA_DIR, track_learning=track_learning, seed=seed, **kwargs)
+        experiment.run_experiment()
+        experiment.save_results()
+        print(experiment.save_path)
+    else:
+        experiments = ExperimentManager.run_chains(config, DATA_DIR, n_chains=n_chains, seed=seed,
+                                                   n_workers=n_workers, blas_threads=blas_threads,
+                                                   track_learning=track_learning, **kwargs)
+        for experiment in experiments:
+            print(experiment.save_path)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('folder_name',nargs="?" , type=str, default="None", help='input file path')
-    folder_name = parser.parse_args().folder_name
-    main(folder_name)
+    parser.add_argument('--n_chains', type=int, default=1, help='number of independent chains')
+    parser.add_argument('--n_workers', type=int, default=1, help='number of threads running the chains')
+    parser.add_argument('--seed', type=int, default=None, help='root seed of the chains')
+    parser.add_argument('--blas_threads', type=int, default=1, help='BLAS threads while running chains in threads')
+    parser.add_argument('--track_learning', action='store_true', help='record the parameters after every learned sample')
+    parser.add_argument('--history_every', type=int, default=1, help='keep the snapshot of every k-th sample')
+    parser.add_argument('--history_log_points', type=int, default=None, help='keep about this many log-spaced snapshots')
+    parser.add_argument('--history_to_disk', action='store_true', help='write the snapshots to memory-mapped files')
+    parser.add_argument('--history_format', type=str, default="delta", choices=["plain", "compressed", "delta"],
+                        help='storage of history.nc: plain arrays, compressed chunks, or keyframes plus compressed deltas')
+    parser.add_argument('--history_keep_bits', type=int, default=None,
+                        help='round the history to this many mantissa bits (lossy, compresses better)')
+    parser.add_argument('--dtype', type=str, default=None, choices=["float64", "float32"],
+                        help='precision of the data, responsibilities and samples (overrides the config)')
+    parser.add_argument('--sampler', type=str, default=None, choices=["gaussian", "gaussian_cholesky", "student_t"],
+                        help='distribution of the generated samples (overrides the config)')
+    parser.add_argument('--sample_design', type=str, default=None, choices=["mc", "stratified", "sobol", "halton"],
+                        help='design of the random numbers of the generated samples (overrides the config)')
+    parser.add_argument('--transmission', type=str, default=None, choices=["samples", "statistics"],
+                        help='learn the children from N samples or from their sufficient statistics only (overrides the config); '
+                             '"statistics" is an approximation, only used without filters and track_learning for parents whose '
+                             'components are at least 7 standard deviations apart (biased for overlapping ones), '
+                             'other generations fall back to samples with a warning')
+    parser.add_argument('--population_size', type=int, default=None,
+                        help='run a population of this many agents per generation and save population.nc (overrides the config)')
+    parser.add_argument('--topology', type=str, default=None, choices=["ring", "lattice"],
+                        help='parents of each agent of the population (overrides the config)')
+    parser.add_argument('--validate_precision', action='store_true',
+                        help='run the chain in --dtype and in float64 with the same seed and report the drift instead of saving')
+    parser.add_argument('--jit', action='store_true', help='run the per-sample learning loop in the numba kernel (if installed)')
+    parser.add_argument('--backend', type=str, default="numpy", choices=["numpy", "numba", "jax"],
+                        help='array library computing the E/M steps, the lower bound and the predictive density')
+    parser.add_argument('--excluded_max_rows', type=int, default=None,
+                        help='keep a uniform reservoir sample of at most this many excluded samples')
+    parser.add_argument('--excluded_to_disk', action='store_true', help='write the excluded samples to chunk files')
+    args = parser.parse_args()
+    main(args.folder_name, n_chains=args.n_chains, n_workers=args.n_workers, seed=args.seed, blas_threads=args.blas_threads,
+         track_learning=args.track_learning, dtype=args.dtype, validate_precision=args.validate_precision, sampler=args.sampler,
+         sample_design=args.sample_design, transmission=args.transmission,
+         population_size=args.population_size, topology=args.topology, history_every=args.history_every,
+         history_log_points=args.history_log_points, history_to_disk=args.history_to_disk, history_format=args.history_format,
+         history_keep_bits=args.history_keep_bits, jit=args.jit, backend=args.backend, excluded_max_rows=args.excluded_max_rows,
+         excluded_to_disk=args.excluded_to_disk)
@@ -1,2 +1,14 @@
-from . import agents
-from . import utils
+import importlib
+
+# the subpackages are imported on first access (PEP 562), so that "import src" does not load their dependencies
+_SUBPACKAGES = ("agents", "utils")
+
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBPACKAGES))
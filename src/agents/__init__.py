@@ -1 +1,35 @@
-from .bayesian_agents import *
\ No newline at end of file
+import importlib
+
+# the public names of each submodule; a submodule is imported on the first access to one of its names (PEP 562),
+# so that importing the package does not load xarray, SciPy or numba before they are needed
+_SUBMODULE_NAMES = {
+    "bayesian_agents": (
+        "BayesianGaussianMixtureModel", "BayesianGaussianMixtureModelWithContext",
+        "compute_prior_factors", "check_random_state", "precision_drift", "PRECISION_DRIFT_PARAMS",
+        "logB", "logC", "multi_student_t",
+        "filter_high_entropy", "filter_low_max_prob", "filter_missunderstand", "FILTER_DICT",
+        "SCREENING_BLOCK_SIZE", "CANDIDATE_COUNT_FIELDS", "TRANSMISSIONS", "JIT_FILTER_CODES",
+        "component_separation", "STATISTICS_MIN_SEPARATION", "STATISTICS_MAX_SHIFT",
+    ),
+    "broadcast": ("SharedParentBatch", "SharedParentView", "fit_children_from_parent"),
+    "population": ("BayesianGaussianMixtureModelPopulation", "ring_topology", "lattice_topology", "random_topology"),
+    "backends": ("BACKENDS", "get_backend", "available_backends"),
+    "filters": ("LogScoreFilter", "all_of", "any_of", "parse_filter"),
+    "sampling": ("PredictiveSampler", "SAMPLERS", "DESIGNS"),
+}
+_SUBMODULE_OF = {name: submodule for submodule, names in _SUBMODULE_NAMES.items() for name in names}
+
+__all__ = list(_SUBMODULE_OF)
+
+
+def __getattr__(name):
+    if name not in _SUBMODULE_OF:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_SUBMODULE_OF[name]}", __name__), name)
+    # later accesses find the name directly
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULE_OF))
@@ -0,0 +1,306 @@
+import numpy as np
+
+from ..utils.lazy import LazyModule
+
+# imported on first use, see src.utils.lazy
+special = LazyModule("scipy.special")
+jit_kernels = LazyModule("src.agents.jit")
+
+
+class NumpyBackend:
+    '''
+    The array kernels of the agents, implemented with NumPy and SciPy. This is the reference the other backends are checked against.
+
+    A backend provides logB, logC, multi_student_t, log_multi_student_t, e_like_step, m_like_step and lower_bound.
+    They take and return NumPy arrays, so the agents do not depend on the array library used inside.
+    The other backends subclass this one and inherit the NumPy version of any kernel they do not override.
+
+    The NumPy versions of logB, logC, e_like_step, m_like_step and lower_bound also accept a stack of agents,
+    i.e. arrays with extra leading axes (e.g. (P, N, D) for X), which BayesianGaussianMixtureModelPopulation uses.
+    '''
+    name = "numpy"
+
+    @staticmethod
+    def logB(W, nu):
+        D = W.shape[-1]
+        return D * np.log(2) + D * special.digamma(nu/2) - nu/2 * np.linalg.slogdet(W)[1]
+
+    @staticmethod
+    def logC(alpha):
+        return special.gammaln(alpha.sum(axis=-1)) - special.gammaln(alpha).sum(axis=-1)
+
+    @staticmethod
+    def multi_student_t(X, m, L, nu):
+        D = X.shape[1]
+        diff = X - m
+        log_part1 = special.gammaln((nu + D)/2)
+        log_part2 = -special.gammaln(nu/2)
+        log_part3 = -D/2 * np.log(nu*np.pi)
+        log_part4 = -0.5 * np.log(np.linalg.det(L))
+        log_part5 = -(nu+D)/2 * np.log(1 + 1/nu * np.einsum("nj,jk,nk->n", diff, np.linalg.inv(L), diff))
+
+        # Calculate the log of the final result
+        log_result = log_part1 + log_part2 + log_part3 + log_part4 + log_part5
+
+        # Convert the log result back to a regular number
+        return np.exp(log_result)
+
+    @staticmethod
+    def log_multi_student_t(X, m, L, nu):
+        '''
+        Log densities at the rows of X (N, D) of K Student-t distributions with locations m (K, D),
+        matrices L (K, D, D) and degrees of freedom nu (K, ), as in multi_student_t. Returns (N, K).
+        '''
+        D = X.shape[1]
+        diff = X[:, None, :] - m[None, :, :]
+        quad = np.einsum("nkj,nkj->nk", np.einsum("nki,kij->nkj", diff, np.linalg.inv(L)), diff)
+        return special.gammaln((nu + D)/2) - special.gammaln(nu/2) - D/2 * np.log(nu*np.pi) - 0.5 * np.linalg.slogdet(L)[1] - (nu + D)/2 * np.log1p(quad/nu)
+
+    @staticmethod
+    def e_like_step(X, tpi, beta, nu, m, W, dtype=np.float64):
+        '''
+        Responsibilities r (N, K) of the samples X (N, D) given the mixing weights tpi ((K, ) or (N, K))
+        and the parameters, see BayesianGaussianMixtureModel._e_like_step.
+        The data part is computed in dtype, the log-determinants in float64.
+        '''
+        D = np.shape(X)[-1]
+        beta, nu = np.asarray(beta), np.asarray(nu)
+        arg_digamma = nu[..., :, None] - np.arange(0, D, 1)
+        tlam = np.exp( special.digamma(arg_digamma/2).sum(axis=-1)  + D * np.log(2) + np.log(np.linalg.det(W)) )
+
+        diff = np.asarray(X)[..., :, None, :].astype(dtype, copy=False) - np.asarray(m)[..., None, :, :].astype(dtype)
+        exponent = (D / beta[..., None, :]).astype(dtype) + nu[..., None, :].astype(dtype) * \
+            np.einsum("...nkj,...nkj->...nk", np.einsum("...nki,...kij->...nkj", diff, W.astype(dtype)), diff)
+
+        exponent_subtracted = exponent - exponent.min(axis=-1, keepdims=True)
+        rho = np.asarray(tpi, dtype=dtype)*np.sqrt(tlam)[..., None, :].astype(dtype)*np.exp( -0.5 * exponent_subtracted )
+        return rho/rho.sum(axis=-1, keepdims=True)
+
+    @staticmethod
+    def m_like_step(X, r, alpha0, beta0, nu0, m0, W0_inv):
+        '''
+        Parameters (alpha, beta, nu, m, W) given the responsibilities, see BayesianGaussianMixtureModel._m_like_step.
+        The sums are accumulated in float64 whatever the dtype of the data.
+        '''
+        X = X.astype(np.float64, copy=False)
+        r = r.astype(np.float64, copy=False)
+        n_samples_in_component = r.sum(axis=-2)
+        barx = np.swapaxes(r, -1, -2) @ X / n_samples_in_component[..., :, None]
+        diff = X[..., :, None, :] - barx[..., None, :, :]
+        S = np.einsum("...nki,...nkj->...kij", np.einsum("...nk,...nki->...nki", r, diff), diff) / n_samples_in_component[..., :, None, None]
+
+        alpha = alpha0 + n_samples_in_component
+        beta = beta0 + n_samples_in_component
+        nu = nu0 + n_samples_in_component
+        m = (beta0.reshape(-1, 1) * m0 + barx * n_samples_in_component[..., :, None])/beta[..., :, None]
+
+        diff2 = barx - m0
+        Winv = W0_inv + \
+            S * n_samples_in_component[..., :, None, None] + \
+            ( beta0 * n_samples_in_component / (beta0 + n_samples_in_component))[..., :, None, None] * np.einsum("...ki,...kj->...kij",diff2,diff2)
+        return alpha, beta, nu, m, np.linalg.inv(Winv)
+
+    @classmethod
+    def lower_bound(cls, r, alpha, beta, nu, W, prior_factors):
+        '''
+        The variational lower bound without its final constant term, see BayesianGaussianMixtureModel._calc_lower_bound.
+        '''
+        K, D = W.shape[-3], W.shape[-1]
+        r = np.clip(r.astype(np.float64, copy=False), 1e-10, 1-1e-10)
+        return - (r * np.log(r)).sum(axis=(-2, -1)) + \
+            prior_factors["logC_alpha0"] - cls.logC(alpha) +\
+            D/2 * (prior_factors["log_beta0_sum"] - np.log(beta).sum(axis=-1)) + \
+            K * prior_factors["logB0_sum"] - cls.logB(W, nu).sum(axis=-1)
+
+
+class NumbaBackend(NumpyBackend):
+    '''
+    The kernels compiled with numba (src.agents.jit), written as explicit loops over the samples.
+
+    They compute in float64, only the responsibilities are returned in the requested dtype.
+    '''
+    name = "numba"
+
+    def __init__(self):
+        if not jit_kernels.NUMBA_AVAILABLE:
+            raise ImportError("The numba backend requires numba.")
+
+    @staticmethod
+    def logB(W, nu):
+        return jit_kernels.log_b(np.ascontiguousarray(W, dtype=np.float64), np.ascontiguousarray(nu, dtype=np.float64))
+
+    @staticmethod
+    def multi_student_t(X, m, L, nu):
+        return jit_kernels.student_t(np.ascontiguousarray(X, dtype=np.float64), np.ascontiguousarray(m, dtype=np.float64),
+                                     np.ascontiguousarray(L, dtype=np.float64), float(nu))
+
+    @staticmethod
+    def e_like_step(X, tpi, beta, nu, m, W, dtype=np.float64):
+        N, K = len(X), len(beta)
+        r = np.empty((N, K))
+        jit_kernels.e_step(
+            np.ascontiguousarray(X, dtype=np.float64),
+            np.ascontiguousarray(np.broadcast_to(tpi, (N, K)), dtype=np.float64),
+            N,
+            *(np.ascontiguousarray(value, dtype=np.float64) for value in (beta, nu, W, m)),
+            r,
+        )
+        return r.astype(dtype, copy=False)
+
+    @staticmethod
+    def m_like_step(X, r, alpha0, beta0, nu0, m0, W0_inv):
+        (N, D), K = np.shape(X), len(beta0)
+        alpha, beta, nu = np.empty(K), np.empty(K), np.empty(K)
+        m, W = np.empty((K, D)), np.empty((K, D, D))
+        jit_kernels.m_step(
+            np.ascontiguousarray(X, dtype=np.float64), np.ascontiguousarray(r, dtype=np.float64), N,
+            *(np.ascontiguousarray(value, dtype=np.float64) for value in (alpha0, beta0, nu0, m0, W0_inv)),
+            alpha, beta, nu, m, W,
+        )
+        return alpha, beta, nu, m, W
+
+    @staticmethod
+    def lower_bound(r, alpha, beta, nu, W, prior_factors):
+        return jit_kernels.calc_lower_bound(
+            np.ascontiguousarray(r, dtype=np.float64), len(r),
+            *(np.ascontiguousarray(value, dtype=np.float64) for value in (alpha, beta, nu, W)),
+            float(prior_factors["logC_alpha0"]), float(prior_factors["log_beta0_sum"]), float(prior_factors["logB0_sum"]),
+        )
+
+
+class JaxBackend(NumpyBackend):
+    '''
+    The kernels written with jax.numpy and compiled by XLA (jax.jit) on the CPU.
+
+    Creating the backend enables 64 bit floats in JAX (jax_enable_x64) for the whole process, which the
+    lower bound needs. It computes in float64, only the responsibilities are returned in the requested dtype.
+    Each new shape of the inputs is compiled once, e.g. every sample count of the per-sample loop of fit_from_agent.
+    '''
+    name = "jax"
+
+    def __init__(self):
+        try:
+            import jax
+            import jax.numpy as jnp
+            from jax.scipy.special import digamma as jax_digamma, gammaln as jax_gammaln
+        except ImportError as error:
+            raise ImportError("The jax backend requires jax.") from error
+        jax.config.update("jax_enable_x64", True)
+
+        def logB(W, nu):
+            D = W.shape[-1]
+            return D * jnp.log(2) + D * jax_digamma(nu / 2) - nu / 2 * jnp.linalg.slogdet(W)[1]
+
+        def logC(alpha):
+            return jax_gammaln(alpha.sum()) - jax_gammaln(alpha).sum()
+
+        def multi_student_t(X, m, L, nu):
+            D = X.shape[1]
+            diff = X - m
+            quad = jnp.einsum("nj,jk,nk->n", diff, jnp.linalg.inv(L), diff)
+            return jnp.exp(jax_gammaln((nu + D) / 2) - jax_gammaln(nu / 2) - D / 2 * jnp.log(nu * jnp.pi)
+                           - 0.5 * jnp.linalg.slogdet(L)[1] - (nu + D) / 2 * jnp.log1p(quad / nu))
+
+        def log_multi_student_t(X, m, L, nu):
+            D = X.shape[1]
+            diff = X[:, None, :] - m[None, :, :]
+            quad = jnp.einsum("nki,kij,nkj->nk", diff, jnp.linalg.inv(L), diff)
+            return jax_gammaln((nu + D) / 2) - jax_gammaln(nu / 2) - D / 2 * jnp.log(nu * jnp.pi) \
+                - 0.5 * jnp.linalg.slogdet(L)[1] - (nu + D) / 2 * jnp.log1p(quad / nu)
+
+        def e_like_step(X, tpi, beta, nu, m, W):
+            K, D = m.shape
+            arg_digamma = nu[:, None] - jnp.arange(D)[None, :]
+            log_tlam = jax_digamma(arg_digamma / 2).sum(axis=1) + D * jnp.log(2) + jnp.linalg.slogdet(W)[1]
+            diff = X[:, None, :] - m[None, :, :]
+            exponent = D / beta + nu * jnp.einsum("nki,kij,nkj->nk", diff, W, diff)
+            exponent = exponent - exponent.min(axis=1, keepdims=True)
+            rho = tpi * jnp.exp(0.5 * log_tlam - 0.5 * exponent)
+            return rho / rho.sum(axis=1, keepdims=True)
+
+        def m_like_step(X, r, alpha0, beta0, nu0, m0, W0_inv):
+            n_samples_in_component = r.sum(axis=0)
+            barx = r.T @ X / n_samples_in_component[:, None]
+            diff = X[:, None, :] - barx[None, :, :]
+            scatter = jnp.einsum("nk,nki,nkj->kij", r, diff, diff)
+            beta = beta0 + n_samples_in_component
+            m = (beta0[:, None] * m0 + barx * n_samples_in_component[:, None]) / beta[:, None]
+            diff2 = barx - m0
+            Winv = W0_inv[None] + scatter + \
+                (beta0 * n_samples_in_component / beta)[:, None, None] * jnp.einsum("ki,kj->kij", diff2, diff2)
+            return alpha0 + n_samples_in_component, beta, nu0 + n_samples_in_component, m, jnp.linalg.inv(Winv)
+
+        def lower_bound(r, alpha, beta, nu, W, logC_alpha0, log_beta0_sum, logB0_sum):
+            K, D = W.shape[0], W.shape[-1]
+            r = jnp.clip(r, 1e-10, 1 - 1e-10)
+            return - (r * jnp.log(r)).sum() + logC_alpha0 - logC(alpha) + \
+                D / 2 * (log_beta0_sum - jnp.log(beta).sum()) + K * logB0_sum - logB(W, nu).sum()
+
+        self._logB = jax.jit(logB)
+        self._multi_student_t = jax.jit(multi_student_t)
+        self._log_multi_student_t = jax.jit(log_multi_student_t)
+        self._e_like_step = jax.jit(e_like_step)
+        self._m_like_step = jax.jit(m_like_step)
+        self._lower_bound = jax.jit(lower_bound)
+
+    # the results are copied to writable NumPy arrays, the agents update W in place when sampling
+    def logB(self, W, nu):
+        return np.array(self._logB(np.asarray(W, dtype=np.float64), np.asarray(nu, dtype=np.float64)))
+
+    def multi_student_t(self, X, m, L, nu):
+        return np.array(self._multi_student_t(*(np.asarray(value, dtype=np.float64) for value in (X, m, L, nu))))
+
+    def log_multi_student_t(self, X, m, L, nu):
+        return np.array(self._log_multi_student_t(*(np.asarray(value, dtype=np.float64) for value in (X, m, L, nu))))
+
+    def e_like_step(self, X, tpi, beta, nu, m, W, dtype=np.float64):
+        r = self._e_like_step(*(np.asarray(value, dtype=np.float64) for value in (X, tpi, beta, nu, m, W)))
+        return np.array(r, dtype=dtype)
+
+    def m_like_step(self, X, r, alpha0, beta0, nu0, m0, W0_inv):
+        params = self._m_like_step(*(np.asarray(value, dtype=np.float64) for value in (X, r, alpha0, beta0, nu0, m0, W0_inv)))
+        return tuple(np.array(value) for value in params)
+
+    def lower_bound(self, r, alpha, beta, nu, W, prior_factors):
+        return float(self._lower_bound(
+            *(np.asarray(value, dtype=np.float64) for value in (r, alpha, beta, nu, W)),
+            prior_factors["logC_alpha0"], prior_factors["log_beta0_sum"], prior_factors["logB0_sum"],
+        ))
+
+
+BACKENDS = {
+    "numpy": NumpyBackend,
+    "numba": NumbaBackend,
+    "jax": JaxBackend,
+}
+
+# one instance per backend, the JAX backend compiles its kernels once per process
+_BACKEND_INSTANCES = {}
+
+def get_backend(backend="numpy"):
+    '''
+    Return the backend instance for a name of BACKENDS. A backend instance is returned as is.
+
+    Raises ImportError if the array library of the backend is not installed.
+    '''
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {list(BACKENDS)}.")
+    if backend not in _BACKEND_INSTANCES:
+        _BACKEND_INSTANCES[backend] = BACKENDS[backend]()
+    return _BACKEND_INSTANCES[backend]
+
+
+def available_backends():
+    '''
+    Names of the backends whose array library is installed.
+    '''
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
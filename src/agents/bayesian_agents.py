@@ -1,50 +1,26 @@
+import warnings
 import numpy as np
-import xarray as xr
-from scipy.special import digamma, gammaln, gamma
-def logB(W, nu):
-    D = W.shape[-1]
-    return D * np.log(2) + D * digamma(nu/2) - nu/2 * np.linalg.slogdet(W)[1]
-
-def logC(alpha):
-    return gammaln(alpha.sum()) - gammaln(alpha).sum()
-
-def multi_student_t(X, m, L, nu):
-    D = X.shape[1]
-    diff = X - m
-    log_part1 = gammaln((nu + D)/2)
-    log_part2 = -gammaln(nu/2)
-    log_part3 = -D/2 * np.log(nu*np.pi)
-    log_part4 = -0.5 * np.log(np.linalg.det(L))
-    log_part5 = -(nu+D)/2 * np.log(1 + 1/nu * np.einsum("nj,jk,nk->n", diff, np.linalg.inv(L), diff))
-
-    # Calculate the log of the final result
-    log_result = log_part1 + log_part2 + log_part3 + log_part4 + log_part5
-
-    # Convert the log result back to a regular number
-    result = np.exp(log_result)
+from types import SimpleNamespace
 
-    
-    return result
-    # return gamma((nu + D)/2) / (gamma(nu/2) * np.power(nu*np.pi, D/2) * np.sqrt(np.linalg.det(L))) * np.power(1 + 1/nu * np.einsum("nj,jk,nk->n", diff, np.linalg.inv(L), diff), -(nu+D)/2)
-
-def filter_high_entropy(data, model, args):
-    threshold = args["threshold"]
-    p = model.predict_proba(data)
-    p = np.clip(p, 1e-10, 1-1e-10)
-    entropy = -np.sum(p * np.log(p), axis=1)
-    return entropy < threshold
-
-def filter_low_max_prob(data, model, args):
-    threshold = args["threshold"]
-    p = model.predict_proba(data)
-    max_prob = np.max(p, axis=1)
-    return max_prob > threshold
-
-def filter_missunderstand(data, model, args):
-    p = model.predict_proba(data)
-    listener_perception = np.argmax(p, axis=1)
-    speaker_perception = data["Z"].argmax(dim = "k").values
-    return listener_perception == speaker_perception
+from ..utils.lazy import LazyModule
+from .backends import NumpyBackend, get_backend
+from .filters import LogScoreFilter, parse_filter
+from .sampling import PredictiveSampler
+
+# imported on first use, see src.utils.lazy
+xr = LazyModule("xarray")
+special = LazyModule("scipy.special")
+jit_kernels = LazyModule("src.agents.jit")
+
+# the NumPy kernels, also used outside the agents (e.g. compute_prior_factors)
+logB = NumpyBackend.logB
+logC = NumpyBackend.logC
+multi_student_t = NumpyBackend.multi_student_t
+
+# the filters are evaluated on the log-joint scores of the model, see src.agents.filters
+filter_high_entropy = LogScoreFilter(["high_entropy"])
+filter_low_max_prob = LogScoreFilter(["low_max_prob"])
+filter_missunderstand = LogScoreFilter(["missunderstand"])
 
 FILTER_DICT = {
     "high_entropy": filter_high_entropy,
@@ -53,10 +29,158 @@ FILTER_DICT = {
     "none": None
 }
 
+# number of candidates the fit filter scores in one call in the per-sample loop of fit_from_agent
+SCREENING_BLOCK_SIZE = 256
+
+# the totals of candidate_counts set by fit_from_agent: the candidates drawn from the source agent,
+# the ones the fit filter decided on, and the learned ones
+CANDIDATE_COUNT_FIELDS = ("generated", "screened", "accepted")
+
+# how fit_from_agent passes the samples of the source agent on: "samples" draws and learns N samples,
+# "statistics" draws only their sufficient statistics, see BayesianGaussianMixtureModelWithContext._fit_statistics
+TRANSMISSIONS = ("samples", "statistics")
+# smallest component_separation of the source agent, in standard deviations, for which fit_from_agent uses "statistics";
+# above it the bias of the child's parameters stays within STATISTICS_MAX_SHIFT (benchmark.py check_transmission)
+STATISTICS_MIN_SEPARATION = 7.0
+# the largest shift of the mean of any parameter of the child from the one learned from the samples, in standard
+# deviations of the parameter over repetitions, accepted by check_transmission above STATISTICS_MIN_SEPARATION
+STATISTICS_MAX_SHIFT = 0.35
+
+# the fit filters the compiled per-sample loop can evaluate, by the name of their code in src.agents.jit
+# (looked up when the loop runs, so that numba is only imported then)
+JIT_FILTER_CODES = {
+    None: "FILTER_NONE",
+    filter_high_entropy: "FILTER_HIGH_ENTROPY",
+    filter_low_max_prob: "FILTER_LOW_MAX_PROB",
+    filter_missunderstand: "FILTER_MISSUNDERSTAND",
+}
+
+def compute_prior_factors(alpha0, beta0, nu0, W0):
+    '''
+    Precompute the factors of the prior which are reused by every iteration of fit.
+
+    The returned arrays are read-only, so one set of factors can be shared between agents, also across threads.
+
+    Parameters
+    ----------
+    alpha0, beta0, nu0 : 1D numpy array
+        Arrays with shape (K, ) representing the prior parameters.
+    W0 : 2D numpy array
+        Array with shape (D, D) representing the prior scale matrix.
+
+    Returns
+    ----------
+    prior_factors : dict
+        W0_inv : the inverse of W0
+        logC_alpha0, log_beta0_sum, logB0_sum : the prior terms of the variational lower bound
+    '''
+    prior_factors = {
+        "W0_inv": np.linalg.inv(W0),
+        "logC_alpha0": logC(alpha0),
+        "log_beta0_sum": np.log(beta0).sum(),
+        "logB0_sum": logB(W0, nu0).sum(),
+    }
+    for value in prior_factors.values():
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+    return prior_factors
+
+def component_separation(agent):
+    '''
+    The smallest Mahalanobis distance between the means of two components of agent, measured with the covariance
+    (beta_k W_k)^-1 the samples of component k are drawn with, of the wider of the two components.
+
+    Returns
+    ----------
+    separation : float
+        In standard deviations; inf for a single component.
+    '''
+    separation = np.inf
+    for j in range(agent.K):
+        diff = agent.m - agent.m[j]
+        # squared distances of every mean from m_j, in the covariance of j
+        distance2 = agent.beta[j] * np.einsum("ki,ij,kj->k", diff, agent.W[j], diff)
+        for k in range(j):
+            separation = min(separation, np.sqrt(min(distance2[k], agent.beta[k] * diff[k] @ agent.W[k] @ diff[k])))
+    return separation
+
+def check_random_state(rng):
+    '''
+    Turn rng into an object providing the numpy sampling methods.
+
+    Parameters
+    ----------
+    rng : None, int, np.random.SeedSequence, np.random.Generator or np.random.RandomState
+        None selects the global numpy random state, so that np.random.seed keeps working.
+        An int or SeedSequence is used to seed a new np.random.Generator.
+        A Generator or RandomState is used as is.
+    '''
+    if rng is None:
+        return np.random.mtrand._rand
+    if isinstance(rng, (np.random.Generator, np.random.RandomState)):
+        return rng
+    return np.random.default_rng(rng)
+
+PRECISION_DRIFT_PARAMS = ("alpha", "beta", "nu", "m", "W")
+
+def precision_drift(reference, other):
+    '''
+    Measure how far parameters computed in reduced precision drift from the float64 ones.
+
+    Parameters
+    ----------
+    reference, other : BayesianGaussianMixtureModel or dict
+        The float64 result and the reduced precision result of the same computation (same data or same seed),
+        given as agents or as dicts of parameter arrays (e.g. ExperimentManager.params, with a leading iter axis).
+
+    Returns
+    ----------
+    drift : dict
+        For each of alpha, beta, nu, m and W, the maximum absolute and relative differences
+        {"max_abs": float, "max_rel": float}.
+    '''
+    drift = {}
+    for name in PRECISION_DRIFT_PARAMS:
+        if isinstance(reference, dict):
+            a, b = reference[name], other[name]
+        else:
+            a, b = getattr(reference, name), getattr(other, name)
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        abs_diff = np.abs(a - b)
+        drift[name] = {
+            "max_abs": float(abs_diff.max()),
+            "max_rel": float((abs_diff / np.maximum(np.abs(a), np.finfo(np.float64).tiny)).max()),
+        }
+    return drift
+
+def _excluded_dataset(rows):
+    '''
+    The excluded samples given as a list of (X, C, Z) row blocks, as an xr.Dataset (empty if there are none).
+    '''
+    if len(rows) == 0:
+        return xr.Dataset()
+    X, C, Z = (np.concatenate(values) for values in zip(*rows))
+    return xr.Dataset(
+        {
+            'X': (['n', 'd'], X),
+            'C': (['n', 'k'], C),
+            'Z': (['n', 'k'], Z),
+        },
+        coords={'n': np.arange(len(X)), 'd': np.arange(X.shape[1]), 'k': np.arange(C.shape[1])}
+    )
+
+def _retry_counts(accepted):
+    '''
+    The number of rejected candidates before each accepted one, from the filter decisions in screening order (True if accepted).
+    '''
+    position = np.flatnonzero(accepted)
+    return (np.diff(position, prepend=-1) - 1).astype(np.int32)
+
 class BayesianGaussianMixtureModel:
     # todo : add pi_mixture_ratio, c_alpha, mixture_pi
     # ! this class is not complete
-    def __init__(self, K, D, alpha0, beta0, nu0, m0, W0, c_alpha, pi_mixture_ratio=None, fit_filter=None, fit_filter_args=None, generate_filter=None, generate_filter_args=None, track_learning=False):
+    def __init__(self, K, D, alpha0, beta0, nu0, m0, W0, c_alpha, pi_mixture_ratio=None, fit_filter=None, fit_filter_args=None, generate_filter=None, generate_filter_args=None, track_learning=False, rng=None, prior_factors=None, dtype=np.float64, jit=False, backend="numpy", sampler="gaussian", sample_design="mc"):
         self.K = K
         self.D = D
         if isinstance(alpha0, (int, float, complex)):
@@ -85,6 +209,9 @@ class BayesianGaussianMixtureModel:
             raise ValueError("The shape of m0 is invalid.")
         
         self.W0 = W0
+        if prior_factors is None:
+            prior_factors = compute_prior_factors(self.alpha0, self.beta0, self.nu0, self.W0)
+        self.prior_factors = prior_factors
 
         if isinstance(c_alpha, (int, float, complex)):
             self.c_alpha = c_alpha * np.ones(K)
@@ -111,7 +238,7 @@ class BayesianGaussianMixtureModel:
         self.X = None
         self._init_params()
         if isinstance(fit_filter, str):
-            self.fit_filter = FILTER_DICT[fit_filter]
+            self.fit_filter = FILTER_DICT[fit_filter] if fit_filter in FILTER_DICT else parse_filter(fit_filter)
         elif fit_filter is None or fit_filter == "none":
             self.fit_filter = None
         elif callable(fit_filter):
@@ -120,7 +247,7 @@ class BayesianGaussianMixtureModel:
             raise ValueError("fit_filter must be a string, None, or a function")
         
         if isinstance(generate_filter, str):
-            self.generate_filter = FILTER_DICT[generate_filter]
+            self.generate_filter = FILTER_DICT[generate_filter] if generate_filter in FILTER_DICT else parse_filter(generate_filter)
         elif generate_filter is None or fit_filter == "none":
             self.generate_filter = None
         elif callable(generate_filter):
@@ -130,9 +257,19 @@ class BayesianGaussianMixtureModel:
         self.fit_filter_args = fit_filter_args
         self.generate_filter_args = generate_filter_args
         self.track_learning = track_learning    
-        if self.track_learning:
-            self.history = xr.Dataset()
+        self.rng = check_random_state(rng)
+        # precision of the data, responsibilities and samples; the parameters, sums and the lower bound stay float64
+        self.dtype = np.dtype(dtype)
+        # run the per-sample loop of fit_from_agent in the compiled kernel of src.agents.jit when numba is installed
+        self.jit = jit
+        # the array library computing the E and M steps, the lower bound and the predictive density, see src.agents.backends
+        self.backend = get_backend(backend)
+        # the distribution of the generated X and the cache of its factors, see src.agents.sampling
+        self.sampler = PredictiveSampler(sampler, sample_design)
+        self.history = None
         self.excluded_data = []
+        self.retry_count = None
+        self.candidate_counts = None
 
     def _init_params(self, X=None, random_state=None):
         '''
@@ -175,27 +312,15 @@ class BayesianGaussianMixtureModel:
             where r[n, k] = $r_{n, k}$.
 
         '''
-        N, _ = np.shape(X)
-
         if self.c_alpha is None:
-            tpi = np.exp( digamma(self.alpha) - digamma(self.alpha.sum()) )
+            tpi = np.exp( special.digamma(self.alpha) - special.digamma(self.alpha.sum()) )
         else:
             if self.mixture_pi:
                 tpi = np.sum(self.c_alpha, axis=0)/np.sum(self.c_alpha)
             else:
                 tpi = self.c_alpha/np.sum(self.c_alpha)
 
-        arg_digamma = np.reshape(self.nu, (self.K, 1)) - np.reshape(np.arange(0, self.D, 1), (1, self.D))
-        tlam = np.exp( digamma(arg_digamma/2).sum(axis=1)  + self.D * np.log(2) + np.log(np.linalg.det(self.W)) )
-
-        diff = np.reshape(X, (N, 1, self.D) ) - np.reshape(self.m, (1, self.K, self.D) )
-        exponent = self.D / self.beta + self.nu * np.einsum("nkj,nkj->nk", np.einsum("nki,kij->nkj", diff, self.W), diff)
-
-        exponent_subtracted = exponent - np.reshape(exponent.min(axis=1), (N, 1))
-        rho = tpi*np.sqrt(tlam)*np.exp( -0.5 * exponent_subtracted )
-        r = rho/np.reshape(rho.sum(axis=1), (N, 1))
-
-        return r
+        return self.backend.e_like_step(X, tpi, self.beta, self.nu, self.m, self.W, self.dtype)
 
 
     def _m_like_step(self, X, r):
@@ -210,22 +335,9 @@ class BayesianGaussianMixtureModel:
             2-D numpy array representing responsibility of each component for each sample in X, 
             where r[n, k] = $r_{n, k}$.
         '''
-        N, _ = np.shape(X)
-        n_samples_in_component = r.sum(axis=0)
-        barx = r.T @ X / np.reshape(n_samples_in_component, (self.K, 1))
-        diff = np.reshape(X, (N, 1, self.D) ) - np.reshape(barx, (1, self.K, self.D) )
-        S = np.einsum("nki,nkj->kij", np.einsum("nk,nki->nki", r, diff), diff) / np.reshape(n_samples_in_component, (self.K, 1, 1))
-
-        self.alpha = self.alpha0 + n_samples_in_component
-        self.beta = self.beta0 + n_samples_in_component
-        self.nu = self.nu0 + n_samples_in_component
-        self.m = (self.m0 * self.beta0 + barx * np.reshape(n_samples_in_component, (self.K, 1)))/np.reshape(self.beta, (self.K, 1))
-
-        diff2 = barx - self.m0
-        Winv = np.reshape(np.linalg.inv( self.W0 ), (1, self.D, self.D)) + \
-            S * np.reshape(n_samples_in_component, (self.K, 1, 1)) + \
-            np.reshape( self.beta0 * n_samples_in_component / (self.beta0 + n_samples_in_component), (self.K, 1, 1)) * np.einsum("ki,kj->kij",diff2,diff2) 
-        self.W = np.linalg.inv(Winv)
+        self.alpha, self.beta, self.nu, self.m, self.W = self.backend.m_like_step(
+            X, r, self.alpha0, self.beta0, self.nu0, self.m0, self.prior_factors["W0_inv"]
+        )
 
     def _calc_lower_bound(self, r):
         '''
@@ -241,11 +353,7 @@ class BayesianGaussianMixtureModel:
         lower_bound : float
             The variational lower bound, where the final constant term is omitted.
         '''
-        r = np.clip(r, 1e-10, 1-1e-10)
-        return - (r * np.log(r)).sum() + \
-            logC(self.alpha0) - logC(self.alpha) +\
-            self.D/2 * (np.log(self.beta0).sum() - np.log(self.beta).sum()) + \
-            self.K * logB(self.W0, self.nu0).sum() - logB(self.W, self.nu).sum()
+        return self.backend.lower_bound(r, self.alpha, self.beta, self.nu, self.W, self.prior_factors)
 
 
     def fit(self, data, max_iter=1e3, tol=1e-4, random_state=None, disp_message=False):
@@ -269,12 +377,12 @@ class BayesianGaussianMixtureModel:
         if self.fit_filter is not None and not self.fit_filter(data, self, self.fit_filter_args):
             return False
         if self.X is None:
-            self.X = data.X.values
+            self.X = data.X.values.astype(self.dtype, copy=False)
             if len(self.X.shape) == 1:
                 self.X = self.X.reshape(1, -1)
             self._init_params(self.X, random_state=random_state)
         else:
-            self.X = np.vstack([self.X, data.X.values])
+            self.X = np.vstack([self.X, data.X.values.astype(self.dtype, copy=False)])
 
         r = self._e_like_step(self.X)
         lower_bound = self._calc_lower_bound(r)
@@ -338,9 +446,48 @@ class BayesianGaussianMixtureModel:
         L = np.reshape( (self.nu + 1 - self.D)*self.beta/(1 + self.beta), (self.K, 1,1) ) * self.W
         tmp = np.zeros((len(X), self.K))
         for k in range(self.K):
-            tmp[:,k] = multi_student_t(X, self.m[k], L[k], self.nu[k] + 1 - self.D)
+            tmp[:,k] = self.backend.multi_student_t(X, self.m[k], L[k], self.nu[k] + 1 - self.D)
         return tmp * np.reshape(self.alpha/(self.alpha.sum()), (1, self.K))
 
+    def _log_predictive(self, X):
+        '''
+        Method for calculating the log of the Student-t predictive density of every component, without exponentiation.
+
+        Parameters
+        ----------
+        X : 2D numpy array
+            2D numpy array representing input data, where X[n, i] represents the i-th element of n-th point in X.
+
+        Returns
+        ----------
+        log_density : 2D numpy array
+            A numpy array with shape (len(X), self.K), where log_density[n, k] = log p(X[n] | z_k=1, training data)
+        '''
+        L = np.reshape( (self.nu + 1 - self.D)*self.beta/(1 + self.beta), (self.K, 1,1) ) * self.W
+        return self.backend.log_multi_student_t(X, self.m, L, self.nu + 1 - self.D)
+
+    def predict_log_joint(self, data):
+        '''
+        Method for calculating the log joint probability, used by the filters (see src.agents.filters).
+
+        Parameters
+        ----------
+        data : 2D numpy array or xr.Dataset
+            Input data X, where X[n, i] represents the i-th element of n-th point in X.
+
+        Returns
+        ----------
+        log_joint : 2D numpy array
+            A numpy array with shape (len(X), self.K), where log_joint[n, k] = log p(X[n], z_k=1 | training data)
+        '''
+        if isinstance(data, xr.Dataset):
+            X = data.X.values
+            if len(X.shape) == 1:
+                X= X.reshape(1, -1)
+        else:
+            X = data
+        return self._log_predictive(X) + np.log(self.alpha/(self.alpha.sum()))
+
     def calc_prob_density(self, X):
         '''
         Method for calculating and returning the predictive density.
@@ -414,28 +561,25 @@ class BayesianGaussianMixtureModel:
         '''
         if self.c_alpha is None:
             alpha_norm = self.alpha / self.alpha.sum()
-            z_new = np.random.multinomial(1, alpha_norm, size=n_samples)
+            z_new = self.rng.multinomial(1, alpha_norm, size=n_samples)
         else:
             if self.mixture_pi:
-                comopnent_idx = np.random.choice(self.comopnent_num, size=n_samples, p=self.pi_mixture_ratio)
+                comopnent_idx = self.rng.choice(self.comopnent_num, size=n_samples, p=self.pi_mixture_ratio)
                 z_new = []
                 for i in range(n_samples):
                     alpha_norm = self.c_alpha[comopnent_idx[i]]/np.sum(self.c_alpha[comopnent_idx[i]])
-                    z_new.append(np.random.multinomial(1, alpha_norm, size=1))
+                    z_new.append(self.rng.multinomial(1, alpha_norm, size=1))
                 z_new = np.vstack(z_new)
             else:
                alpha_norm = self.c_alpha/np.sum(self.c_alpha)
-               z_new = np.random.multinomial(1, alpha_norm, size=n_samples)
-        X_new = np.zeros((n_samples, self.D))
+               z_new = self.rng.multinomial(1, alpha_norm, size=n_samples)
+        X_new = np.zeros((n_samples, self.D), dtype=self.dtype)
         
+        self.sampler.update(self)
         for k in range(self.K):
             idx = np.where(z_new[:, k] == 1)[0]
             if len(idx) > 0:
-                X_new[idx] = np.random.multivariate_normal(
-                    self.m[k], 
-                    np.linalg.inv(self.beta[k] * self.W[k]),
-                    size=len(idx)
-                )
+                X_new[idx] = self.sampler.draw(self, k, len(idx), self.rng)
         
         ret_ds = xr.Dataset(
             {
@@ -447,8 +591,8 @@ class BayesianGaussianMixtureModel:
 
 
 class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
-    def __init__(self, K, D, alpha0, beta0, nu0, m0, W0, c_alpha, pi_mixture_ratio=None, fit_filter=None, fit_filter_args=None, generate_filter=None, generate_filter_args=None, track_learning=False):
-        super().__init__(K, D, alpha0, beta0, nu0, m0, W0, c_alpha, pi_mixture_ratio, fit_filter, fit_filter_args, generate_filter, generate_filter_args, track_learning)
+    def __init__(self, K, D, alpha0, beta0, nu0, m0, W0, c_alpha, pi_mixture_ratio=None, fit_filter=None, fit_filter_args=None, generate_filter=None, generate_filter_args=None, track_learning=False, rng=None, prior_factors=None, dtype=np.float64, jit=False, backend="numpy", sampler="gaussian", sample_design="mc"):
+        super().__init__(K, D, alpha0, beta0, nu0, m0, W0, c_alpha, pi_mixture_ratio, fit_filter, fit_filter_args, generate_filter, generate_filter_args, track_learning, rng, prior_factors, dtype, jit, backend, sampler, sample_design)
         self.C = None
         self.Z = None
 
@@ -474,16 +618,23 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
         '''
         if self.fit_filter is not None and not self.fit_filter(data, self, self.fit_filter_args):
             return False
+        self._fit_accepted(data, max_iter=max_iter, tol=tol, random_state=random_state, disp_message=disp_message)
+        return True
+
+    def _fit_accepted(self, data, max_iter=1000, tol=1e-4, random_state=None, disp_message=False):
+        '''
+        Append data to the learned samples and refit the model to all of them, without evaluating the fit filter.
+        '''
         if self.X is None and self.C is None:
-            self.X = data.X.values
-            self.C = data.C.values
+            self.X = data.X.values.astype(self.dtype, copy=False)
+            self.C = data.C.values.astype(self.dtype, copy=False)
             self.Z = data.Z.values
             if len(self.X.shape) == 1:
                 self.X, self.C, self.Z = self.X.reshape(1, -1), self.C.reshape(1, -1), self.Z.reshape(1, -1)
             self._init_params(self.X, random_state=random_state)
         elif self.X is not None and self.C is not None:
-            self.X = np.vstack([self.X, data.X.values])
-            self.C = np.vstack([self.C, data.C.values])
+            self.X = np.vstack([self.X, data.X.values.astype(self.dtype, copy=False)])
+            self.C = np.vstack([self.C, data.C.values.astype(self.dtype, copy=False)])
             self.Z = np.vstack([self.Z, data.Z.values])
 
 
@@ -518,9 +669,9 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
             print(f"convergend : {i < max_iter}")
             print(f"lower bound : {lower_bound}")
             print(f"Change in the variational lower bound : {lower_bound - lower_bound_prev}")
-        return True
 
-    def fit_from_agent(self, source_agent, N, max_iter=1000, tol=0.0001, random_state=None, disp_message=False):
+    def fit_from_agent(self, source_agent, N, max_iter=1000, tol=0.0001, random_state=None, disp_message=False, history=None,
+                       screening_block=SCREENING_BLOCK_SIZE, excluded=None, transmission="samples"):
         '''
         Method for fitting the model based on the source agent.
 
@@ -539,48 +690,252 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
             An integer specifying the random number seed for random initialization
         disp_message : Boolean
             Whether to show the message on the result.
+        history : GenerationHistory
+            Recorder receiving the parameters after every learned sample when track_learning is set,
+            e.g. HistoryRecorder.generation(i). By default a recorder keeping every sample is created.
+        screening_block : int
+            The number of candidates the fit filter scores in one call in the per-sample loop, 1 to score them one by one.
+            The learned samples and the excluded data do not depend on it.
+        excluded : GenerationSink
+            Sink receiving the excluded samples as raw rows, e.g. ExcludedSink.generation(i) of src.utils.excluded.
+            excluded_data is then left empty. By default the excluded samples are kept in excluded_data.
+        transmission : str
+            One of TRANSMISSIONS. With "statistics", the sufficient statistics of the N samples are drawn directly
+            and the samples are not kept (X, C and Z stay None), see _fit_statistics. It requires no fit or generate filter,
+            no track_learning, a Gaussian sampler with the design "mc" and components of the source agent separated by
+            STATISTICS_MIN_SEPARATION standard deviations, otherwise the samples are drawn with a warning.
+
+        After the call, retry_count[i] is the number of candidates rejected by the fit filter before the i-th learned sample,
+        and candidate_counts holds the totals of CANDIDATE_COUNT_FIELDS.
         '''
+        if transmission not in TRANSMISSIONS:
+            raise ValueError(f"transmission must be one of {TRANSMISSIONS}")
+        if transmission == "statistics" and self._can_fit_statistics(source_agent):
+            self._fit_statistics(source_agent, N)
+            return
         data, excluded_data = source_agent.generate(N, return_excluded_data=True).values()
         self.excluded_data = excluded_data
+        self.retry_count = np.zeros(N, dtype=np.int32)
+        self.candidate_counts = np.array([N, N, N], dtype=np.int64)
 
-        self.history = xr.Dataset({
-            'alpha': (['n', 'k'], np.zeros((N, self.K))),  # Changed dimensions to match 2D array
-            'beta': (['n', 'k'], np.zeros((N, self.K))),   # Changed dimensions to match 2D array
-            'nu': (['n', 'k'], np.zeros((N, self.K))),     # Changed dimensions to match 2D array
-            'm': (['n', 'k', 'd'], np.zeros((N, self.K, self.D))),  # Changed dimensions to match 3D array
-            'W': (['n', 'k', 'd', 'd'], np.zeros((N, self.K, self.D, self.D)))  # Changed dimensions to match 4D array
-        }, coords={
-            'n': np.arange(N),
-            'k': np.arange(self.K),
-            'd': np.arange(self.D)
-        })
+        if self.track_learning:
+            if history is None:
+                from ..utils.history import HistoryRecorder
+                history = HistoryRecorder(1, N, self.K, self.D).generation(0)
+            self.history = history
 
         if self.fit_filter is None and self.track_learning is False:
             self.fit(data, max_iter=max_iter, tol=tol, random_state=random_state, disp_message=disp_message)
+            if excluded is not None:
+                excluded.append_dataset(excluded_data)
+                self.excluded_data = xr.Dataset()
+        elif self.jit and self._can_fit_samples_jit():
+            self._fit_samples_jit(source_agent, data, N, max_iter, tol, excluded)
         else:
-            excluded_data_list = []
-            count = -1
-            for i in range(N):
-                while True:
-                    count += 1
-                    if count >= N:
-                        count = 0
-                        data = source_agent.generate(N)
-                    self._init_params(random_state=random_state)
-                    if self.fit(data.sel(n=count), max_iter=max_iter, tol=tol, random_state=random_state, disp_message=disp_message):
-                        if self.track_learning:
-                            self.history['alpha'][i] = self.alpha
-                            self.history['beta'][i] = self.beta
-                            self.history['nu'][i] = self.nu
-                            self.history['m'][i] = self.m
-                            self.history['W'][i] = self.W
-                        break
-                    else:
-                        excluded_data_list.append(data.sel(n=count))
-            if len(excluded_data_list) > 0:
-                self.excluded_data = xr.concat(excluded_data_list, dim='n').assign_coords(n=np.arange(len(excluded_data_list)))
+            self._fit_samples(source_agent, data, N, max_iter, tol, random_state, disp_message, screening_block, excluded)
+
+    def _can_fit_statistics(self, source_agent):
+        '''
+        Whether fit_from_agent can learn from the sufficient statistics of the samples, warning about the reason if not.
+        '''
+        if self.fit_filter is not None or getattr(source_agent, "generate_filter", None) is not None:
+            reason = "a filter is set"
+        elif self.track_learning:
+            reason = "track_learning records every learned sample"
+        elif self.X is not None:
+            reason = "the agent has already learned samples"
+        elif not isinstance(source_agent, BayesianGaussianMixtureModelWithContext):
+            reason = "the source agent is not a BayesianGaussianMixtureModelWithContext"
+        elif source_agent.sampler.sampler == "student_t" or source_agent.sampler.design != "mc":
+            reason = "the statistics can only be drawn for a Gaussian sampler with the design 'mc'"
+        elif component_separation(source_agent) < STATISTICS_MIN_SEPARATION:
+            reason = (f"the components of the source agent are only {component_separation(source_agent):.2f} standard deviations apart "
+                      f"(the statistics are biased below {STATISTICS_MIN_SEPARATION:g})")
+        else:
+            return True
+        warnings.warn(f"transmission 'statistics' is ignored because {reason}, drawing the samples")
+        return False
+
+    def _fit_statistics(self, source_agent, N):
+        '''
+        Learn N samples of source_agent from their sufficient statistics, without drawing the samples.
+
+        This is an approximation of fit: the components of the samples are marginally independent with
+        p(z_k=1) = E[C_k] = c_alpha_k / sum(c_alpha), so the number of samples of each component is multinomial.
+        Given the counts, the mean and the scatter matrix of each component are drawn with PredictiveSampler.draw_statistics.
+        The parameters are then a single M step with the responsibilities set to the components the samples were
+        generated from, without the variational iterations of fit, so lower_bound is None. This matches fit only for
+        well separated components, where the responsibilities given the context C are close to one-hot; for overlapping
+        components the means and covariances are biased, which is why fit_from_agent only uses it when the components
+        of source_agent are at least STATISTICS_MIN_SEPARATION standard deviations apart (see component_separation).
+        The cost is O(K D^3) instead of O(N) per generation. The distribution of the parameters is compared with the one
+        of the samples for several parents with experiments/benchmark/benchmark.py check_transmission.
+
+        Raises ValueError if source_agent lacks c_alpha, mixture_pi (and pi_mixture_ratio for a mixture of contexts),
+        sampler or rng.
+        '''
+        required = ["c_alpha", "mixture_pi", "sampler", "rng"]
+        if getattr(source_agent, "mixture_pi", False):
+            required.append("pi_mixture_ratio")
+        missing = [name for name in required if getattr(source_agent, name, None) is None]
+        if missing:
+            raise ValueError(f"transmission 'statistics' needs the attributes {missing} of the source agent, which are not set.")
+        if source_agent.mixture_pi:
+            p = (source_agent.pi_mixture_ratio.reshape(-1, 1) * source_agent.c_alpha
+                 / source_agent.c_alpha.sum(axis=1, keepdims=True)).sum(axis=0)
+        else:
+            p = source_agent.c_alpha / source_agent.c_alpha.sum()
+        counts = source_agent.rng.multinomial(N, p / p.sum())
+        barx = np.zeros((self.K, self.D))
+        scatter = np.zeros((self.K, self.D, self.D))
+        source_agent.sampler.update(source_agent)
+        for k in range(self.K):
+            barx[k], scatter[k] = source_agent.sampler.draw_statistics(source_agent, k, counts[k], source_agent.rng)
+
+        counts = counts.astype(np.float64)
+        self.alpha = self.alpha0 + counts
+        self.beta = self.beta0 + counts
+        self.nu = self.nu0 + counts
+        self.m = (self.beta0.reshape(-1, 1) * self.m0 + barx * counts.reshape(-1, 1)) / self.beta.reshape(-1, 1)
+        diff = barx - self.m0
+        Winv = self.prior_factors["W0_inv"].reshape(1, self.D, self.D) + scatter + \
+            (self.beta0 * counts / (self.beta0 + counts)).reshape(-1, 1, 1) * np.einsum("ki,kj->kij", diff, diff)
+        self.W = np.linalg.inv(Winv)
+        self.lower_bound = None
+        self.excluded_data = xr.Dataset()
+        self.retry_count = np.zeros(N, dtype=np.int32)
+        self.candidate_counts = np.array([N, N, N], dtype=np.int64)
+
+    def _fit_samples(self, source_agent, data, N, max_iter, tol, random_state, disp_message, screening_block, excluded=None):
+        '''
+        The per-sample loop of fit_from_agent: learn the candidates accepted by the fit filter one by one until N are learned.
+
+        The filter sees the parameters reset to their initial values whatever was learned before, so one call scores
+        a block of candidates. The first accepted candidate of the block is learned, the ones before it are excluded,
+        and the scoring starts again right after it. The filter is thus called about once per learned sample
+        instead of once per candidate. The excluded candidates are passed on as raw rows, to excluded if given.
+        '''
+        excluded_rows = []
+        pool = (data.X.values, data.C.values, data.Z.values)
+        count = 0
+        i = 0
+        n_generated = N
+        while i < N:
+            if count >= N:
+                count = 0
+                data = source_agent.generate(N)
+                pool = (data.X.values, data.C.values, data.Z.values)
+                n_generated += N
+            block = data.isel(n=slice(count, min(count + screening_block, N)))
+            self._init_params(random_state=random_state)
+            if self.fit_filter is None:
+                accepted = np.ones(len(block.n), dtype=bool)
             else:
-                self.excluded_data = xr.Dataset()
+                accepted = np.asarray(self.fit_filter(block, self, self.fit_filter_args), dtype=bool)
+            n_rejected = int(accepted.argmax()) if accepted.any() else len(accepted)
+            if n_rejected > 0:
+                rows = tuple(values[count:count + n_rejected] for values in pool)
+                if excluded is None:
+                    excluded_rows.append(rows)
+                else:
+                    excluded.append(*rows)
+            count += n_rejected
+            self.retry_count[i] += n_rejected
+            if n_rejected == len(accepted):
+                continue
+            self._fit_accepted(data.isel(n=count), max_iter=max_iter, tol=tol, random_state=random_state, disp_message=disp_message)
+            if self.track_learning:
+                self.history.record(i, self)
+            count += 1
+            i += 1
+        self.candidate_counts[:] = n_generated, N + self.retry_count.sum(), N
+        self.excluded_data = _excluded_dataset(excluded_rows)
+
+    def _can_fit_samples_jit(self):
+        '''
+        Whether the per-sample loop of fit_from_agent can run in the compiled kernel, warning about the reason if not.
+        '''
+        if not jit_kernels.NUMBA_AVAILABLE:
+            reason = "numba is not installed"
+        elif self.X is not None:
+            reason = "the agent has already learned samples"
+        elif self.dtype != np.float64:
+            reason = "the kernel computes in float64 only"
+        elif self.fit_filter not in JIT_FILTER_CODES:
+            reason = "the fit filter is not one of FILTER_DICT"
+        else:
+            return True
+        warnings.warn(f"jit is ignored because {reason}, using the NumPy per-sample loop")
+        return False
+
+    def _fit_samples_jit(self, source_agent, data, N, max_iter, tol, excluded=None):
+        '''
+        The per-sample loop of fit_from_agent in the compiled kernel src.agents.jit.fit_candidates.
+
+        The candidates, the filter decisions, the excluded data and the recorded history are the same as in the
+        NumPy loop, the parameters agree up to rounding.
+        '''
+        filter_code = getattr(jit_kernels, JIT_FILTER_CODES[self.fit_filter])
+        threshold = float((self.fit_filter_args or {}).get("threshold", 0.0))
+        self._init_params()
+        alpha, beta, nu = (np.array(value, dtype=np.float64) for value in (self.alpha, self.beta, self.nu))
+        m, W = np.array(self.m, dtype=np.float64), np.array(self.W, dtype=np.float64)
+        X = np.empty((N, self.D))
+        C = np.empty((N, self.K))
+        Z = np.empty((N, self.K), dtype=data.Z.dtype)
+        n_history = N if self.track_learning else 0
+        history = {
+            "alpha": np.empty((n_history, self.K)),
+            "beta": np.empty((n_history, self.K)),
+            "nu": np.empty((n_history, self.K)),
+            "m": np.empty((n_history, self.K, self.D)),
+            "W": np.empty((n_history, self.K, self.D, self.D)),
+        }
+        prior = self.prior_factors
+        excluded_rows = []
+        decisions = []
+        n_accepted = 0
+        n_generated = N
+        n_reset = 0
+        while True:
+            status = np.full(len(data.n), jit_kernels.CANDIDATE_PENDING)
+            n_accepted, lower_bound, n_batch_reset = jit_kernels.fit_candidates(
+                np.ascontiguousarray(data.X.values, dtype=np.float64),
+                np.ascontiguousarray(data.C.values, dtype=np.float64),
+                np.ascontiguousarray(data.Z.values, dtype=Z.dtype),
+                X, C, Z, n_accepted, N,
+                *(np.ascontiguousarray(value, dtype=np.float64) for value in (self.alpha0, self.beta0, self.nu0, self.m0, self.W0)),
+                np.ascontiguousarray(prior["W0_inv"], dtype=np.float64),
+                prior["logC_alpha0"], prior["log_beta0_sum"], prior["logB0_sum"],
+                filter_code, threshold, int(max_iter), tol,
+                alpha, beta, nu, m, W, status, self.track_learning,
+                history["alpha"], history["beta"], history["nu"], history["m"], history["W"],
+            )
+            n_reset += n_batch_reset
+            decisions.append(status[status != jit_kernels.CANDIDATE_PENDING] == jit_kernels.CANDIDATE_ACCEPTED)
+            rejected = np.flatnonzero(status == jit_kernels.CANDIDATE_REJECTED)
+            if len(rejected) > 0:
+                rows = (data.X.values[rejected], data.C.values[rejected], data.Z.values[rejected])
+                if excluded is None:
+                    excluded_rows.append(rows)
+                else:
+                    excluded.append(*rows)
+            if n_accepted >= N:
+                break
+            data = source_agent.generate(N)
+            n_generated += N
+        if n_reset > 0:
+            print(f"Warning: the parameters were reset {n_reset} times because W diverged")
+
+        self.X, self.C, self.Z = X, C, Z
+        self.alpha, self.beta, self.nu, self.m, self.W = alpha, beta, nu, m, W
+        self.retry_count = _retry_counts(np.concatenate(decisions))
+        self.candidate_counts[:] = n_generated, N + self.retry_count.sum(), N
+        self.lower_bound = lower_bound
+        if self.track_learning:
+            for i in range(N):
+                self.history.record(i, SimpleNamespace(**{name: value[i] for name, value in history.items()}))
+        self.excluded_data = _excluded_dataset(excluded_rows)
 
     def _e_like_step(self, X, C):
         '''
@@ -599,50 +954,9 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
             where r[n, k] = $r_{n, k}$.
 
         '''
-        N, _ = np.shape(X)
-
         tpi = self.C
 
-        arg_digamma = np.reshape(self.nu, (self.K, 1)) - np.reshape(np.arange(0, self.D, 1), (1, self.D))
-        tlam = np.exp( digamma(arg_digamma/2).sum(axis=1)  + self.D * np.log(2) + np.log(np.linalg.det(self.W)) )
-
-        diff = np.reshape(X, (N, 1, self.D) ) - np.reshape(self.m, (1, self.K, self.D) )
-        exponent = self.D / self.beta + self.nu * np.einsum("nkj,nkj->nk", np.einsum("nki,kij->nkj", diff, self.W), diff)
-
-        exponent_subtracted = exponent - np.reshape(exponent.min(axis=1), (N, 1))
-        rho = tpi*np.sqrt(tlam)*np.exp( -0.5 * exponent_subtracted )
-        r = rho/np.reshape(rho.sum(axis=1), (N, 1))
-
-
-        return r
-    def _m_like_step(self, X, r):
-        '''
-        Method for calculating the model parameters based on the responsibility.
-
-        Parameters
-        ----------
-        X : 2D numpy array
-            2D numpy array representing input data, where X[n, i] represents the i-th element of n-th point in X.
-        r : 2D numpy array
-            2-D numpy array representing responsibility of each component for each sample in X, 
-            where r[n, k] = $r_{n, k}$.
-        '''
-        N, _ = np.shape(X)
-        n_samples_in_component = r.sum(axis=0)
-        barx = r.T @ X / np.reshape(n_samples_in_component, (self.K, 1))
-        diff = np.reshape(X, (N, 1, self.D) ) - np.reshape(barx, (1, self.K, self.D) )
-        S = np.einsum("nki,nkj->kij", np.einsum("nk,nki->nki", r, diff), diff) / np.reshape(n_samples_in_component, (self.K, 1, 1))
-
-        self.alpha = self.alpha0 + n_samples_in_component
-        self.beta = self.beta0 + n_samples_in_component
-        self.nu = self.nu0 + n_samples_in_component
-        self.m = (self.beta0.reshape(-1, 1) * self.m0 + barx * np.reshape(n_samples_in_component, (self.K, 1)))/np.reshape(self.beta, (self.K, 1))
-
-        diff2 = barx - self.m0
-        Winv = np.reshape(np.linalg.inv( self.W0 ), (1, self.D, self.D)) + \
-            S * np.reshape(n_samples_in_component, (self.K, 1, 1)) + \
-            np.reshape( self.beta0 * n_samples_in_component / (self.beta0 + n_samples_in_component), (self.K, 1, 1)) * np.einsum("ki,kj->kij",diff2,diff2) 
-        self.W = np.linalg.inv(Winv)
+        return self.backend.e_like_step(X, tpi, self.beta, self.nu, self.m, self.W, self.dtype)
 
     def generate(self, n_samples,return_excluded_data=False):
         # 結果を格納するリスト
@@ -658,11 +972,11 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
             # Z（潜在変数）とC（混合係数）の生成
             if self.c_alpha is None:
                 alpha_norm = self.alpha / self.alpha.sum()
-                z_new = np.random.multinomial(1, alpha_norm, size=batch_size)
-                C_new = np.random.dirichlet(self.c_alpha, size=batch_size)
+                z_new = self.rng.multinomial(1, alpha_norm, size=batch_size)
+                C_new = self.rng.dirichlet(self.c_alpha, size=batch_size)
             else:
                 if self.mixture_pi:
-                    comopnent_idx = np.random.choice(
+                    comopnent_idx = self.rng.choice(
                         self.comopnent_num, 
                         size=batch_size, 
                         p=self.pi_mixture_ratio
@@ -670,48 +984,37 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
                     z_new = []
                     C_new = []
                     for i in range(batch_size):
-                        C_new_temp = np.random.dirichlet(
+                        C_new_temp = self.rng.dirichlet(
                             self.c_alpha[comopnent_idx[i]], 
                             size=1
                         )[0]
                         C_new.append(C_new_temp)
-                        z_new.append(np.random.multinomial(1, C_new_temp, size=1))
+                        z_new.append(self.rng.multinomial(1, C_new_temp, size=1))
                     z_new = np.vstack(z_new)
                     C_new = np.vstack(C_new)
                 else:
-                    C_new_temp = np.random.dirichlet(self.c_alpha, size=batch_size)
-                    z_new = np.array([
-                        np.random.multinomial(1, C_new_temp[i], size=1)[0] 
-                        for i in range(batch_size)
-                    ])
+                    C_new_temp = self.rng.dirichlet(self.c_alpha, size=batch_size)
+                    if self.sampler.design == "mc":
+                        z_new = np.array([
+                            self.rng.multinomial(1, C_new_temp[i], size=1)[0] 
+                            for i in range(batch_size)
+                        ])
+                    else:
+                        # 層化・準乱数の一様乱数から逆関数法で成分を割り当てる
+                        z_new = self.sampler.assign_components(C_new_temp, self.rng)
                     C_new = C_new_temp
             
-            # X（観測データ）の生成
-            X_new = np.zeros((batch_size, self.D))
+            # X（観測データ）の生成（成分ごとの共分散の分解はパラメータが変わるまで使い回す）
+            X_new = np.zeros((batch_size, self.D), dtype=self.dtype)
+            self.sampler.update(self)
             for k in range(self.K):
                 idx = np.where(z_new[:, k] == 1)[0]
                 if len(idx) > 0:
-
-                    # Validation check
-                    if not np.all(np.isfinite(self.W[k])):
-                        raise ValueError("W must be finite.")
-                    if not np.all(np.isfinite(self.m[k])):
-                        raise ValueError("m must be finite.")
-                    
-                    # Ensure that W is positive definite
-                    min_eig = np.min(np.linalg.eigvals(self.W[k]))
-                    if min_eig < 0:
-                        self.W[k] -= 10 * min_eig * np.eye(self.D)
-
-                    X_new[idx] = np.random.multivariate_normal(
-                        self.m[k],
-                        np.linalg.inv(self.beta[k] * self.W[k]),
-                        size=len(idx)
-                    )
+                    X_new[idx] = self.sampler.draw(self, k, len(idx), self.rng)
             temp_ret_ds = xr.Dataset(
                 {
                     'X': (['n', 'd'], X_new),
-                    'C': (['n', 'k'], C_new),
+                    'C': (['n', 'k'], C_new.astype(self.dtype, copy=False)),
                     'Z': (['n', 'k'], z_new),
                 },
                 coords={
@@ -730,8 +1033,8 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
             if temp_excluded_data is None:
                 temp_excluded_data = xr.Dataset(
                     {
-                        'X': (['n', 'd'], np.zeros((0, self.D))),
-                        'C': (['n', 'k'], np.zeros((0, self.K))),
+                        'X': (['n', 'd'], np.zeros((0, self.D), dtype=self.dtype)),
+                        'C': (['n', 'k'], np.zeros((0, self.K), dtype=self.dtype)),
                         'Z': (['n', 'k'], np.zeros((0, self.K))),
                     },
                     coords={'n': [], 'd': np.arange(self.D), 'k': np.arange(self.K)}
@@ -758,8 +1061,8 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
                 else:  # Create empty dataset if no excluded data
                     final_excluded_data = xr.Dataset(
                         {
-                            'X': (['n', 'd'], np.zeros((0, self.D))),
-                            'C': (['n', 'k'], np.zeros((0, self.K))),
+                            'X': (['n', 'd'], np.zeros((0, self.D), dtype=self.dtype)),
+                            'C': (['n', 'k'], np.zeros((0, self.K), dtype=self.dtype)),
                             'Z': (['n', 'k'], np.zeros((0, self.K))),
                         },
                         coords={'n': [], 'd': np.arange(self.D), 'k': np.arange(self.K)}
@@ -798,6 +1101,31 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
             X = data
         joint_proba = self._predict_joint_proba(X, C)
         return joint_proba / joint_proba.sum(axis=1).reshape(-1, 1)
+
+    def predict_log_joint(self, data):
+        '''
+        Method for calculating the log joint probability, used by the filters (see src.agents.filters).
+
+        Parameters
+        ----------
+        data : tuple of 2D numpy arrays or xr.Dataset
+            Input data X and context C, as for predict_proba.
+
+        Returns
+        ----------
+        log_joint : 2D numpy array
+            A numpy array with shape (len(X), self.K), where log_joint[n, k] = log of the joint probability of _predict_joint_proba
+        '''
+        if isinstance(data, tuple):
+            X, C = data
+        else:
+            X = data.X.values
+            C = data.C.values
+            if len(X.shape) == 1:
+                X, C = X.reshape(1, -1), C.reshape(1, -1)
+        with np.errstate(divide="ignore"):
+            return self._log_predictive(X) + np.log(C)
+
     def _predict_joint_proba(self, X, C):
         '''
         Method for calculating and returning the joint probability.     
@@ -817,5 +1145,5 @@ class BayesianGaussianMixtureModelWithContext(BayesianGaussianMixtureModel):
         L = np.reshape( (self.nu + 1 - self.D)*self.beta/(1 + self.beta), (self.K, 1,1) ) * self.W
         tmp = np.zeros((len(X), self.K))
         for k in range(self.K):
-            tmp[:,k] = multi_student_t(X, self.m[k], L[k], self.nu[k] + 1 - self.D)
+            tmp[:,k] = self.backend.multi_student_t(X, self.m[k], L[k], self.nu[k] + 1 - self.D)
         return tmp * C
\ No newline at end of file
@@ -0,0 +1,284 @@
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+
+from ..utils.lazy import LazyModule
+
+# imported on first use, see src.utils.lazy
+xr = LazyModule("xarray")
+special = LazyModule("scipy.special")
+
+# byte alignment of every array inside the shared block
+_ALIGN = 64
+
+
+def _predictive_factors(agent):
+    '''
+    Factors of the Student-t posterior predictive of each component, as used by _predict_joint_proba.
+
+    Returns
+    ----------
+    factors : dict
+        m : (K, D) location, L_inv : (K, D, D) inverse of the precision-like matrix L,
+        dof : (K, ) degrees of freedom, log_norm : (K, ) log normalisation constant.
+    '''
+    dof = agent.nu + 1 - agent.D
+    L = np.reshape(dof * agent.beta / (1 + agent.beta), (agent.K, 1, 1)) * agent.W
+    log_norm = special.gammaln((dof + agent.D) / 2) - special.gammaln(dof / 2) - agent.D / 2 * np.log(dof * np.pi) - 0.5 * np.linalg.slogdet(L)[1]
+    return {
+        "m": np.asarray(agent.m, dtype=np.float64),
+        "L_inv": np.linalg.inv(L),
+        "dof": np.asarray(dof, dtype=np.float64),
+        "log_norm": np.asarray(log_norm, dtype=np.float64),
+    }
+
+
+def _attach_untracked(name):
+    '''
+    Attach to an existing shared memory block without registering it with the resource tracker.
+
+    The creator unlinks the block. A worker's resource tracker must neither unlink it when the worker exits
+    nor see it twice, which depends on the start method when the block is registered on attach.
+    '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedParentBatch:
+    '''
+    A batch of data generated by one parent agent and the parent's predictive factors, placed in shared memory.
+
+    The process creating the batch owns the memory block and unlinks it on close.
+    Worker processes attach to it through the picklable ``handle`` and read the arrays without copying.
+
+    Parameters
+    ----------
+    arrays : dict of numpy arrays
+        The arrays to place in shared memory.
+    '''
+    def __init__(self, arrays=None, handle=None):
+        if (arrays is None) == (handle is None):
+            raise ValueError("Exactly one of arrays and handle must be given.")
+        if arrays is not None:
+            layout = {}
+            offset = 0
+            for name, value in arrays.items():
+                value = np.ascontiguousarray(value)
+                layout[name] = (offset, value.shape, value.dtype.str)
+                offset += -(-value.nbytes // _ALIGN) * _ALIGN
+            self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+            self._owner = True
+            self.handle = {"name": self._shm.name, "layout": layout}
+            self.arrays = self._map_arrays()
+            for name, value in arrays.items():
+                self.arrays[name][...] = value
+                self.arrays[name].setflags(write=False)
+        else:
+            self._shm = _attach_untracked(handle["name"])
+            self._owner = False
+            self.handle = handle
+            self.arrays = self._map_arrays()
+            for value in self.arrays.values():
+                value.setflags(write=False)
+
+    @classmethod
+    def from_agent(cls, agent, n_samples):
+        '''
+        Generate n_samples from agent (after its generate filter) and place them in shared memory,
+        together with the predictive factors of agent.
+        '''
+        data = agent.generate(n_samples)
+        arrays = {
+            "X": data.X.values,
+            "C": data.C.values,
+            "Z": data.Z.values,
+        }
+        for name, value in _predictive_factors(agent).items():
+            arrays["factor_" + name] = value
+        return cls(arrays=arrays)
+
+    @classmethod
+    def attach(cls, handle):
+        return cls(handle=handle)
+
+    def _map_arrays(self):
+        return {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf, offset=offset)
+            for name, (offset, shape, dtype) in self.handle["layout"].items()
+        }
+
+    def close(self):
+        # the views must be released before the buffer can be closed
+        self.arrays = {}
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SharedParentView:
+    '''
+    Read-only stand-in for a parent agent, serving data from a SharedParentBatch.
+
+    It provides the generate, predict_proba and predict_log_joint methods used by fit_from_agent and the filters,
+    so an unmodified child agent can learn from it. Each view serves the rows [start, stop) of the
+    batch in order and raises once they are used up: the other rows belong to the other children,
+    and sharing them would make the children's data dependent.
+
+    Parameters
+    ----------
+    batch : SharedParentBatch
+    start, stop : int
+        The rows of the batch reserved for this view.
+    '''
+    def __init__(self, batch, start, stop):
+        self.batch = batch
+        self.position = start
+        self.stop = stop
+        self.m = batch.arrays["factor_m"]
+        self.K, self.D = self.m.shape
+
+    def _take(self, n_samples):
+        if n_samples > self.stop - self.position:
+            raise RuntimeError(
+                f"The rows reserved for this learner are used up ({self.stop - self.position} left, {n_samples} requested), "
+                "increase rows_per_child."
+            )
+        idx = np.arange(self.position, self.position + n_samples)
+        self.position += n_samples
+        return idx
+
+    def generate(self, n_samples, return_excluded_data=False):
+        idx = self._take(n_samples)
+        # fancy indexing copies the rows, so the learner never keeps a view on the shared block
+        ret_ds = xr.Dataset(
+            {
+                'X': (['n', 'd'], self.batch.arrays["X"][idx]),
+                'C': (['n', 'k'], self.batch.arrays["C"][idx]),
+                'Z': (['n', 'k'], self.batch.arrays["Z"][idx]),
+            },
+            coords={'n': np.arange(n_samples), 'd': np.arange(self.D), 'k': np.arange(self.K)}
+        )
+        if not return_excluded_data:
+            return ret_ds
+        # the generate filter of the parent was applied when the batch was created
+        excluded_data = xr.Dataset(
+            {
+                'X': (['n', 'd'], np.zeros((0, self.D))),
+                'C': (['n', 'k'], np.zeros((0, self.K))),
+                'Z': (['n', 'k'], np.zeros((0, self.K))),
+            },
+            coords={'n': [], 'd': np.arange(self.D), 'k': np.arange(self.K)}
+        )
+        return {
+            'data': ret_ds,
+            'excluded_data': excluded_data
+        }
+
+    def _log_predictive(self, data):
+        if isinstance(data, tuple):
+            X, C = data
+        else:
+            X = data.X.values
+            C = data.C.values
+            if len(X.shape) == 1:
+                X, C = X.reshape(1, -1), C.reshape(1, -1)
+        arrays = self.batch.arrays
+        diff = X[:, None, :] - arrays["factor_m"][None, :, :]
+        maha = np.einsum("nki,kij,nkj->nk", diff, arrays["factor_L_inv"], diff)
+        dof = arrays["factor_dof"]
+        return arrays["factor_log_norm"] - (dof + self.D) / 2 * np.log(1 + maha / dof), C
+
+    def predict_proba(self, data):
+        '''
+        Probability of belonging to each component under the parent, computed from the shared predictive factors.
+        '''
+        log_joint, C = self._log_predictive(data)
+        joint_proba = np.exp(log_joint) * C
+        return joint_proba / joint_proba.sum(axis=1).reshape(-1, 1)
+
+    def predict_log_joint(self, data):
+        '''
+        Log joint probability under the parent, used by the filters (see src.agents.filters).
+        '''
+        log_predictive, C = self._log_predictive(data)
+        with np.errstate(divide="ignore"):
+            return log_predictive + np.log(C)
+
+
+_worker_batch = None
+
+
+def _init_worker(handle):
+    global _worker_batch
+    _worker_batch = SharedParentBatch.attach(handle)
+
+
+def _fit_child(create_child, start, stop, seed_sequence, N, fit_kwargs):
+    rng = np.random.default_rng(seed_sequence)
+    source = SharedParentView(_worker_batch, start, stop)
+    child = create_child(rng=rng)
+    child.fit_from_agent(source, N=N, **fit_kwargs)
+    return child
+
+
+def fit_children_from_parent(parent, create_child, n_children, N, rows_per_child=None, n_workers=None, seed=None, fit_kwargs=None):
+    '''
+    Fit several children on data of one parent, in worker processes sharing the parent's batch.
+
+    The parent generates the data of all children in one call, and the batch and the parent's predictive
+    factors are placed in shared memory once, instead of being generated and pickled for every child.
+
+    Parameters
+    ----------
+    parent : BayesianGaussianMixtureModelWithContext
+        The agent generating the data.
+    create_child : callable
+        Picklable callable taking the keyword argument rng and returning a new child agent,
+        e.g. functools.partial(BayesianGaussianMixtureModelWithContext, K, D, ...).
+    n_children : int
+        The number of children.
+    N : int
+        The number of samples each child learns.
+    rows_per_child : int
+        The number of rows of the batch reserved for each child. Defaults to N. Learners rejecting samples
+        with a fit filter draw further blocks of N rows until N are accepted, so they need a multiple of N
+        covering their rejections; a child running out of rows raises a RuntimeError instead of reading
+        the rows of the other children.
+    n_workers : int
+        The number of worker processes.
+    seed : int or np.random.SeedSequence
+        Seed of the children's random generators, one SeedSequence is spawned per child.
+    fit_kwargs : dict
+        Keyword arguments passed to fit_from_agent.
+
+    Returns
+    ----------
+    children : list
+        The fitted children.
+    '''
+    if rows_per_child is None:
+        rows_per_child = N
+    if fit_kwargs is None:
+        fit_kwargs = {}
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    with SharedParentBatch.from_agent(parent, n_children * rows_per_child) as batch:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(batch.handle,)) as executor:
+            futures = [
+                executor.submit(_fit_child, create_child, i * rows_per_child, (i + 1) * rows_per_child, child_seed_sequence, N, fit_kwargs)
+                for i, child_seed_sequence in enumerate(seed_sequence.spawn(n_children))
+            ]
+            children = [future.result() for future in futures]
+    return children
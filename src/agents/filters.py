@@ -0,0 +1,150 @@
+import numpy as np
+
+from ..utils.lazy import LazyModule
+
+# imported on first use, see src.utils.lazy
+special = LazyModule("scipy.special")
+
+
+def argmax_matches(log_joint, Z, args):
+    '''
+    The most probable component is the one the sample was generated from. The argmax needs no normalisation.
+    '''
+    return log_joint.argmax(axis=1) == Z.argmax(axis=1)
+
+
+def max_prob_above(log_joint, Z, args):
+    '''
+    The largest posterior probability exceeds args["threshold"]: max_k log p(x, z_k) - logsumexp_k log p(x, z_k) > log(threshold).
+    '''
+    with np.errstate(divide="ignore"):
+        return log_joint.max(axis=1) - special.logsumexp(log_joint, axis=1) > np.log(args["threshold"])
+
+
+def entropy_below(log_joint, Z, args):
+    '''
+    The entropy of the posterior probabilities is below args["threshold"].
+    '''
+    p = np.exp(log_joint - special.logsumexp(log_joint, axis=1, keepdims=True))
+    p = np.clip(p, 1e-10, 1-1e-10)
+    return -np.sum(p * np.log(p), axis=1) < args["threshold"]
+
+
+# the criteria by the filter name of FILTER_DICT
+CRITERIA = {
+    "missunderstand": argmax_matches,
+    "low_max_prob": max_prob_above,
+    "high_entropy": entropy_below,
+}
+
+# relative cost of each criterion, the cheaper ones are evaluated first
+CRITERION_COST = {
+    argmax_matches: 0,
+    max_prob_above: 1,
+    entropy_below: 2,
+}
+
+
+def _labels(data):
+    '''
+    The one-hot components Z the samples of data were generated from, (N, K), or None if data has none.
+    '''
+    if isinstance(data, tuple) or "Z" not in data:
+        return None
+    Z = data["Z"].values
+    return Z.reshape(1, -1) if Z.ndim == 1 else Z
+
+
+class LogScoreFilter:
+    '''
+    A fit or generate filter evaluated on the log-joint scores log p(X[n], z_k=1 | training data) of a batch of samples.
+
+    The scores are computed once per batch (model.predict_log_joint), then the criteria are combined with AND (mode "all")
+    or OR (mode "any"). Each criterion is only evaluated on the samples whose result is still open, cheapest first,
+    so in a rejection-heavy batch the costly criteria see few samples.
+
+    An instance is called like the filters of FILTER_DICT, filter(data, model, args), and returns the boolean mask of accepted samples.
+
+    Parameters
+    ----------
+    criteria : list
+        Each item is a criterion function criterion(log_joint, Z, args) -> mask (e.g. argmax_matches), a filter name of CRITERIA,
+        a pair (criterion or name, args), or another LogScoreFilter. A criterion without its own args receives the args
+        given when the filter is called. For a named criterion those are args[name] if present, otherwise args itself.
+    mode : str
+        "all" accepts the samples passing every criterion, "any" the samples passing at least one.
+    '''
+    def __init__(self, criteria, mode="all"):
+        if mode not in ("all", "any"):
+            raise ValueError("mode must be 'all' or 'any'")
+        self.mode = mode
+        self.criteria = []
+        for criterion in criteria:
+            args = None
+            if isinstance(criterion, tuple):
+                criterion, args = criterion
+            name = criterion if isinstance(criterion, str) else None
+            if name is not None:
+                criterion = CRITERIA[name]
+            self.criteria.append((criterion, args, name))
+        self.criteria.sort(key=lambda item: self._cost(item[0]))
+
+    @staticmethod
+    def _cost(criterion):
+        if isinstance(criterion, LogScoreFilter):
+            return criterion.cost
+        return CRITERION_COST.get(criterion, 1)
+
+    @property
+    def cost(self):
+        return sum(self._cost(criterion) for criterion, _, _ in self.criteria)
+
+    def evaluate(self, log_joint, Z=None, args=None):
+        '''
+        Mask of the accepted samples given their log-joint scores (N, K) and one-hot components Z (N, K).
+        '''
+        accept_all = self.mode == "all"
+        mask = np.full(len(log_joint), accept_all)
+        for criterion, criterion_args, name in self.criteria:
+            # the samples whose result can still change
+            open_rows = np.flatnonzero(mask == accept_all)
+            if len(open_rows) == 0:
+                break
+            if criterion_args is None:
+                criterion_args = args[name] if name is not None and isinstance(args, dict) and name in args else args
+            sub_Z = None if Z is None else Z[open_rows]
+            if isinstance(criterion, LogScoreFilter):
+                result = criterion.evaluate(log_joint[open_rows], sub_Z, criterion_args)
+            else:
+                result = criterion(log_joint[open_rows], sub_Z, criterion_args)
+            mask[open_rows] = result
+        return mask
+
+    def __call__(self, data, model, args=None):
+        return self.evaluate(model.predict_log_joint(data), _labels(data), args)
+
+
+def all_of(*criteria):
+    '''
+    Filter accepting the samples which pass every criterion, see LogScoreFilter.
+    '''
+    return LogScoreFilter(criteria, mode="all")
+
+
+def any_of(*criteria):
+    '''
+    Filter accepting the samples which pass at least one criterion, see LogScoreFilter.
+    '''
+    return LogScoreFilter(criteria, mode="any")
+
+
+def parse_filter(name):
+    '''
+    Filter from a name: a name of CRITERIA, or names joined by "&" (all of them) or "|" (any of them),
+    e.g. "missunderstand&low_max_prob". The args of each criterion are looked up by its name, see LogScoreFilter.
+    '''
+    if "&" in name and "|" in name:
+        raise ValueError("A filter name can combine criteria with either '&' or '|', not both.")
+    if "|" in name:
+        return any_of(*name.split("|"))
+    return all_of(*name.split("&"))
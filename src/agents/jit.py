@@ -0,0 +1,293 @@
+import math
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # without numba the kernels run as plain (slow) Python, which keeps them checkable against the NumPy path
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# codes of the fit filters understood by the kernel, see FILTER_DICT
+FILTER_NONE = 0
+FILTER_HIGH_ENTROPY = 1
+FILTER_LOW_MAX_PROB = 2
+FILTER_MISSUNDERSTAND = 3
+
+# status of each candidate sample after fit_candidates
+CANDIDATE_PENDING = -1
+CANDIDATE_REJECTED = 0
+CANDIDATE_ACCEPTED = 1
+
+
+@njit(cache=True)
+def digamma(x):
+    '''
+    Digamma function for x > 0: recurrence up to x >= 6, then the asymptotic series (error below 1e-15).
+    '''
+    result = 0.0
+    while x < 6.0:
+        result -= 1.0 / x
+        x += 1.0
+    f = 1.0 / (x * x)
+    return result + math.log(x) - 0.5 / x - f * (1.0 / 12 - f * (1.0 / 120 - f * (1.0 / 252 - f * (1.0 / 240 - f / 132))))
+
+
+@njit(cache=True)
+def _init_params(n, alpha0, beta0, nu0, m0, W0, alpha, beta, nu, m, W):
+    '''
+    In place version of BayesianGaussianMixtureModel._init_params for n samples.
+    '''
+    K = len(alpha0)
+    for k in range(K):
+        alpha[k] = alpha0[k] + n / K
+        beta[k] = beta0[k] + n / K
+        nu[k] = nu0[k] + n / K
+        m[k] = m0[k]
+        W[k] = W0
+
+
+@njit(cache=True)
+def _predict_proba(x, c, beta, nu, m, W, p):
+    '''
+    Posterior class probabilities of one sample, see BayesianGaussianMixtureModelWithContext.predict_proba.
+    '''
+    K, D = m.shape
+    total = 0.0
+    for k in range(K):
+        dof = nu[k] + 1 - D
+        L = (dof * beta[k] / (1 + beta[k])) * W[k]
+        L_inv = np.linalg.inv(L)
+        quad = 0.0
+        for i in range(D):
+            for j in range(D):
+                quad += (x[i] - m[k, i]) * L_inv[i, j] * (x[j] - m[k, j])
+        log_pdf = math.lgamma((dof + D) / 2) - math.lgamma(dof / 2) - D / 2 * math.log(dof * math.pi) \
+            - 0.5 * math.log(np.linalg.det(L)) - (dof + D) / 2 * math.log(1 + quad / dof)
+        p[k] = math.exp(log_pdf) * c[k]
+        total += p[k]
+    for k in range(K):
+        p[k] /= total
+
+
+@njit(cache=True)
+def _accept(x, c, z, beta, nu, m, W, filter_code, threshold, p):
+    '''
+    Decision of the fit filters of bayesian_agents for one sample.
+    '''
+    if filter_code == FILTER_NONE:
+        return True
+    _predict_proba(x, c, beta, nu, m, W, p)
+    if filter_code == FILTER_HIGH_ENTROPY:
+        entropy = 0.0
+        for k in range(len(p)):
+            q = min(max(p[k], 1e-10), 1 - 1e-10)
+            entropy -= q * math.log(q)
+        return entropy < threshold
+    if filter_code == FILTER_LOW_MAX_PROB:
+        return np.max(p) > threshold
+    return np.argmax(p) == np.argmax(z)
+
+
+@njit(cache=True)
+def e_step(X, C, n, beta, nu, W, m, r):
+    '''
+    Responsibilities of the first n samples, see BayesianGaussianMixtureModelWithContext._e_like_step.
+    '''
+    K, D = m.shape
+    sqrt_tlam = np.empty(K)
+    for k in range(K):
+        log_tlam = D * math.log(2) + math.log(np.linalg.det(W[k]))
+        for d in range(D):
+            log_tlam += digamma((nu[k] - d) / 2)
+        sqrt_tlam[k] = math.sqrt(math.exp(log_tlam))
+    exponent = np.empty(K)
+    for i in range(n):
+        exponent_min = np.inf
+        for k in range(K):
+            quad = 0.0
+            for a in range(D):
+                for b in range(D):
+                    quad += (X[i, a] - m[k, a]) * W[k, a, b] * (X[i, b] - m[k, b])
+            exponent[k] = D / beta[k] + nu[k] * quad
+            exponent_min = min(exponent_min, exponent[k])
+        total = 0.0
+        for k in range(K):
+            r[i, k] = C[i, k] * sqrt_tlam[k] * math.exp(-0.5 * (exponent[k] - exponent_min))
+            total += r[i, k]
+        for k in range(K):
+            r[i, k] /= total
+
+
+@njit(cache=True)
+def m_step(X, r, n, alpha0, beta0, nu0, m0, W0_inv, alpha, beta, nu, m, W):
+    '''
+    Parameters from the responsibilities of the first n samples, see BayesianGaussianMixtureModelWithContext._m_like_step.
+    '''
+    K, D = m.shape
+    for k in range(K):
+        n_k = 0.0
+        barx = np.zeros(D)
+        for i in range(n):
+            n_k += r[i, k]
+            for a in range(D):
+                barx[a] += r[i, k] * X[i, a]
+        barx /= n_k
+        # n_k S, the scatter around barx
+        scatter = np.zeros((D, D))
+        for i in range(n):
+            for a in range(D):
+                for b in range(D):
+                    scatter[a, b] += r[i, k] * (X[i, a] - barx[a]) * (X[i, b] - barx[b])
+        alpha[k] = alpha0[k] + n_k
+        beta[k] = beta0[k] + n_k
+        nu[k] = nu0[k] + n_k
+        shrink = beta0[k] * n_k / (beta0[k] + n_k)
+        Winv = W0_inv.copy()
+        for a in range(D):
+            m[k, a] = (beta0[k] * m0[k, a] + barx[a] * n_k) / beta[k]
+            for b in range(D):
+                Winv[a, b] += scatter[a, b] + shrink * (barx[a] - m0[k, a]) * (barx[b] - m0[k, b])
+        W[k] = np.linalg.inv(Winv)
+
+
+@njit(cache=True)
+def calc_lower_bound(r, n, alpha, beta, nu, W, logC_alpha0, log_beta0_sum, logB0_sum):
+    '''
+    Variational lower bound of the first n samples, see BayesianGaussianMixtureModel._calc_lower_bound.
+    '''
+    K, D = W.shape[0], W.shape[-1]
+    lower_bound = logC_alpha0 + D / 2 * log_beta0_sum + K * logB0_sum
+    for i in range(n):
+        for k in range(K):
+            q = min(max(r[i, k], 1e-10), 1 - 1e-10)
+            lower_bound -= q * math.log(q)
+    lower_bound -= math.lgamma(np.sum(alpha))
+    for k in range(K):
+        lower_bound += math.lgamma(alpha[k]) - D / 2 * math.log(beta[k])
+        lower_bound -= D * math.log(2) + D * digamma(nu[k] / 2) - nu[k] / 2 * np.linalg.slogdet(W[k])[1]
+    return lower_bound
+
+
+@njit(cache=True)
+def log_b(W, nu):
+    '''
+    logB of bayesian_agents for a stack of matrices W (K, D, D) and nu (K, ).
+    '''
+    K, D = W.shape[0], W.shape[-1]
+    result = np.empty(K)
+    for k in range(K):
+        result[k] = D * math.log(2) + D * digamma(nu[k] / 2) - nu[k] / 2 * np.linalg.slogdet(W[k])[1]
+    return result
+
+
+@njit(cache=True)
+def student_t(X, m, L, nu):
+    '''
+    multi_student_t of bayesian_agents, the density of a multivariate Student-t distribution at the rows of X.
+    '''
+    N, D = X.shape
+    L_inv = np.linalg.inv(L)
+    log_norm = math.lgamma((nu + D) / 2) - math.lgamma(nu / 2) - D / 2 * math.log(nu * math.pi) - 0.5 * math.log(np.linalg.det(L))
+    result = np.empty(N)
+    for i in range(N):
+        quad = 0.0
+        for a in range(D):
+            for b in range(D):
+                quad += (X[i, a] - m[a]) * L_inv[a, b] * (X[i, b] - m[b])
+        result[i] = math.exp(log_norm - (nu + D) / 2 * math.log(1 + quad / nu))
+    return result
+
+
+@njit(cache=True)
+def _diverged(W):
+    '''
+    The divergence check of BayesianGaussianMixtureModelWithContext.fit for one component.
+    '''
+    if not np.all(np.isfinite(W)):
+        return True
+    return np.any(np.abs(np.linalg.eigvalsh(W)) > 1e10)
+
+
+@njit(cache=True)
+def fit_candidates(X_cand, C_cand, Z_cand, X, C, Z, n_accepted, n_target,
+                   alpha0, beta0, nu0, m0, W0, W0_inv, logC_alpha0, log_beta0_sum, logB0_sum,
+                   filter_code, threshold, max_iter, tol,
+                   alpha, beta, nu, m, W, status, record, history_alpha, history_beta, history_nu, history_m, history_W):
+    '''
+    The per-sample loop of BayesianGaussianMixtureModelWithContext.fit_from_agent, compiled as a whole.
+
+    The candidates are screened in order by the fit filter, evaluated at the prior as in the NumPy path.
+    Each accepted candidate is appended to the learned samples X, C, Z (preallocated, n_target rows)
+    and the model is refitted to all of them from the initial parameters until the lower bound changes by less than tol.
+
+    Parameters
+    ----------
+    X_cand, C_cand, Z_cand : numpy arrays (M, D), (M, K), (M, K)
+        The batch of candidates generated by the source agent.
+    X, C, Z : numpy arrays (n_target, D), (n_target, K), (n_target, K)
+        The learned samples, the first n_accepted rows are filled.
+    alpha, beta, nu, m, W : numpy arrays
+        The parameters, updated in place.
+    status : numpy array of int (M, )
+        Set to CANDIDATE_ACCEPTED or CANDIDATE_REJECTED for every screened candidate.
+    record : bool
+        Whether to write the parameters after learning sample i to history_*[i].
+
+    Returns
+    ----------
+    n_accepted : int
+        The number of learned samples, n_target unless the candidates ran out.
+    lower_bound : float
+        The lower bound of the last fit.
+    n_reset : int
+        The number of times the parameters were reset because W diverged.
+    '''
+    K, D = m.shape
+    r = np.empty((n_target, K))
+    p = np.empty(K)
+    lower_bound = np.nan
+    n_reset = 0
+    for candidate in range(len(X_cand)):
+        if n_accepted >= n_target:
+            break
+        _init_params(0, alpha0, beta0, nu0, m0, W0, alpha, beta, nu, m, W)
+        if not _accept(X_cand[candidate], C_cand[candidate], Z_cand[candidate], beta, nu, m, W, filter_code, threshold, p):
+            status[candidate] = CANDIDATE_REJECTED
+            continue
+        status[candidate] = CANDIDATE_ACCEPTED
+        X[n_accepted] = X_cand[candidate]
+        C[n_accepted] = C_cand[candidate]
+        Z[n_accepted] = Z_cand[candidate]
+        n = n_accepted + 1
+        if n_accepted == 0:
+            # the first sample initialises the parameters with N = 1
+            _init_params(1, alpha0, beta0, nu0, m0, W0, alpha, beta, nu, m, W)
+
+        e_step(X, C, n, beta, nu, W, m, r)
+        lower_bound = calc_lower_bound(r, n, alpha, beta, nu, W, logC_alpha0, log_beta0_sum, logB0_sum)
+        for _ in range(max_iter):
+            m_step(X, r, n, alpha0, beta0, nu0, m0, W0_inv, alpha, beta, nu, m, W)
+            e_step(X, C, n, beta, nu, W, m, r)
+            lower_bound_prev = lower_bound
+            lower_bound = calc_lower_bound(r, n, alpha, beta, nu, W, logC_alpha0, log_beta0_sum, logB0_sum)
+            for k in range(K):
+                if _diverged(W[k]):
+                    n_reset += 1
+                    _init_params(n, alpha0, beta0, nu0, m0, W0, alpha, beta, nu, m, W)
+            if abs(lower_bound - lower_bound_prev) < tol:
+                break
+
+        if record:
+            history_alpha[n_accepted] = alpha
+            history_beta[n_accepted] = beta
+            history_nu[n_accepted] = nu
+            history_m[n_accepted] = m
+            history_W[n_accepted] = W
+        n_accepted = n
+    return n_accepted, lower_bound, n_reset
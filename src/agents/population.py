@@ -0,0 +1,289 @@
+import numpy as np
+
+from ..utils.lazy import LazyModule
+from .backends import get_backend
+from .bayesian_agents import (
+    BayesianGaussianMixtureModelWithContext,
+    check_random_state,
+)
+from .filters import LogScoreFilter
+
+# imported on first use, see src.utils.lazy
+xr = LazyModule("xarray")
+special = LazyModule("scipy.special")
+
+
+def ring_topology(P, n_neighbors=1, include_self=True):
+    '''
+    Weight matrix of a ring, where agent p learns from the agents within n_neighbors positions of p.
+
+    Returns
+    ----------
+    weights : 2D numpy array
+        Array with shape (P, P), where weights[p, q] is the probability that a sample of child p comes from parent q.
+    '''
+    weights = np.zeros((P, P))
+    for offset in range(-n_neighbors, n_neighbors + 1):
+        if offset == 0 and not include_self:
+            continue
+        weights[np.arange(P), (np.arange(P) + offset) % P] = 1
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def lattice_topology(n_rows, n_cols, include_self=True, periodic=True):
+    '''
+    Weight matrix of a 2D lattice with von Neumann neighbourhood, agents numbered row by row.
+    '''
+    P = n_rows * n_cols
+    rows, cols = np.divmod(np.arange(P), n_cols)
+    weights = np.zeros((P, P))
+    if include_self:
+        weights[np.arange(P), np.arange(P)] = 1
+    for d_row, d_col in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        neighbor_rows, neighbor_cols = rows + d_row, cols + d_col
+        if periodic:
+            neighbor_rows, neighbor_cols = neighbor_rows % n_rows, neighbor_cols % n_cols
+            valid = np.ones(P, dtype=bool)
+        else:
+            valid = (neighbor_rows >= 0) & (neighbor_rows < n_rows) & (neighbor_cols >= 0) & (neighbor_cols < n_cols)
+        weights[np.arange(P)[valid], (neighbor_rows * n_cols + neighbor_cols)[valid]] = 1
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def random_topology(P, p_edge, rng=None, include_self=True):
+    '''
+    Weight matrix of an Erdos-Renyi random directed graph, agents without any parent learn from themselves.
+    '''
+    rng = check_random_state(rng)
+    weights = (rng.random((P, P)) < p_edge).astype(float)
+    weights[np.arange(P), np.arange(P)] = 1 if include_self else 0
+    weights[weights.sum(axis=1) == 0, :] = np.eye(P)[weights.sum(axis=1) == 0]
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+class BayesianGaussianMixtureModelPopulation:
+    '''
+    A population of P context agents stored as stacked parameter arrays.
+
+    Every generation each child p receives N samples. The parent of each sample is drawn from
+    the row p of the weight matrix of the topology, so data is routed with index arrays and the
+    generation, the generate filter of the parents and the variational fit run for all agents at once.
+    The fit uses the kernels of the NumPy backend (see src.agents.backends), which broadcast over the population axis,
+    so every agent follows the same updates as a single agent.
+
+    Parameters
+    ----------
+    template : BayesianGaussianMixtureModelWithContext
+        Agent providing the prior, c_alpha and the generate filter shared by all agents.
+    weights : 2D numpy array
+        Array with shape (P, P), where weights[p, q] is the probability that a sample of child p comes from parent q.
+    rng : None, int, np.random.SeedSequence or np.random.Generator
+        Random generator of the population, see check_random_state.
+    '''
+    def __init__(self, template, weights, rng=None):
+        if template.fit_filter is not None or template.track_learning:
+            raise ValueError("The population only supports fitting without fit_filter and track_learning.")
+        if template.generate_filter is not None and not isinstance(template.generate_filter, LogScoreFilter):
+            raise ValueError("The population only supports the generate filters of FILTER_DICT and other LogScoreFilter.")
+        if template.sampler.sampler == "student_t" or template.sampler.design != "mc":
+            raise ValueError("The population only draws Monte Carlo samples of the plug-in Gaussian.")
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 2 or weights.shape[0] != weights.shape[1]:
+            raise ValueError("The shape of weights is invalid.")
+        self.template = template
+        self.K = template.K
+        self.D = template.D
+        self.P = weights.shape[0]
+        self.weights = weights / weights.sum(axis=1, keepdims=True)
+        self.rng = check_random_state(rng)
+        self.X = None
+        self.C = None
+        self.Z = None
+        self.parent_index = None
+        self.n_excluded = np.zeros(self.P, dtype=int)
+        self._init_params()
+
+    def _init_params(self, N=0):
+        '''
+        Set the parameters of every agent as BayesianGaussianMixtureModel._init_params does for N samples.
+        '''
+        template = self.template
+        self.alpha = np.tile(template.alpha0 + N / self.K, (self.P, 1))
+        self.beta = np.tile(template.beta0 + N / self.K, (self.P, 1))
+        self.nu = np.tile(template.nu0 + N / self.K, (self.P, 1))
+        self.m = np.tile(template.m0, (self.P, 1, 1)).astype(float)
+        self.W = np.tile(template.W0, (self.P, self.K, 1, 1)).astype(float)
+
+    def agent(self, p):
+        '''
+        Return agent p as a BayesianGaussianMixtureModelWithContext sharing the prior of the template.
+        '''
+        template = self.template
+        agent = BayesianGaussianMixtureModelWithContext(
+            self.K, self.D, template.alpha0, template.beta0, template.nu0, template.m0, template.W0, template.c_alpha,
+            pi_mixture_ratio=getattr(template, "pi_mixture_ratio", None),
+            generate_filter=template.generate_filter,
+            generate_filter_args=template.generate_filter_args,
+            prior_factors=template.prior_factors,
+        )
+        agent.alpha, agent.beta, agent.nu = self.alpha[p].copy(), self.beta[p].copy(), self.nu[p].copy()
+        agent.m, agent.W = self.m[p].copy(), self.W[p].copy()
+        if self.X is not None:
+            agent.X, agent.C, agent.Z = self.X[p].copy(), self.C[p].copy(), self.Z[p].copy()
+        return agent
+
+    def _draw_parents(self, N):
+        cumulative_weights = np.cumsum(self.weights, axis=1)
+        u = self.rng.random((self.P, N))
+        parent_index = (u[:, :, None] > cumulative_weights[:, None, :]).sum(axis=2)
+        return np.minimum(parent_index, self.P - 1)
+
+    def _draw_samples(self, parent_index, cholesky):
+        '''
+        Draw C, Z and X for samples whose parents are given by the flat index array parent_index.
+        '''
+        n_rows = len(parent_index)
+        template = self.template
+        if template.mixture_pi:
+            component_idx = self.rng.choice(template.comopnent_num, size=n_rows, p=template.pi_mixture_ratio)
+            gamma = self.rng.standard_gamma(template.c_alpha[component_idx])
+        else:
+            gamma = self.rng.standard_gamma(np.broadcast_to(template.c_alpha, (n_rows, self.K)))
+        C = gamma / gamma.sum(axis=1, keepdims=True)
+        u = self.rng.random(n_rows)
+        z = np.minimum((u[:, None] > np.cumsum(C, axis=1)).sum(axis=1), self.K - 1)
+        eps = self.rng.standard_normal((n_rows, self.D))
+        X = self.m[parent_index, z] + np.einsum("nij,nj->ni", cholesky[parent_index, z], eps)
+        return X, C, np.eye(self.K, dtype=int)[z]
+
+    def _generate_filter_mask(self, X, C, Z, parent_index):
+        '''
+        Evaluate the generate filter of the parent of every sample in one vectorized pass.
+        '''
+        template = self.template
+        dof = self.nu + 1 - self.D
+        L = (dof * self.beta / (1 + self.beta))[:, :, None, None] * self.W
+        log_norm = special.gammaln((dof + self.D) / 2) - special.gammaln(dof / 2) - self.D / 2 * np.log(dof * np.pi) - 0.5 * np.linalg.slogdet(L)[1]
+
+        diff = X[:, None, :] - self.m[parent_index]
+        maha = np.einsum("nki,nkij,nkj->nk", diff, np.linalg.inv(L)[parent_index], diff)
+        with np.errstate(divide="ignore"):
+            log_joint = log_norm[parent_index] - (dof[parent_index] + self.D) / 2 * np.log(1 + maha / dof[parent_index]) + np.log(C)
+        return template.generate_filter.evaluate(log_joint, Z, template.generate_filter_args)
+
+    def generate(self, N):
+        '''
+        Draw N samples for every child from the current population acting as parents.
+
+        Returns
+        ----------
+        X, C, Z : numpy arrays
+            Arrays with shape (P, N, D), (P, N, K) and (P, N, K).
+        '''
+        for k in range(self.K):
+            # Ensure that W is positive definite, as BayesianGaussianMixtureModelWithContext.generate does
+            min_eig = np.linalg.eigvalsh(self.W[:, k]).min(axis=1)
+            self.W[min_eig < 0, k] -= 10 * min_eig[min_eig < 0, None, None] * np.eye(self.D)
+        cholesky = np.linalg.cholesky(np.linalg.inv(self.beta[:, :, None, None] * self.W))
+
+        parent_index = self._draw_parents(N).ravel()
+        child_index = np.repeat(np.arange(self.P), N)
+        X, C, Z = self._draw_samples(parent_index, cholesky)
+        self.n_excluded = np.zeros(self.P, dtype=int)
+        if self.template.generate_filter is not None:
+            # redraw the rejected samples from the same parents until every slot is accepted
+            pending = np.flatnonzero(~self._generate_filter_mask(X, C, Z, parent_index))
+            while len(pending) > 0:
+                self.n_excluded += np.bincount(child_index[pending], minlength=self.P)
+                X[pending], C[pending], Z[pending] = self._draw_samples(parent_index[pending], cholesky)
+                accepted = self._generate_filter_mask(X[pending], C[pending], Z[pending], parent_index[pending])
+                pending = pending[~accepted]
+        self.parent_index = parent_index.reshape(self.P, N)
+        return X.reshape(self.P, N, self.D), C.reshape(self.P, N, self.K), Z.reshape(self.P, N, self.K)
+
+    def fit(self, X, C, Z=None, max_iter=1000, tol=1e-4):
+        '''
+        Fit every agent p to (X[p], C[p]), stopping each agent at its own convergence.
+
+        Parameters
+        ----------
+        X : 3D numpy array
+            Array with shape (P, N, D).
+        C : 3D numpy array
+            Array with shape (P, N, K).
+        '''
+        template = self.template
+        N = X.shape[1]
+        self.X, self.C, self.Z = X, C, Z
+        self._init_params(N)
+        W0_inv = template.prior_factors["W0_inv"]
+        kernels = get_backend("numpy")
+
+        r = kernels.e_like_step(X, C, self.beta, self.nu, self.m, self.W)
+        lower_bound = kernels.lower_bound(r, self.alpha, self.beta, self.nu, self.W, template.prior_factors)
+        active = np.arange(self.P)
+        for i in range(max_iter):
+            X_a, C_a = (X, C) if len(active) == self.P else (X[active], C[active])
+            alpha, beta, nu, m, W = kernels.m_like_step(X_a, r[active], template.alpha0, template.beta0, template.nu0, template.m0, W0_inv)
+            r_a = kernels.e_like_step(X_a, C_a, beta, nu, m, W)
+            lower_bound_new = kernels.lower_bound(r_a, alpha, beta, nu, W, template.prior_factors)
+
+            # Check if W is diverging, as BayesianGaussianMixtureModelWithContext.fit does
+            eigvals = np.linalg.eigvals(W)
+            diverged = ~np.all(np.isfinite(W), axis=(1, 2, 3)) | np.any(np.abs(eigvals) > 1e10, axis=(1, 2))
+            if np.any(diverged):
+                alpha[diverged] = template.alpha0 + N / self.K
+                beta[diverged] = template.beta0 + N / self.K
+                nu[diverged] = template.nu0 + N / self.K
+                m[diverged] = template.m0
+                W[diverged] = template.W0
+
+            self.alpha[active], self.beta[active], self.nu[active], self.m[active], self.W[active] = alpha, beta, nu, m, W
+            r[active] = r_a
+            converged = np.abs(lower_bound_new - lower_bound[active]) < tol
+            lower_bound[active] = lower_bound_new
+            active = active[~converged]
+            if len(active) == 0:
+                break
+        self.lower_bound = lower_bound
+
+    def step(self, N, max_iter=1000, tol=1e-4):
+        '''
+        Advance the population by one generation: every child learns N samples from its parents.
+        '''
+        X, C, Z = self.generate(N)
+        self.fit(X, C, Z, max_iter=max_iter, tol=tol)
+
+    def run(self, n_generations, N, max_iter=1000, tol=1e-4):
+        '''
+        Run n_generations generations and return the stacked parameters of every generation.
+
+        Returns
+        ----------
+        history : xr.Dataset
+            Parameters with dimensions (iter, p, k, ...), and the number of samples excluded by the generate filter.
+        '''
+        history = {
+            "alpha": np.zeros((n_generations, self.P, self.K)),
+            "beta": np.zeros((n_generations, self.P, self.K)),
+            "nu": np.zeros((n_generations, self.P, self.K)),
+            "m": np.zeros((n_generations, self.P, self.K, self.D)),
+            "W": np.zeros((n_generations, self.P, self.K, self.D, self.D)),
+            "n_excluded": np.zeros((n_generations, self.P), dtype=int),
+        }
+        for i in range(n_generations):
+            self.step(N, max_iter=max_iter, tol=tol)
+            history["alpha"][i], history["beta"][i], history["nu"][i] = self.alpha, self.beta, self.nu
+            history["m"][i], history["W"][i] = self.m, self.W
+            history["n_excluded"][i] = self.n_excluded
+        return xr.Dataset(
+            {
+                "alpha": (["iter", "p", "k"], history["alpha"]),
+                "beta": (["iter", "p", "k"], history["beta"]),
+                "nu": (["iter", "p", "k"], history["nu"]),
+                "m": (["iter", "p", "k", "d"], history["m"]),
+                "W": (["iter", "p", "k", "d", "d2"], history["W"]),
+                "n_excluded": (["iter", "p"], history["n_excluded"]),
+            },
+            coords={"iter": np.arange(n_generations), "p": np.arange(self.P), "k": np.arange(self.K), "d": np.arange(self.D)}
+        )
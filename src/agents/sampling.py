@@ -0,0 +1,167 @@
+import warnings
+import numpy as np
+
+from ..utils.lazy import LazyModule
+
+# imported on first use, see src.utils.lazy; scipy.stats alone takes about a second to import
+special = LazyModule("scipy.special")
+qmc = LazyModule("scipy.stats.qmc")
+
+# the distributions generate can draw X from, see PredictiveSampler
+SAMPLERS = ("gaussian", "gaussian_cholesky", "student_t")
+# the designs of the uniform numbers behind the draws, see uniforms
+DESIGNS = ("mc", "stratified", "sobol", "halton")
+# the scipy.stats.qmc engine of each design
+QMC_ENGINES = {"stratified": "LatinHypercube", "sobol": "Sobol", "halton": "Halton"}
+
+
+def uniforms(design, n, d, rng):
+    '''
+    n points uniform in [0, 1)^d following design.
+
+    "mc" draws independent uniforms. "stratified" draws a Latin hypercube: each coordinate has exactly one point
+    in each of the n strata [i/n, (i+1)/n). "sobol" and "halton" draw scrambled low-discrepancy sequences.
+    Every point is uniform on its own, so the estimates stay unbiased, while the points of one call cover
+    the cube more evenly than independent ones, which lowers their variance.
+    '''
+    if design == "mc":
+        return rng.random((n, d))
+    if isinstance(rng, np.random.RandomState):
+        # the engines take a Generator; seed one from the RandomState (e.g. the global one of check_random_state(None))
+        rng = np.random.default_rng(rng.randint(np.iinfo(np.int64).max, dtype=np.int64))
+    try:
+        engine = getattr(qmc, QMC_ENGINES[design])(d, scramble=True, rng=rng)
+    except TypeError:
+        # SciPy before 1.15 names the argument seed
+        engine = getattr(qmc, QMC_ENGINES[design])(d, scramble=True, seed=rng)
+    with warnings.catch_warnings():
+        # Sobol points are best balanced for powers of 2, but any prefix is still a valid randomized QMC set
+        warnings.filterwarnings("ignore", message="The balance properties of Sobol")
+        return engine.random(n)
+
+
+class PredictiveSampler:
+    '''
+    Draws the samples X of each component for generate, with the factor of each component covariance cached
+    for one version of the parameters.
+
+    The factors are computed on the first draw from a component and kept until m, beta, nu or W change
+    (checked on every update), so regenerating from the same agent, e.g. in the filtered loop of fit_from_agent,
+    costs only the random draws.
+
+    Parameters
+    ----------
+    sampler : str
+        "gaussian" draws from the plug-in Gaussian N(m_k, (beta_k W_k)^-1). Its factor is the one of
+        Generator.multivariate_normal (SVD), so the samples are the same as with multivariate_normal.
+        "gaussian_cholesky" draws from the same distribution with the Cholesky factor, which is cheaper to compute.
+        "student_t" draws from the posterior predictive, the Student-t distribution with nu_k + 1 - D degrees of freedom
+        of calc_prob_density, with the Cholesky factor of its scale matrix.
+    design : str
+        The design of the random numbers, one of DESIGNS (see uniforms). With "mc" the normal and chi-square variates
+        are drawn directly. With the other designs they are the inverse CDFs of the design points,
+        one point per sample, and assign_components draws the components from stratified uniforms.
+    '''
+    def __init__(self, sampler="gaussian", design="mc"):
+        if sampler not in SAMPLERS:
+            raise ValueError(f"sampler must be one of {SAMPLERS}")
+        if design not in DESIGNS:
+            raise ValueError(f"design must be one of {DESIGNS}")
+        self.sampler = sampler
+        self.design = design
+        self.params = None
+        self.factors = {}
+
+    def update(self, agent):
+        '''
+        Drop the cached factors if the parameters of agent are not the ones they were computed from.
+        '''
+        params = (agent.m, agent.beta, agent.nu, agent.W)
+        if self.params is not None and all(np.array_equal(a, b) for a, b in zip(self.params, params)):
+            return
+        self.params = tuple(np.array(value, copy=True) for value in params)
+        self.factors = {}
+
+    def _factor(self, agent, k):
+        '''
+        The transposed factor F of the covariance of component k (covariance = F.T @ F) and the degrees of freedom (or None).
+        '''
+        if k in self.factors:
+            return self.factors[k]
+        # Validation check
+        if not np.all(np.isfinite(agent.W[k])):
+            raise ValueError("W must be finite.")
+        if not np.all(np.isfinite(agent.m[k])):
+            raise ValueError("m must be finite.")
+
+        # Ensure that W is positive definite
+        min_eig = np.min(np.linalg.eigvals(agent.W[k]))
+        if min_eig < 0:
+            agent.W[k] -= 10 * min_eig * np.eye(agent.D)
+            self.params[3][k] = agent.W[k]
+
+        if self.sampler == "student_t":
+            dof = agent.nu[k] + 1 - agent.D
+            scale = np.linalg.inv((dof * agent.beta[k] / (1 + agent.beta[k])) * agent.W[k])
+            factor = (np.linalg.cholesky(scale).T, dof)
+        else:
+            cov = np.linalg.inv(agent.beta[k] * agent.W[k])
+            if self.sampler == "gaussian_cholesky":
+                factor = (np.linalg.cholesky(cov).T, None)
+            else:
+                u, s, vh = np.linalg.svd(cov)
+                factor = ((u * np.sqrt(s)).T, None)
+        self.factors[k] = factor
+        return factor
+
+    def draw(self, agent, k, n_samples, rng):
+        '''
+        Draw n_samples points of component k of agent with rng, an array with shape (n_samples, D).
+        '''
+        factor, dof = self._factor(agent, k)
+        if self.design == "mc":
+            deviation = rng.standard_normal((n_samples, agent.D)) @ factor
+            if dof is not None:
+                deviation *= np.sqrt(dof / rng.chisquare(dof, size=n_samples))[:, None]
+            return agent.m[k] + deviation
+        U = uniforms(self.design, n_samples, agent.D + (dof is not None), rng)
+        deviation = special.ndtri(U[:, :agent.D]) @ factor
+        if dof is not None:
+            deviation *= np.sqrt(dof / special.chdtri(dof, 1 - U[:, agent.D]))[:, None]
+        return agent.m[k] + deviation
+
+    def draw_statistics(self, agent, k, n_samples, rng):
+        '''
+        The mean (D,) and the scatter matrix sum_n (x_n - mean)(x_n - mean)^T (D, D) of n_samples points of component k,
+        drawn directly from their distributions instead of from the points.
+
+        For the Gaussian samplers the mean is N(m_k, cov / n_samples) and, independently, the scatter matrix is
+        Wishart(n_samples - 1, cov), drawn with the Bartlett decomposition and the cached factor of cov, so the cost
+        is O(D^3) whatever n_samples. With n_samples <= D the scatter matrix is singular and the points are drawn instead.
+        '''
+        if self.sampler == "student_t" or self.design != "mc":
+            raise ValueError("The statistics can only be drawn for the Gaussian samplers with the design 'mc'.")
+        factor, _ = self._factor(agent, k)
+        D = agent.D
+        if n_samples == 0:
+            return np.zeros(D), np.zeros((D, D))
+        if n_samples <= D:
+            X = self.draw(agent, k, n_samples, rng)
+            mean = X.mean(axis=0)
+            return mean, (X - mean).T @ (X - mean)
+        mean = agent.m[k] + rng.standard_normal(D) @ factor / np.sqrt(n_samples)
+        # Bartlett decomposition: A A^T ~ Wishart(dof, I) for A lower triangular with
+        # chi-distributed diagonal and standard normal entries below it
+        dof = n_samples - 1
+        A = np.tril(rng.standard_normal((D, D)), -1)
+        A[np.diag_indices(D)] = np.sqrt(rng.chisquare(dof - np.arange(D)))
+        B = factor.T @ A
+        return mean, B @ B.T
+
+    def assign_components(self, C, rng):
+        '''
+        One-hot components Z (N, K) with Z[n] drawn from the probabilities C[n], by inverse CDF of the uniforms of the design.
+        '''
+        u = uniforms(self.design, len(C), 1, rng)[:, 0]
+        z = np.minimum((u[:, None] > np.cumsum(C, axis=1)).sum(axis=1), C.shape[1] - 1)
+        return np.eye(C.shape[1], dtype=int)[z]
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+
+PARAM_VARIABLES = ("alpha", "beta", "nu", "m", "W")
+
+
+def param_file(folder_path, name):
+    return os.path.join(folder_path, f"params_{name}.npy")
+
+
+def save_param_files(folder_path, params):
+    '''
+    Write each variable of params to its own .npy file, which can be memory-mapped unlike the pickled params.npy.
+    '''
+    for name in PARAM_VARIABLES:
+        np.save(param_file(folder_path, name), params[name])
+
+
+def open_param(folder_path, name):
+    '''
+    Memory-map one variable of the parameters of a run, (iter, ...).
+
+    Runs saved before the per-variable files existed are split from params.npy on first access.
+    '''
+    path = param_file(folder_path, name)
+    if not os.path.exists(path):
+        save_param_files(folder_path, np.load(os.path.join(folder_path, "params.npy"), allow_pickle=True).item())
+    return np.load(path, mmap_mode="r")
+
+
+def stack_runs(folder_paths, name, generations=-1):
+    '''
+    Stack a slice of one variable of many runs into one array.
+
+    Only the selected generations are read from each memory-mapped file, straight into a preallocated array.
+
+    Parameters
+    ----------
+    folder_paths : list of str
+        The run folders.
+    name : str
+        The variable, one of PARAM_VARIABLES.
+    generations : int, slice or array of int
+        The generations to read, e.g. -1 for the last one or slice(500, None).
+
+    Returns
+    ----------
+    stack : numpy array (R, ...) or (R, G, ...)
+        The selected slice of every run, with a generation axis unless generations is an int.
+    '''
+    stack = None
+    for r, folder_path in enumerate(folder_paths):
+        values = open_param(folder_path, name)[generations]
+        if stack is None:
+            stack = np.empty((len(folder_paths),) + values.shape, dtype=values.dtype)
+        stack[r] = values
+    return stack
+
+
+def pool_generations(stack):
+    '''
+    Treat every generation of every run as one sample, (R, G, ...) -> (R * G, ...).
+    '''
+    return stack.reshape((-1,) + stack.shape[2:])
+
+
+def cross_run_moments(stack):
+    '''
+    Mean, variance and covariance across runs of the vectors on the last axis.
+
+    Parameters
+    ----------
+    stack : numpy array (R, ..., D)
+
+    Returns
+    ----------
+    mean : numpy array (..., D)
+    var : numpy array (..., D)
+        The variance (ddof=0, as np.var).
+    cov : numpy array (..., D, D)
+        The covariance (ddof=1, as np.cov).
+    '''
+    R = len(stack)
+    mean = stack.mean(axis=0)
+    centered = stack - mean
+    cov = np.einsum("r...i,r...j->...ij", centered, centered) / (R - 1)
+    var = np.diagonal(cov, axis1=-2, axis2=-1) * (R - 1) / R
+    return mean, var, cov
+
+
+def distance_from(stack, reference):
+    '''
+    Euclidean distance of the vectors on the last axis from reference (broadcast), e.g. the prior means m0 or the origin.
+    '''
+    return np.linalg.norm(stack - np.asarray(reference), axis=-1)
+
+
+def grouped_histogram(values, groups, bins=20, value_range=None):
+    '''
+    Histograms of several groups of columns with common bin edges, computed in one bincount.
+
+    Parameters
+    ----------
+    values : numpy array (R, C)
+        The values, e.g. distances of every run (rows) and cluster (columns).
+    groups : list of index arrays
+        The columns pooled into each histogram, e.g. [slice(0, None, 2), slice(1, None, 2)] for even and odd clusters.
+    bins : int
+        The number of bins.
+    value_range : tuple
+        The range of the bins, defaults to the range of values.
+
+    Returns
+    ----------
+    counts : numpy array (len(groups), bins)
+    bin_edges : numpy array (bins + 1, )
+    '''
+    values = np.asarray(values)
+    if value_range is None:
+        value_range = (np.min(values), np.max(values))
+    bin_edges = np.linspace(value_range[0], value_range[1], bins + 1)
+    group_of_column = np.full(values.shape[1], -1)
+    for g, columns in enumerate(groups):
+        group_of_column[columns] = g
+    group = np.broadcast_to(group_of_column, values.shape)
+    # the last bin is closed as in np.histogram, values outside the range are dropped
+    bin_index = np.clip(np.searchsorted(bin_edges, values, side="right") - 1, 0, bins - 1)
+    inside = (values >= bin_edges[0]) & (values <= bin_edges[-1]) & (group >= 0)
+    counts = np.bincount(group[inside] * bins + bin_index[inside], minlength=len(groups) * bins)
+    return counts.reshape(len(groups), bins), bin_edges
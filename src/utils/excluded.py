@@ -0,0 +1,186 @@
+import os
+import glob
+import numpy as np
+
+from .lazy import LazyModule
+
+# imported on first use, see src.utils.lazy
+xr = LazyModule("xarray")
+
+EXCLUDED_VARIABLES = ("X", "C", "Z")
+# rows buffered in memory before a chunk is written, when the sink has a directory
+CHUNK_ROWS = 65536
+
+
+class ExcludedSink:
+    '''
+    Store of the samples excluded by the filters in every generation of a run.
+
+    The rows are appended as raw arrays, each tagged with its generation, into growable arrays whose capacity is doubled
+    when full, so storing a rejected sample costs O(1) amortized. With directory, the rows are written as .npz chunks of
+    chunk_rows rows, which bounds the memory. With max_rows, a uniform reservoir sample of max_rows rows of the whole run
+    is kept instead (algorithm R), which bounds both; the true number of excluded samples per generation is still counted.
+
+    Parameters
+    ----------
+    n_iter : int
+        The number of generations.
+    K, D : int
+        The number of components and dimensions.
+    max_rows : int
+        If given, keep a reservoir sample of at most max_rows rows.
+    directory : str
+        If given, write the rows to chunk files in directory. Cannot be combined with max_rows.
+    chunk_rows : int
+        The number of rows per chunk file.
+    rng : np.random.Generator or int
+        The random generator of the reservoir sampling.
+    '''
+    def __init__(self, n_iter, K, D, max_rows=None, directory=None, chunk_rows=CHUNK_ROWS, rng=None):
+        if max_rows is not None and directory is not None:
+            raise ValueError("max_rows and directory cannot be combined.")
+        self.n_iter, self.K, self.D = n_iter, K, D
+        self.max_rows = max_rows
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.rng = np.random.default_rng(rng)
+        # the number of samples excluded in each generation, including the ones the reservoir dropped
+        self.n_excluded = np.zeros(n_iter, dtype=np.int64)
+        self.n_seen = 0
+        self.n_chunks = 0
+        self.n_rows = 0
+        self._allocate(max_rows if max_rows is not None else 1024)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _allocate(self, capacity):
+        self.arrays = {
+            "iter": np.empty(capacity, dtype=np.int32),
+            "X": np.empty((capacity, self.D)),
+            "C": np.empty((capacity, self.K)),
+            "Z": np.empty((capacity, self.K)),
+        }
+
+    def _grow(self, n_rows):
+        capacity = len(self.arrays["iter"])
+        if n_rows <= capacity:
+            return
+        arrays = self.arrays
+        self._allocate(max(n_rows, 2 * capacity))
+        for name, array in arrays.items():
+            self.arrays[name][:self.n_rows] = array[:self.n_rows]
+
+    def generation(self, i):
+        '''
+        Return the sink receiving the excluded samples of generation i.
+        '''
+        return GenerationSink(self, i)
+
+    def append(self, i, X, C, Z):
+        '''
+        Store the excluded samples X (n, D), C (n, K), Z (n, K) of generation i.
+        '''
+        n = len(X)
+        if n == 0:
+            return
+        n_seen = self.n_seen
+        self.n_seen += n
+        self.n_excluded[i] += n
+        rows = {"iter": np.full(n, i), "X": X, "C": C, "Z": Z}
+        if self.max_rows is not None:
+            # fill the reservoir, then replace a random row with probability max_rows / (number of rows seen)
+            n_fill = int(min(n, max(self.max_rows - n_seen, 0)))
+            self._write(slice(self.n_rows, self.n_rows + n_fill), rows, slice(0, n_fill))
+            self.n_rows += n_fill
+            position = self.rng.integers(0, n_seen + np.arange(n_fill, n) + 1)
+            for source in np.flatnonzero(position < self.max_rows):
+                self._write(position[source], rows, n_fill + source)
+            return
+        self._grow(self.n_rows + n)
+        self._write(slice(self.n_rows, self.n_rows + n), rows, slice(0, n))
+        self.n_rows += n
+        if self.directory is not None and self.n_rows >= self.chunk_rows:
+            self._flush()
+
+    def _write(self, target, rows, source):
+        for name, array in self.arrays.items():
+            array[target] = rows[name][source]
+
+    def _flush(self):
+        '''
+        Write the buffered rows to the next chunk file.
+        '''
+        if self.n_rows == 0:
+            return
+        np.savez(os.path.join(self.directory, f"excluded_{self.n_chunks:05d}.npz"),
+                 **{name: array[:self.n_rows] for name, array in self.arrays.items()})
+        self.n_chunks += 1
+        self.n_rows = 0
+
+    def rows(self):
+        '''
+        All the stored rows as a dict of arrays "iter", "X", "C" and "Z", in the order they were appended
+        (in reservoir order with max_rows).
+        '''
+        chunks = []
+        if self.directory is not None:
+            for path in sorted(glob.glob(os.path.join(self.directory, "excluded_*.npz"))):
+                with np.load(path) as chunk:
+                    chunks.append({name: chunk[name] for name in self.arrays})
+        chunks.append({name: array[:self.n_rows] for name, array in self.arrays.items()})
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in self.arrays}
+
+    def to_xarray(self):
+        '''
+        The stored rows as an xr.Dataset with the layout of excluded_data.nc: dimensions (iter, n, ...),
+        the generations with fewer rows padded with NaN, and the number of excluded samples per generation n_excluded.
+        '''
+        rows = self.rows()
+        order = np.argsort(rows["iter"], kind="stable")
+        counts = np.bincount(rows["iter"], minlength=self.n_iter)
+        position = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+        n_max = counts.max() if len(counts) > 0 else 0
+        data_vars = {"n_excluded": (["iter"], self.n_excluded)}
+        for name, dim in zip(EXCLUDED_VARIABLES, ["d", "k", "k"]):
+            values = np.full((self.n_iter, n_max, rows[name].shape[1]), np.nan)
+            values[rows["iter"][order], position] = rows[name][order]
+            data_vars[name] = (["iter", "n", dim], values)
+        return xr.Dataset(data_vars, coords={
+            "iter": np.arange(self.n_iter), "n": np.arange(n_max), "d": np.arange(self.D), "k": np.arange(self.K),
+        })
+
+    def save(self, path):
+        '''
+        Write the stored rows to path as netCDF, see to_xarray.
+        '''
+        self.to_xarray().to_netcdf(path)
+
+    def close(self):
+        '''
+        Remove the chunk files, if any.
+        '''
+        if self.directory is None:
+            return
+        for path in glob.glob(os.path.join(self.directory, "excluded_*.npz")):
+            os.remove(path)
+        if not os.listdir(self.directory):
+            os.rmdir(self.directory)
+
+
+class GenerationSink:
+    '''
+    The part of an ExcludedSink receiving one generation, handed to BayesianGaussianMixtureModelWithContext.fit_from_agent.
+    '''
+    def __init__(self, sink, i):
+        self.sink = sink
+        self.i = i
+
+    def append(self, X, C, Z):
+        self.sink.append(self.i, X, C, Z)
+
+    def append_dataset(self, data):
+        '''
+        Store the samples of an xr.Dataset with variables X, C and Z, e.g. the excluded data returned by generate.
+        '''
+        if "X" in data:
+            self.append(data.X.values, data.C.values, data.Z.values)
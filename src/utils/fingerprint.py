@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+FINGERPRINT_FILE = "fingerprint.txt"
+# index of the runs by fingerprint: one empty marker file per run in INDEX_DIR/<fingerprint>/
+INDEX_DIR = ".fingerprints"
+# marker in INDEX_DIR written by index_runs once every run folder of the data directory is indexed
+INDEX_COMPLETE_FILE = "complete"
+# significant digits kept of every number
+SIGNIFICANT_DIGITS = 12
+# config keys added after runs were saved, with the value meant when they are absent
+IMPLICIT_DEFAULTS = {"dtype": "float64", "sampler": "gaussian", "sample_design": "mc", "transmission": "samples",
+                     "population_size": 1, "topology": "ring"}
+
+
+def normalize_config(value):
+    '''
+    Canonical form of a config: dict keys sorted, arrays and tuples as nested lists,
+    every number as a float rounded to SIGNIFICANT_DIGITS significant digits.
+
+    Configs equal up to the formatting of their numbers and arrays (1 or 1.0, list or ndarray,
+    float rounding noise) have the same canonical form.
+    '''
+    if isinstance(value, dict):
+        return {str(key): normalize_config(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [normalize_config(item) for item in value]
+    if isinstance(value, (bool, np.bool_)) or value is None or isinstance(value, str):
+        return value.item() if isinstance(value, np.bool_) else value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        value = float(value)
+        # negative zero and zero must collide
+        return float(f"{value:.{SIGNIFICANT_DIGITS}g}") + 0.0
+    raise TypeError(f"Cannot normalize config value {value!r} of type {type(value)}.")
+
+
+def config_fingerprint(config):
+    '''
+    Stable hash of the canonical form of a config (a dict, e.g. the content of config.json).
+
+    Keys of IMPLICIT_DEFAULTS set to their default are left out, so older configs without them keep their fingerprint.
+    '''
+    config = {key: value for key, value in config.items() if key not in IMPLICIT_DEFAULTS or value != IMPLICIT_DEFAULTS[key]}
+    canonical = json.dumps(normalize_config(config), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def register_run(data_dir, folder_name, config):
+    '''
+    Write the fingerprint of a run to its folder and add the run to the index of data_dir.
+    '''
+    fingerprint = config_fingerprint(config)
+    with open(os.path.join(data_dir, folder_name, FINGERPRINT_FILE), "w") as f:
+        f.write(fingerprint)
+    index_dir = os.path.join(data_dir, INDEX_DIR, fingerprint)
+    os.makedirs(index_dir, exist_ok=True)
+    # creating an empty file is atomic, so runs saved concurrently do not race on the index
+    open(os.path.join(index_dir, folder_name), "w").close()
+    return fingerprint
+
+
+def index_runs(data_dir):
+    '''
+    Add every run folder of data_dir with a config.json to the index, e.g. runs saved before fingerprints existed
+    or copied from another data directory, and mark the index as complete.
+
+    find_runs calls it once, while the index has no INDEX_COMPLETE_FILE marker. Runs saved afterwards are added by
+    register_run, run folders copied in by hand need another call (e.g. the --reindex option of the plot scripts).
+    '''
+    for folder_name in os.listdir(data_dir):
+        folder_path = os.path.join(data_dir, folder_name)
+        if folder_name == INDEX_DIR or not os.path.exists(os.path.join(folder_path, "config.json")):
+            continue
+        fingerprint_path = os.path.join(folder_path, FINGERPRINT_FILE)
+        if os.path.exists(fingerprint_path):
+            with open(fingerprint_path) as f:
+                if os.path.exists(os.path.join(data_dir, INDEX_DIR, f.read().strip(), folder_name)):
+                    continue
+        with open(os.path.join(folder_path, "config.json")) as f:
+            register_run(data_dir, folder_name, json.load(f))
+    os.makedirs(os.path.join(data_dir, INDEX_DIR), exist_ok=True)
+    open(os.path.join(data_dir, INDEX_DIR, INDEX_COMPLETE_FILE), "w").close()
+
+
+def find_runs(data_dir, config):
+    '''
+    Names of the run folders of data_dir whose config has the same fingerprint as config, sorted.
+
+    The lookup reads a single index directory. The first lookup in a data directory whose index is not marked complete
+    indexes all its run folders with index_runs (runs saved before fingerprints existed); folders copied in later
+    are only found after another call of index_runs.
+    '''
+    if not os.path.exists(os.path.join(data_dir, INDEX_DIR, INDEX_COMPLETE_FILE)):
+        index_runs(data_dir)
+    index_dir = os.path.join(data_dir, INDEX_DIR, config_fingerprint(config))
+    if not os.path.isdir(index_dir):
+        return []
+    # runs deleted by hand leave a stale marker
+    return sorted(name for name in os.listdir(index_dir) if os.path.isdir(os.path.join(data_dir, name)))
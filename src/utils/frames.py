@@ -0,0 +1,92 @@
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+
+class GifFrameWriter:
+    '''
+    Writer appending frames to a GIF file as they are produced.
+
+    Every frame is quantized to its own palette and encoded to disk immediately,
+    so memory does not grow with the number of frames (Pillow's save_all keeps every frame until the end).
+
+    Parameters
+    ----------
+    path : str
+        The output file.
+    duration : int
+        The display time of each frame in milliseconds.
+    loop : int
+        The number of loops, 0 loops forever.
+    '''
+    def __init__(self, path, duration=500, loop=0):
+        self.path = path
+        self.duration = duration
+        self.loop = loop
+        self.n_frames = 0
+        self._file = open(path, "wb")
+
+    def write(self, frame):
+        '''
+        Append a frame, given as a PIL image or an (H, W, 3|4) uint8 array such as canvas.buffer_rgba().
+        '''
+        if not isinstance(frame, Image.Image):
+            frame = Image.fromarray(np.asarray(frame)[..., :3])
+        # the fast octree quantizer is an order of magnitude faster than the default median cut
+        frame = frame.convert("RGB").quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        if self.n_frames == 0:
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": self.loop, "duration": self.duration})
+            for block in header:
+                self._file.write(block)
+        for block in GifImagePlugin.getdata(frame, duration=self.duration, include_color_table=True):
+            self._file.write(block)
+        self.n_frames += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        # GIF trailer
+        self._file.write(b";")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def save_animation(fig, artists, update, n_frames, path, duration=500):
+    '''
+    Render an animation by blitting artists created once, streaming the frames to a GIF file.
+
+    The figure is drawn once without the animated artists and kept as the background. For every frame
+    update(i) changes the data of the artists (offsets, vertices, ...), which are then drawn over the
+    restored background and the frame is written to disk, so the cost grows with the number of frames only.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure, with axes limits and static content already set up.
+    artists : list
+        The artists changing between frames.
+    update : callable
+        update(i) sets the data of artists for frame i.
+    n_frames : int
+        The number of frames.
+    path : str
+        The output GIF file.
+    duration : int
+        The display time of each frame in milliseconds.
+    '''
+    for artist in artists:
+        artist.set_animated(True)
+    canvas = fig.canvas
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    with GifFrameWriter(path, duration=duration) as writer:
+        for i in range(n_frames):
+            update(i)
+            canvas.restore_region(background)
+            for artist in artists:
+                fig.draw_artist(artist)
+            writer.write(np.asarray(canvas.buffer_rgba()))
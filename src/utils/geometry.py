@@ -0,0 +1,62 @@
+import numpy as np
+
+# the level set drawn by the plots: pdf(x) = pdf(m) * exp(-1), i.e. Mahalanobis radius sqrt(2)
+CONFIDENCE_RADIUS = np.sqrt(2)
+
+
+def _covariance_2d(precision):
+    '''
+    The covariance of the first two dimensions, the marginal drawn on a 2D plot.
+    '''
+    return np.linalg.inv(precision)[..., :2, :2]
+
+
+def ellipse_axes(m, precision, radius=CONFIDENCE_RADIUS):
+    '''
+    Centre, axis lengths and angle of the ellipses {x : (x - m)^T precision (x - m) = radius^2}, for any batch of Gaussians.
+
+    Parameters
+    ----------
+    m : numpy array (..., D)
+        The means.
+    precision : numpy array (..., D, D)
+        The precision matrices, e.g. beta[..., None, None] * W for the expected component covariance (beta W)^-1 used by the plots.
+    radius : float
+        The Mahalanobis radius.
+
+    Returns
+    ----------
+    center : numpy array (..., 2)
+    width, height : numpy array (...)
+        The full lengths of the major and minor axes.
+    angle : numpy array (...)
+        The angle of the major axis in degrees, as taken by matplotlib.patches.Ellipse.
+    '''
+    eigenvalues, eigenvectors = np.linalg.eigh(_covariance_2d(precision))
+    # eigh sorts ascending, the major axis is the last eigenvector
+    width = 2 * radius * np.sqrt(eigenvalues[..., 1])
+    height = 2 * radius * np.sqrt(eigenvalues[..., 0])
+    angle = np.degrees(np.arctan2(eigenvectors[..., 1, 1], eigenvectors[..., 0, 1]))
+    return np.asarray(m)[..., :2], width, height, angle
+
+
+def ellipse_vertices(m, precision, radius=CONFIDENCE_RADIUS, n_points=64):
+    '''
+    Closed polygons tracing the ellipses of ellipse_axes, computed for the whole batch at once.
+
+    Parameters
+    ----------
+    m, precision, radius
+        See ellipse_axes.
+    n_points : int
+        The number of vertices of each polygon, the first vertex is repeated at the end.
+
+    Returns
+    ----------
+    vertices : numpy array (..., n_points, 2)
+    '''
+    L = np.linalg.cholesky(_covariance_2d(precision))
+    theta = np.linspace(0, 2 * np.pi, n_points)
+    circle = radius * np.stack([np.cos(theta), np.sin(theta)], axis=-1)
+    # x = m + L u for u on the circle of the given radius
+    return np.asarray(m)[..., None, :2] + np.einsum("...ij,pj->...pi", L, circle)
@@ -0,0 +1,301 @@
+import os
+import numpy as np
+import xarray as xr
+from xarray.core import indexing
+
+HISTORY_VARIABLES = ("alpha", "beta", "nu", "m", "W")
+HISTORY_FORMATS = ("plain", "compressed", "delta")
+
+
+def select_sample_index(N, every=1, n_log=None):
+    '''
+    Indices of the samples whose parameter snapshots are kept.
+
+    Parameters
+    ----------
+    N : int
+        The number of samples learned per generation.
+    every : int
+        Keep every k-th sample. The last sample is always kept.
+    n_log : int
+        If given, keep about n_log log-spaced samples instead, which resolves the fast early learning.
+
+    Returns
+    ----------
+    sample_index : 1D numpy array
+        Sorted unique sample indices.
+    '''
+    if n_log is not None:
+        sample_index = np.round(np.geomspace(1, N, n_log)).astype(int) - 1
+    else:
+        sample_index = np.arange(0, N, every)
+    return np.unique(np.append(sample_index, N - 1))
+
+
+class HistoryRecorder:
+    '''
+    Recorder of the per-sample parameter snapshots of a track_learning run.
+
+    The snapshots are written straight into one preallocated array block per variable,
+    with shape (n_iter, len(sample_index), ...), or into .npy files memory-mapped from directory.
+    An xarray view is only built by to_xarray.
+
+    Parameters
+    ----------
+    n_iter : int
+        The number of generations.
+    N : int
+        The number of samples learned per generation.
+    K, D : int
+        The number of components and dimensions.
+    every, n_log : int
+        The downsampling policy, see select_sample_index.
+    directory : str
+        If given, the blocks are memory-mapped .npy files in directory instead of arrays in memory.
+    '''
+    def __init__(self, n_iter, N, K, D, every=1, n_log=None, directory=None):
+        self.n_iter, self.N, self.K, self.D = n_iter, N, K, D
+        self.sample_index = select_sample_index(N, every, n_log)
+        self._slot = np.full(N, -1)
+        self._slot[self.sample_index] = np.arange(len(self.sample_index))
+        self.directory = directory
+
+        n_snapshots = len(self.sample_index)
+        shapes = {
+            "alpha": (n_iter, n_snapshots, K),
+            "beta": (n_iter, n_snapshots, K),
+            "nu": (n_iter, n_snapshots, K),
+            "m": (n_iter, n_snapshots, K, D),
+            "W": (n_iter, n_snapshots, K, D, D),
+        }
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.arrays = {
+                name: np.lib.format.open_memmap(os.path.join(directory, f"history_{name}.npy"), mode="w+", dtype=np.float64, shape=shape)
+                for name, shape in shapes.items()
+            }
+        else:
+            self.arrays = {name: np.zeros(shape) for name, shape in shapes.items()}
+
+    def generation(self, i):
+        '''
+        Return the recorder writing the snapshots of generation i.
+        '''
+        return GenerationHistory(self, i)
+
+    def record(self, i, n, agent):
+        '''
+        Store the parameters of agent after learning sample n of generation i, if n is kept.
+        '''
+        slot = self._slot[n]
+        if slot < 0:
+            return
+        for name in HISTORY_VARIABLES:
+            self.arrays[name][i, slot] = getattr(agent, name)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def to_xarray(self):
+        '''
+        View of the snapshots as an xr.Dataset with the layout of history.nc, the n coordinate holding the sample indices.
+        '''
+        return xr.Dataset({
+            "alpha": (["iter", "n", "k"], self.arrays["alpha"]),
+            "beta": (["iter", "n", "k"], self.arrays["beta"]),
+            "nu": (["iter", "n", "k"], self.arrays["nu"]),
+            "m": (["iter", "n", "k", "d"], self.arrays["m"]),
+            "W": (["iter", "n", "k", "d", "d"], self.arrays["W"])
+        },
+        coords={"iter": np.arange(self.n_iter), "n": self.sample_index, "k": np.arange(self.K), "d": np.arange(self.D)})
+
+    def save(self, path, history_format="delta", **kwargs):
+        '''
+        Write the snapshots to path, see save_history for history_format and the keyword arguments.
+        '''
+        save_history(self.to_xarray(), path, history_format=history_format, **kwargs)
+
+    def close(self):
+        '''
+        Flush and remove the memory-mapped blocks, if any.
+        '''
+        if self.directory is None:
+            return
+        for array in self.arrays.values():
+            array.flush()
+        self.arrays = {}
+        for name in HISTORY_VARIABLES:
+            os.remove(os.path.join(self.directory, f"history_{name}.npy"))
+        if not os.listdir(self.directory):
+            os.rmdir(self.directory)
+
+
+class GenerationHistory:
+    '''
+    The part of a HistoryRecorder holding one generation, handed to BayesianGaussianMixtureModelWithContext.fit_from_agent.
+    '''
+    def __init__(self, recorder, i):
+        self.recorder = recorder
+        self.i = i
+
+    @property
+    def sample_index(self):
+        return self.recorder.sample_index
+
+    def record(self, n, agent):
+        self.recorder.record(self.i, n, agent)
+
+    def __getitem__(self, name):
+        return self.recorder.arrays[name][self.i]
+
+    def to_xarray(self):
+        return self.recorder.to_xarray().isel(iter=self.i)
+
+
+def _round_mantissa(bits, keep_bits):
+    '''
+    Round the float64 values viewed as uint64 bits to keep_bits mantissa bits, half away from zero.
+    The dropped low bits become zero, which makes the XOR deltas of slowly changing values compress well.
+    '''
+    drop = 52 - keep_bits
+    if drop <= 0:
+        return bits
+    mask = ~np.uint64((1 << drop) - 1)
+    return (bits + np.uint64(1 << (drop - 1))) & mask
+
+
+def _xor_delta_encode(values, keyframe_interval, keep_bits=None):
+    '''
+    Encode values of shape (iter, n, ...) as uint64 XOR deltas along n.
+
+    The snapshot at every keyframe_interval-th position of n is stored as is, every other snapshot as the
+    XOR of its bits with the previous snapshot, so any snapshot is decoded from its keyframe only.
+    '''
+    encoded = np.empty(values.shape, dtype=np.uint64)
+    for i in range(values.shape[0]):
+        bits = np.ascontiguousarray(values[i], dtype=np.float64).view(np.uint64)
+        if keep_bits is not None:
+            bits = _round_mantissa(bits, keep_bits)
+        encoded[i] = bits
+        encoded[i, 1:] ^= bits[:-1]
+        encoded[i, ::keyframe_interval] = bits[::keyframe_interval]
+    return encoded
+
+
+def _xor_delta_decode(encoded, keyframe_interval):
+    '''
+    Decode XOR deltas of shape (iter, n, ...) whose first position along n is a keyframe.
+    '''
+    decoded = np.empty(encoded.shape, dtype=np.uint64)
+    for block_start in range(0, encoded.shape[1], keyframe_interval):
+        block = slice(block_start, block_start + keyframe_interval)
+        np.bitwise_xor.accumulate(encoded[:, block], axis=1, out=decoded[:, block])
+    return decoded.view(np.float64)
+
+
+def save_history(dataset, path, history_format="delta", keyframe_interval=64, keep_bits=None, complevel=4):
+    '''
+    Write a history dataset (see HistoryRecorder.to_xarray) to a netCDF file.
+
+    Parameters
+    ----------
+    dataset : xr.Dataset
+        The history with dims (iter, n, ...).
+    path : str
+        The output file.
+    history_format : str
+        "plain" writes the arrays as they are, as before.
+        "compressed" writes zlib compressed variables chunked by (1, keyframe_interval, ...),
+        so reading one (iter, n) only decompresses its chunk.
+        "delta" additionally stores the snapshots as keyframes plus XOR deltas of consecutive snapshots,
+        which is lossless and is decoded by open_history.
+    keyframe_interval : int
+        The number of snapshots per chunk along n, and the distance between two keyframes.
+    keep_bits : int
+        If given, the values are rounded to keep_bits mantissa bits before writing ("compressed" and "delta"),
+        a relative error of at most 2**-(keep_bits + 1) which compresses much better. None is lossless.
+    complevel : int
+        The zlib compression level.
+    '''
+    if history_format not in HISTORY_FORMATS:
+        raise ValueError(f"Unknown history format {history_format}, expected one of {HISTORY_FORMATS}.")
+    if history_format == "plain":
+        dataset.to_netcdf(path)
+        return
+
+    encoded = xr.Dataset(coords=dataset.coords, attrs=dict(dataset.attrs))
+    encoding = {}
+    for name, variable in dataset.data_vars.items():
+        values = variable.values
+        chunksizes = (1, min(keyframe_interval, values.shape[1])) + values.shape[2:]
+        if history_format == "delta":
+            values = _xor_delta_encode(values, keyframe_interval, keep_bits)
+        elif keep_bits is not None:
+            values = _round_mantissa(np.ascontiguousarray(values, dtype=np.float64).view(np.uint64), keep_bits).view(np.float64)
+        encoded[name] = (variable.dims, values)
+        encoding[name] = {"zlib": True, "shuffle": True, "complevel": complevel, "chunksizes": chunksizes}
+    encoded.attrs["history_format"] = history_format
+    encoded.attrs["keyframe_interval"] = keyframe_interval
+    if keep_bits is not None:
+        encoded.attrs["keep_bits"] = keep_bits
+    encoded.to_netcdf(path, engine="netcdf4", encoding=encoding)
+
+
+class XorDeltaArray(xr.backends.BackendArray):
+    '''
+    Lazily decoded view of a variable written by save_history with history_format="delta".
+
+    Indexing only reads the chunks of the file between the keyframe preceding the requested snapshots
+    and the last requested snapshot. The encoded variable is read through the public indexing of xr.Variable,
+    and the lazy indexing goes through the functions of xarray's guide to backends
+    (explicit_indexing_adapter and LazilyIndexedArray); benchmark.py check_history fails if they change.
+
+    Parameters
+    ----------
+    variable : xr.Variable
+        The encoded variable of a dataset opened with cache=False, which reads from the file on indexing.
+    keyframe_interval : int
+        The distance between two keyframes along n.
+    '''
+    def __init__(self, variable, keyframe_interval):
+        self.variable = variable
+        self.keyframe_interval = keyframe_interval
+        self.shape = variable.shape
+        self.dtype = np.dtype(np.float64)
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.BASIC, self._getitem)
+
+    def _getitem(self, key):
+        iter_key, n_key, rest = key[0], key[1], key[2:]
+        n_positions = np.atleast_1d(np.arange(self.shape[1])[n_key])
+        start = n_positions.min() // self.keyframe_interval * self.keyframe_interval if len(n_positions) else 0
+        stop = n_positions.max() + 1 if len(n_positions) else 0
+        iter_read = iter_key if isinstance(iter_key, slice) else slice(iter_key % self.shape[0], iter_key % self.shape[0] + 1)
+        read_key = (iter_read, slice(start, stop)) + rest
+        encoded = self.variable[read_key].values
+        decoded = _xor_delta_decode(encoded, self.keyframe_interval)[:, n_positions - start]
+        # drop the axes indexed by an integer
+        return decoded[(slice(None) if isinstance(iter_key, slice) else 0, slice(None) if isinstance(n_key, slice) else 0)]
+
+
+def open_history(path):
+    '''
+    Open a history file lazily, whatever history_format it was written with.
+
+    Only the snapshots which are indexed (e.g. .isel(iter=i) or ["m"][i]) are read and decoded,
+    so the plotting scripts do not decode the whole file.
+    '''
+    # cache=False, otherwise the first access loads the whole variable into memory
+    dataset = xr.open_dataset(path, cache=False)
+    if dataset.attrs.get("history_format") != "delta":
+        return dataset
+    keyframe_interval = int(dataset.attrs["keyframe_interval"])
+    decoded = {}
+    for name, variable in dataset.data_vars.items():
+        # the variable of the open dataset reads its chunks from the file on indexing
+        array = XorDeltaArray(variable.variable, keyframe_interval)
+        decoded[name] = xr.Variable(variable.dims, indexing.LazilyIndexedArray(array))
+    ret = xr.Dataset(decoded, coords=dataset.coords, attrs=dataset.attrs)
+    ret.set_close(dataset.close)
+    return ret
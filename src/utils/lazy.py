@@ -0,0 +1,46 @@
+import importlib
+
+
+class LazyModule:
+    '''
+    Stand-in for a module which is only imported on the first access to one of its attributes,
+    e.g. xr = LazyModule("xarray") at the top of a file and xr.Dataset(...) in a function.
+
+    Importing the heavy dependencies (xarray, SciPy, numba, matplotlib) on first use keeps the startup of the
+    entry points short, which counts when a sweep starts many short processes. The import itself goes through
+    importlib.import_module, so concurrent first accesses from several threads are safe.
+
+    Parameters
+    ----------
+    name : str
+        The absolute name of the module, e.g. "scipy.special".
+    setup : callable
+        Called once before the module is imported, e.g. to select the backend of matplotlib before pyplot.
+    '''
+    def __init__(self, name, setup=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_setup"] = setup
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            if self.__dict__["_setup"] is not None:
+                self.__dict__["_setup"]()
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    @property
+    def is_loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
@@ -1 +1,22 @@
-from .analytical_metrics import MixtureDirichletGaussianWishartEvaluator
\ No newline at end of file
+import importlib
+
+# imported on first access (PEP 562): analytical_metrics loads scipy.stats and convergence loads xarray
+_SUBMODULE_OF = {
+    "MixtureDirichletGaussianWishartEvaluator": "analytical_metrics",
+    "first_passage_index": "convergence",
+    "convergence_times": "convergence",
+}
+
+__all__ = list(_SUBMODULE_OF)
+
+
+def __getattr__(name):
+    if name not in _SUBMODULE_OF:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_SUBMODULE_OF[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULE_OF))
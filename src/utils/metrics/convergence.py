@@ -0,0 +1,73 @@
+import numpy as np
+import xarray as xr
+
+
+def first_passage_index(distance, thresholds):
+    """
+    距離の系列が各閾値を初めて下回るインデックスをまとめて計算する
+
+    距離の累積最小値は単調非増加なので、閾値 t を初めて下回る位置は
+    累積最小値が t 以上である要素の個数に等しい。全ての閾値をこの一回の走査で求める。
+
+    Parameters:
+    -----------
+    distance : np.ndarray
+        形状 (..., N) の距離。最後の軸がサンプルの順番
+    thresholds : array_like
+        形状 (T,) の閾値
+
+    Returns:
+    --------
+    np.ndarray : 形状 (..., T) の整数配列。下回らない場合は N
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    running_min = np.minimum.accumulate(distance, axis=-1)
+    return (running_min[..., None] >= thresholds).sum(axis=-2)
+
+
+def convergence_times(history_m, target_m, thresholds, per_component=False, iter_chunk=16):
+    """
+    全世代・全閾値の収束時間（パラメータ m が目標値に近づくまでのサンプル数）を計算する
+
+    Parameters:
+    -----------
+    history_m : xr.DataArray
+        history.nc の m (iter, n, k, d)。open_history で遅延読み込みしたものでもよい
+    target_m : np.ndarray
+        各世代の目標値 (iter, k, d)。例えば親エージェントの学習後の m
+    thresholds : array_like
+        閾値 (T,)
+    per_component : bool
+        True の場合はクラスタごとの距離、False の場合は全クラスタの m をまとめたノルムで判定する
+    iter_chunk : int
+        一度に読み込む世代数。ファイルは各世代につき一度だけ読まれる
+
+    Returns:
+    --------
+    xr.DataArray : 収束時間 (iter, [k,] threshold)。値は n 座標（記録したサンプル番号）で、
+        閾値を下回らない場合はサンプル数 (n 座標の最後 + 1)
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    target_m = np.asarray(target_m)
+    sample_index = history_m["n"].values
+    # 収束しない場合の値も n 座標で表すため、番兵を末尾に追加しておく
+    sample_index = np.append(sample_index, sample_index[-1] + 1)
+    n_iter = history_m.sizes["iter"]
+
+    times = [np.zeros((0, history_m.sizes["k"], len(thresholds)) if per_component else (0, len(thresholds)), dtype=int)]
+    for start in range(0, n_iter, iter_chunk):
+        m = history_m.isel(iter=slice(start, start + iter_chunk)).values
+        diff = m - target_m[start:start + iter_chunk, None]
+        if per_component:
+            # (iter, n, k) -> (iter, k, n)
+            distance = np.linalg.norm(diff, axis=-1).transpose(0, 2, 1)
+        else:
+            distance = np.linalg.norm(diff.reshape(diff.shape[:2] + (-1,)), axis=-1)
+        times.append(sample_index[first_passage_index(distance, thresholds)])
+    times = np.concatenate(times, axis=0)
+
+    dims = ["iter", "k", "threshold"] if per_component else ["iter", "threshold"]
+    coords = {"iter": history_m["iter"].values, "threshold": thresholds}
+    if per_component:
+        coords["k"] = history_m["k"].values
+    return xr.DataArray(times, dims=dims, coords=coords)
@@ -0,0 +1,97 @@
+import os
+import numpy as np
+
+PREVIEW_FILE = "preview.npz"
+PREVIEW_POINTS = 2000
+
+
+def stratified_subsample_index(labels, n_points, rng):
+    '''
+    Indices of a subsample of n_points samples, stratified by label.
+
+    Every label keeps a share of the subsample proportional to its count (largest remainder rounding),
+    so the cluster proportions of the scatter plots are preserved. The indices are sorted, which keeps
+    the order in which the samples were learned.
+
+    Parameters
+    ----------
+    labels : 1D numpy array of int
+        The label of each sample, e.g. the argmax of Z.
+    n_points : int
+        The size of the subsample, at most len(labels).
+    rng : np.random.Generator
+
+    Returns
+    ----------
+    index : 1D numpy array (n_points, )
+    '''
+    N = len(labels)
+    if n_points >= N:
+        return np.arange(N)
+    strata, counts = np.unique(labels, return_counts=True)
+    quota = counts * n_points / N
+    n_keep = np.floor(quota).astype(int)
+    # give the remaining points to the strata with the largest remainders
+    n_keep[np.argsort(n_keep - quota)[:n_points - n_keep.sum()]] += 1
+    index = np.concatenate([
+        rng.choice(np.flatnonzero(labels == stratum), size=n, replace=False)
+        for stratum, n in zip(strata, n_keep)
+    ])
+    return np.sort(index)
+
+
+def make_preview(X, Z=None, n_points=PREVIEW_POINTS, seed=0):
+    '''
+    Stratified subsample of every generation of data.npy, used by the plots instead of the full data.
+
+    Parameters
+    ----------
+    X : numpy array (iter, N, D)
+        The generated data of every generation.
+    Z : numpy array (iter, N, K)
+        The latent assignments, the strata are their argmax. If None, the samples are drawn uniformly.
+    n_points : int
+        The number of points kept per generation.
+    seed : int
+        Seed of the subsampling.
+
+    Returns
+    ----------
+    preview : dict
+        index (iter, M) the kept samples, X (iter, M, D) and z (iter, M) their data and labels,
+        with M = min(n_points, N).
+    '''
+    X = np.asarray(X)
+    labels = np.zeros(X.shape[:2], dtype=int) if Z is None else np.argmax(Z, axis=-1)
+    rng = np.random.default_rng(seed)
+    index = np.stack([stratified_subsample_index(labels[i], n_points, rng) for i in range(len(X))])
+    return {
+        "index": index,
+        "X": np.take_along_axis(X, index[..., None], axis=1),
+        "z": np.take_along_axis(labels, index, axis=1),
+    }
+
+
+def save_preview(folder_path, X, Z=None, n_points=PREVIEW_POINTS, seed=0):
+    '''
+    Make the preview of a run (see make_preview), write it to the run folder and return it.
+    '''
+    preview = make_preview(X, Z, n_points, seed)
+    np.savez(os.path.join(folder_path, PREVIEW_FILE), n_points=n_points, **preview)
+    return preview
+
+
+def load_preview(folder_path, n_points=PREVIEW_POINTS):
+    '''
+    Load the preview of a run folder, building it from data.npy (and Z.npy) first if it is missing,
+    older than data.npy or made with another number of points.
+    '''
+    path = os.path.join(folder_path, PREVIEW_FILE)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(os.path.join(folder_path, "data.npy")):
+        with np.load(path) as preview:
+            if int(preview["n_points"]) == n_points:
+                return {name: preview[name] for name in ("index", "X", "z")}
+    X = np.load(os.path.join(folder_path, "data.npy"))
+    Z_path = os.path.join(folder_path, "Z.npy")
+    Z = np.load(Z_path) if os.path.exists(Z_path) else None
+    return save_preview(folder_path, X, Z, n_points)